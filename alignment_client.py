@@ -0,0 +1,192 @@
+import argparse
+import http.client
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from alignment_service import HOST, PORT, latency_summary
+from response_corpus import parse_response
+
+BOX_PATH_PREFIX = 'response/thanh_giao_yeu_ly_image_'
+TEXT_PATH_PREFIX = 'processed_text/page_'
+
+
+class AlignmentClient:
+    """
+    Client of alignment_service, over one keep-alive connection.
+
+    Not thread-safe; use one client per thread.
+    """
+
+    def __init__(self, url=f"http://{HOST}:{PORT}", timeout=60):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+
+    def _request(self, method, path, payload=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else None
+        headers = {"Content-Type": "application/json; charset=utf-8"} if body is not None else {}
+        try:
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            # The server may have dropped the idle connection; retry once
+            self.connection.close()
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def align_page(self, page):
+        """Rows of a page the service reads itself."""
+        return self._request("POST", "/align", {"page": page})[1]
+
+    def align(self, boxes, sentences, page=0):
+        """Rows of boxes ([points, [text, confidence]]) and sentences."""
+        return self._request("POST", "/align", {"boxes": boxes, "sentences": sentences, "page": page})[1]
+
+    def stats(self):
+        return self._request("GET", "/stats")[1]
+
+    def close(self):
+        self.connection.close()
+
+
+def read_page_payload(page, box_path_prefix=BOX_PATH_PREFIX, text_path_prefix=TEXT_PATH_PREFIX):
+    """
+    Boxes and sentences of a page, as a {"boxes", "sentences"} request.
+
+    Missing or invalid files give empty lists, like char_align.
+    """
+    boxes, sentences = [], []
+    try:
+        with open(f"{box_path_prefix}{page}.txt", 'r', encoding='utf-8') as file:
+            _, items = parse_response(file.read())
+        boxes = [[item["points"], [item["text"], item["confidence"]]] for item in items]
+    except (OSError, ValueError, UnicodeDecodeError):
+        pass
+    try:
+        with open(f"{text_path_prefix}{page + 1}.txt", 'r', encoding='utf-8') as file:
+            sentences = json.load(file)
+    except (OSError, ValueError, UnicodeDecodeError):
+        pass
+    return {"boxes": boxes, "sentences": sentences, "page": page}
+
+
+def run_load(url, pages, requests, concurrency, mode="page", box_path_prefix=BOX_PATH_PREFIX, text_path_prefix=TEXT_PATH_PREFIX):
+    """
+    Send requests for pages from concurrency threads and time them.
+
+    Args:
+        url (str): Service URL.
+        pages (list of int): Box page numbers, used round-robin.
+        requests (int): Total number of requests.
+        concurrency (int): Client threads, each with its own connection.
+        mode (str): "page" to let the service read the page, "boxes" to send
+                    the boxes and sentences read here.
+
+    Returns:
+        dict: Client latencies, throughput, errors and the service stats.
+    """
+    payloads = {}
+    if mode == "boxes":
+        payloads = {page: read_page_payload(page, box_path_prefix, text_path_prefix) for page in pages}
+    latencies, errors = [], []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        client = AlignmentClient(url)
+        try:
+            while True:
+                with lock:
+                    k = next(counter, None)
+                if k is None:
+                    return
+                page = pages[k % len(pages)]
+                started = time.perf_counter()
+                if mode == "boxes":
+                    payload = payloads[page]
+                    result = client.align(payload["boxes"], payload["sentences"], page)
+                else:
+                    result = client.align_page(page)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if "error" in result:
+                        errors.append((page, result["error"]))
+        finally:
+            client.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    client = AlignmentClient(url)
+    try:
+        service_stats = client.stats()
+    finally:
+        client.close()
+    return {
+        "requests": len(latencies),
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "latency": latency_summary(latencies),
+        "errors": errors,
+        "service": service_stats,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query or load-test the alignment service.")
+    parser.add_argument("--url", default=f"http://{HOST}:{PORT}")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    page_parser = subparsers.add_parser("page", help="align one page and print its rows as JSON lines")
+    page_parser.add_argument("page", type=int)
+
+    subparsers.add_parser("stats", help="print the service stats")
+
+    load_parser = subparsers.add_parser("load", help="generate load from the response/ and processed_text/ pages")
+    load_parser.add_argument("--start", type=int, default=3)
+    load_parser.add_argument("--end", type=int, default=241)
+    load_parser.add_argument("--step", type=int, default=2)
+    load_parser.add_argument("--requests", type=int, default=500)
+    load_parser.add_argument("--concurrency", type=int, default=8)
+    load_parser.add_argument("--mode", choices=["page", "boxes"], default="page")
+    load_parser.add_argument("--box-prefix", default=BOX_PATH_PREFIX)
+    load_parser.add_argument("--text-prefix", default=TEXT_PATH_PREFIX)
+    args = parser.parse_args(argv)
+
+    if args.command == "page":
+        client = AlignmentClient(args.url)
+        result = client.align_page(args.page)
+        client.close()
+        if "error" in result:
+            raise SystemExit(result["error"])
+        for row in result["rows"]:
+            print(json.dumps(row, ensure_ascii=False))
+    elif args.command == "stats":
+        client = AlignmentClient(args.url)
+        print(json.dumps(client.stats(), indent=2))
+        client.close()
+    else:
+        pages = [page for page in range(args.start, args.end + 1, args.step) if os.path.exists(f"{args.box_prefix}{page}.txt")]
+        report = run_load(args.url, pages, args.requests, args.concurrency, args.mode, args.box_prefix, args.text_prefix)
+        latency = report["latency"]
+        print(f"{report['requests']} requests in {report['seconds']:.2f}s ({report['requests_per_second']:.1f}/s), {len(report['errors'])} errors")
+        if latency["count"]:
+            print(f"client latency ms: p50 {latency['p50_ms']:.1f}, p90 {latency['p90_ms']:.1f}, p99 {latency['p99_ms']:.1f}, max {latency['max_ms']:.1f}")
+        service = report["service"]
+        print(f"service: {service['counters']['batches']} batches, mean batch size {service['counters']['mean_batch_size']:.2f}, "
+              f"{service['counters']['tasks']} worker tasks")
+        if service["latency"]["count"]:
+            print(f"service latency ms: p50 {service['latency']['p50_ms']:.1f}, p90 {service['latency']['p90_ms']:.1f}, p99 {service['latency']['p99_ms']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
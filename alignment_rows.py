@@ -0,0 +1,128 @@
+import numpy as np
+
+from box_geometry import coordinate_array
+
+# Character statuses, stored and passed around as their index in STATUSES
+STATUSES = ("match", "partial match", "not match")
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+MATCH, PARTIAL_MATCH, NOT_MATCH = range(len(STATUSES))
+
+# Placeholder of the Quốc Ngữ words no character was aligned with
+GAP = '-'
+
+
+class Alignment:
+    """
+    The aligned characters of one column and the status code of each.
+
+    chars holds one character per position, GAP where a Quốc Ngữ word was
+    skipped; statuses is a uint8 array of codes into STATUSES. Iterating
+    gives the (char, status name) pairs the alignment used to be a list of.
+    """
+
+    __slots__ = ("chars", "statuses")
+
+    def __init__(self, chars, statuses):
+        self.chars = chars
+        self.statuses = statuses
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """An Alignment from (char, status name) pairs."""
+        return cls("".join(char for char, _ in pairs), np.array([STATUS_CODES[status] for _, status in pairs], dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.chars)
+
+    def __iter__(self):
+        return zip(self.chars, (STATUSES[code] for code in self.statuses.tolist()))
+
+    def __eq__(self, other):
+        if not isinstance(other, Alignment):
+            return NotImplemented
+        return self.chars == other.chars and np.array_equal(self.statuses, other.statuses)
+
+    def __repr__(self):
+        return f"Alignment({self.chars!r}, {self.statuses.tolist()!r})"
+
+    def status_names(self):
+        return [STATUSES[code] for code in self.statuses.tolist()]
+
+    def runs(self):
+        """
+        Run-length encoding: consecutive characters of the same status.
+
+        Returns:
+            list of tuple: (status code, characters) of every run, in order.
+        """
+        if not len(self.chars):
+            return []
+        starts = np.flatnonzero(np.diff(self.statuses)) + 1
+        bounds = [0] + starts.tolist() + [len(self.chars)]
+        codes = self.statuses[bounds[:-1]].tolist()
+        return [(code, self.chars[start:end]) for code, start, end in zip(codes, bounds, bounds[1:])]
+
+    def counts(self):
+        """Number of characters of every status, indexed like STATUSES."""
+        return np.bincount(self.statuses, minlength=len(STATUSES)).tolist()
+
+
+class AlignmentRow:
+    """
+    One column of a page as char_align writes it.
+
+    Attributes:
+        id (str): ppp{page}_ss{position}, position counted from 1.
+        page (int): Page number of the box file.
+        boxes (numpy.ndarray): (k, 4, 2) corner points of the boxes the
+                               column was aligned from, None if it had
+                               no valid box.
+        sino_nom (str): OCR characters of those boxes, None without boxes.
+        aligned (Alignment): Empty when nothing was aligned.
+        sentence (str): Quốc Ngữ sentence, None if the column had none.
+        path (str): align_columns path, None if nothing was aligned.
+    """
+
+    __slots__ = ("id", "page", "boxes", "sino_nom", "aligned", "sentence", "path")
+
+    def __init__(self, id, page, boxes, sino_nom, aligned, sentence, path=None):
+        self.id = id
+        self.page = page
+        self.boxes = boxes
+        self.sino_nom = sino_nom
+        self.aligned = aligned
+        self.sentence = sentence
+        self.path = path
+
+    def box_points(self):
+        """The box points as nested lists, None without boxes."""
+        return None if self.boxes is None else self.boxes.tolist()
+
+    def to_dict(self):
+        """The row as a JSON-ready record, with aligned as (char, status) pairs."""
+        return {
+            "id": self.id,
+            "page": self.page,
+            "boxes": self.box_points(),
+            "sino_nom": self.sino_nom,
+            "aligned": list(self.aligned),
+            "sentence": self.sentence,
+            "path": self.path,
+        }
+
+    @classmethod
+    def from_dict(cls, record):
+        """The inverse of to_dict."""
+        boxes = record.get("boxes")
+        return cls(record["id"], record.get("page"), None if boxes is None else coordinate_array(boxes), record.get("sino_nom"),
+                   Alignment.from_pairs(record.get("aligned") or []), record.get("sentence"), record.get("path"))
+
+
+_EMPTY_STATUSES = np.zeros(0, dtype=np.uint8)
+_EMPTY_STATUSES.flags.writeable = False
+_EMPTY = Alignment("", _EMPTY_STATUSES)
+
+
+def empty_alignment():
+    """The Alignment of a column that was not aligned, shared by all of them."""
+    return _EMPTY
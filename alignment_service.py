@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+# Requests arriving within MAX_WAIT seconds of each other are handed to the
+# pool together, up to MAX_BATCH of them
+MAX_BATCH = 16
+MAX_WAIT = 0.005
+
+# Latencies kept for the percentiles
+LATENCY_WINDOW = 10000
+
+
+def latency_summary(latencies):
+    """Count, mean and percentiles of a list of latencies, in milliseconds."""
+    if not latencies:
+        return {"count": 0}
+    values = np.asarray(latencies) * 1000
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {
+        "count": len(values),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(p50),
+        "p90_ms": float(p90),
+        "p99_ms": float(p99),
+        "max_ms": float(values.max()),
+    }
+
+
+def _warm_worker():
+    """Load the dictionaries and the similarity index in a worker."""
+    import char_align
+    return len(char_align.dictionary.chars)
+
+
+def _align_request(request, settings):
+    import char_align
+
+    if "boxes" in request:
+        page = int(request.get("page", 0))
+        return char_align.align_boxes(request["boxes"], request.get("sentences") or [], page)
+    page = int(request["page"])
+    box_path_prefix = settings["box_path_prefix"] or char_align.BOX_PATH_PREFIX
+    text_path_prefix = settings["text_path_prefix"] or char_align.TEXT_PATH_PREFIX
+    pair = char_align.page_pairs([page], box_path_prefix, text_path_prefix, settings["corpus_path"], settings["sentences_path"])[0]
+    return char_align.process_single_box_text(*pair)
+
+
+def _align_batch(requests, settings):
+    """Align a chunk of a batch, one request after the other, in one worker; errors are per request."""
+    results = []
+    for request in requests:
+        try:
+            results.append({"rows": [row.to_dict() for row in _align_request(request, settings)]})
+        except (KeyError, TypeError, ValueError, IndexError) as e:
+            results.append({"error": f"{type(e).__name__}: {e}"})
+    return results
+
+
+class AlignmentService:
+    """
+    Micro-batching front of a warm worker pool.
+
+    Every worker loads the dictionaries once, at start-up, and then serves
+    requests. Requests are queued by the HTTP threads; a batcher thread
+    groups whatever arrives within max_wait of the first request (up to
+    max_batch) and splits the batch into one chunk per worker. Requests
+    are still aligned one by one; what batching buys is fewer pool tasks,
+    and so fewer pickling round trips, when more requests than workers
+    arrive together, while every worker gets a share of the batch.
+
+    A request is either {"page": i}, read from the configured response and
+    sentence sources, or {"boxes": [...], "sentences": [...], "page": i}
+    with the page supplied. The result is {"rows": [...]} with the rows
+    character_align returns, as AlignmentRow.to_dict records, or
+    {"error": message}.
+    """
+
+    def __init__(self, workers=None, max_batch=MAX_BATCH, max_wait=MAX_WAIT, box_path_prefix=None, text_path_prefix=None, corpus_path=None, sentences_path=None):
+        # The dictionaries only live in the workers; None picks the
+        # char_align default there
+        self.settings = {
+            "box_path_prefix": box_path_prefix,
+            "text_path_prefix": text_path_prefix,
+            "corpus_path": corpus_path,
+            "sentences_path": sentences_path,
+        }
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+        # Start every worker now so the first requests do not pay for it
+        wait([self.executor.submit(_warm_worker) for _ in range(self.workers)])
+
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {"requests": 0, "errors": 0, "batches": 0, "batched_requests": 0, "tasks": 0}
+        self.started = time.time()
+        self.batcher = threading.Thread(target=self._batch_loop, name="batcher", daemon=True)
+        self.batcher.start()
+
+    def submit(self, request):
+        """Queue a request. Returns a Future of its result."""
+        future = Future()
+        self.queue.put((request, future, time.perf_counter()))
+        return future
+
+    def align(self, request, timeout=None):
+        return self.submit(request).result(timeout)
+
+    def _batch_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    # Serve what is already batched, then stop
+                    self.queue.put(None)
+                    break
+                batch.append(item)
+
+            # Spread the batch over the pool; one task per worker at most
+            chunk_size = -(-len(batch) // self.workers)
+            chunks = [batch[start:start + chunk_size] for start in range(0, len(batch), chunk_size)]
+            for chunk in chunks:
+                task = self.executor.submit(_align_batch, [request for request, _, _ in chunk], self.settings)
+                task.add_done_callback(lambda task, chunk=chunk: self._deliver(task, chunk))
+            with self.lock:
+                self.counters["batches"] += 1
+                self.counters["batched_requests"] += len(batch)
+                self.counters["tasks"] += len(chunks)
+
+    def _deliver(self, task, chunk):
+        try:
+            results = task.result()
+        except Exception as e:
+            results = [{"error": f"{type(e).__name__}: {e}"}] * len(chunk)
+        finished = time.perf_counter()
+        with self.lock:
+            for (_, _, queued), result in zip(chunk, results):
+                self.latencies.append(finished - queued)
+                self.counters["requests"] += 1
+                self.counters["errors"] += "error" in result
+        for (_, future, _), result in zip(chunk, results):
+            future.set_result(result)
+
+    def stats(self):
+        with self.lock:
+            latencies = list(self.latencies)
+            counters = dict(self.counters)
+        counters["mean_batch_size"] = counters["batched_requests"] / counters["batches"] if counters["batches"] else 0.0
+        return {
+            "workers": self.workers,
+            "uptime_s": time.time() - self.started,
+            "counters": counters,
+            "latency": latency_summary(latencies),
+        }
+
+    def close(self):
+        self.queue.put(None)
+        self.batcher.join()
+        self.executor.shutdown()
+
+
+class AlignmentRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /align   one request, see AlignmentService
+    GET  /stats   counters and latency percentiles
+    GET  /health  liveness
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this every
+    # keep-alive response waits for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.service.stats())
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/align":
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+            if not isinstance(request, dict) or ("page" not in request and "boxes" not in request):
+                raise ValueError("expected {\"page\": ...} or {\"boxes\": ..., \"sentences\": ...}")
+        except (ValueError, UnicodeDecodeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        result = self.server.service.align(request)
+        self._send_json(400 if "error" in result else 200, result)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(service, host=HOST, port=PORT, verbose=False):
+    """Serve a service over HTTP until interrupted."""
+    server = ThreadingHTTPServer((host, port), AlignmentRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    print(f"Alignment service on http://{host}:{server.server_port} with {service.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve character alignment over HTTP with warm dictionaries.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT * 1000)
+    parser.add_argument("--box-prefix", default=None)
+    parser.add_argument("--text-prefix", default=None)
+    parser.add_argument("--corpus", default=None, help="compiled response corpus (see response_corpus.py)")
+    parser.add_argument("--sentences", default=None, help="compiled phiên âm sentences (see phien_am_corpus.py)")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    service = AlignmentService(args.workers, args.max_batch, args.max_wait_ms / 1000, args.box_prefix, args.text_prefix, args.corpus, args.sentences)
+    serve(service, args.host, args.port, args.verbose)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+
+import numpy as np
+
+import instrumentation
+from alignment_rows import GAP, STATUS_CODES, STATUSES, Alignment, AlignmentRow
+from box_geometry import coordinate_array
+from dictionary_cache import CACHE_PATH, keep_snapshot
+from similarity_index import clean_word
+
+STORE_PATH = "alignment.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page INTEGER PRIMARY KEY,
+    columns INTEGER NOT NULL,
+    chars INTEGER NOT NULL,
+    matches INTEGER NOT NULL,
+    partial_matches INTEGER NOT NULL,
+    not_matches INTEGER NOT NULL,
+    gaps INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS columns (
+    id TEXT PRIMARY KEY,
+    page INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    sino_nom TEXT,
+    sentence TEXT,
+    path TEXT
+);
+CREATE INDEX IF NOT EXISTS columns_page ON columns (page, position);
+CREATE TABLE IF NOT EXISTS boxes (
+    column_id TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    points TEXT NOT NULL,
+    x_min REAL NOT NULL,
+    y_min REAL NOT NULL,
+    x_max REAL NOT NULL,
+    y_max REAL NOT NULL,
+    PRIMARY KEY (column_id, position)
+);
+CREATE INDEX IF NOT EXISTS boxes_page ON boxes (page);
+CREATE TABLE IF NOT EXISTS chars (
+    column_id TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    char TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    PRIMARY KEY (column_id, position)
+);
+CREATE INDEX IF NOT EXISTS chars_char ON chars (char, status);
+CREATE INDEX IF NOT EXISTS chars_page ON chars (page);
+CREATE TABLE IF NOT EXISTS column_chars (
+    char TEXT NOT NULL,
+    column_id TEXT NOT NULL,
+    page INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS column_chars_char ON column_chars (char, column_id);
+CREATE INDEX IF NOT EXISTS column_chars_page ON column_chars (page);
+CREATE TABLE IF NOT EXISTS column_readings (
+    reading TEXT NOT NULL,
+    column_id TEXT NOT NULL,
+    page INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS column_readings_reading ON column_readings (reading, column_id);
+CREATE INDEX IF NOT EXISTS column_readings_page ON column_readings (page);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value BLOB
+);
+"""
+
+# Tables holding rows of a page, emptied when the page is replaced
+PAGE_TABLES = ("chars", "boxes", "columns", "column_chars", "column_readings", "pages")
+
+
+class AlignmentStore:
+    """
+    Alignment rows in an indexed SQLite database.
+
+    A page is the unit of update: write_page replaces everything stored for
+    the pages of its rows in one transaction, so re-aligning a few pages
+    leaves the rest of the book untouched. The pages table keeps per-page
+    status counts, so page-level questions never scan the characters.
+    Gap cells (GAP, a skipped Quốc Ngữ word) are stored and counted as
+    "not match" characters like the rows hold them; gaps counts them
+    apart.
+
+    The dependency tables list, for every aligned column, the distinct OCR
+    characters and cleaned syllables its costs were looked up with. A
+    dictionary change to the pair (char, reading) can only change the
+    columns found under both; see incremental_align.
+
+    Tables:
+        pages            page, columns, chars, matches, partial_matches,
+                         not_matches, gaps
+        columns          id (ppp{i}_ss{index}), page, position, sino_nom,
+                         sentence, path
+        boxes            column_id, page, position, points (JSON), bounding
+                         box
+        chars            column_id, page, position, char, status (see
+                         STATUSES)
+        column_chars     char, column_id, page
+        column_readings  reading, column_id, page
+        meta             key, value; "dictionary" holds the JSON
+                         fingerprint of the compiled dictionary the store
+                         was aligned with, see record_dictionary
+    """
+
+    def __init__(self, path=STORE_PATH, check_same_thread=True):
+        # Without check_same_thread the caller serializes access
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=check_same_thread)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        if "gaps" not in [name for _, name, *_ in self.connection.execute("PRAGMA table_info(pages)")]:
+            # Stores written before gaps were counted
+            with self.connection:
+                self.connection.execute("ALTER TABLE pages ADD COLUMN gaps INTEGER NOT NULL DEFAULT 0")
+                self.connection.execute("UPDATE pages SET gaps = (SELECT COUNT(*) FROM chars WHERE chars.page = pages.page AND char = ?)", (GAP,))
+
+    def write_page(self, rows, page=None):
+        """
+        Insert or replace the pages of rows (as character_align returns them).
+
+        Args:
+            rows (list of AlignmentRow): Rows of one or more pages.
+            page (int): Page the rows belong to, so that a page without rows
+                        is recorded too.
+        """
+        pages = {} if page is None else {page: []}
+        for row in rows:
+            pages.setdefault(row.page, []).append(row)
+        with instrumentation.span("store_write", "output", page=page), self.connection:
+            for page, page_rows in pages.items():
+                self._replace_page(page, page_rows)
+
+    def _replace_page(self, page, rows):
+        for table in PAGE_TABLES:
+            self.connection.execute(f"DELETE FROM {table} WHERE page = ?", (page,))
+
+        columns, boxes, chars, column_chars, column_readings = [], [], [], [], []
+        counts = [0] * len(STATUSES)
+        for position, row in enumerate(rows):
+            columns.append((row.id, page, position, row.sino_nom, row.sentence, row.path))
+            if row.boxes is not None:
+                low, high = row.boxes.min(axis=1).tolist(), row.boxes.max(axis=1).tolist()
+                for box_position, points in enumerate(row.boxes.tolist()):
+                    boxes.append((row.id, page, box_position, json.dumps(points), *low[box_position], *high[box_position]))
+            counts = [total + count for total, count in zip(counts, row.aligned.counts())]
+            chars.extend((row.id, page, char_position, char, code)
+                         for char_position, (char, code) in enumerate(zip(row.aligned.chars, row.aligned.statuses.tolist())))
+            # Only columns that were aligned depend on the dictionaries
+            if row.sino_nom and row.sentence:
+                column_chars.extend((char, row.id, page) for char in set(row.sino_nom))
+                column_readings.extend((reading, row.id, page) for reading in {clean_word(word) for word in row.sentence.split()})
+
+        gaps = sum(row.aligned.chars.count(GAP) for row in rows)
+        self.connection.execute("INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)", (page, len(rows), len(chars), *counts, gaps))
+        self.connection.executemany("INSERT INTO columns VALUES (?, ?, ?, ?, ?, ?)", columns)
+        self.connection.executemany("INSERT INTO boxes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", boxes)
+        self.connection.executemany("INSERT INTO chars VALUES (?, ?, ?, ?, ?)", chars)
+        self.connection.executemany("INSERT INTO column_chars VALUES (?, ?, ?)", column_chars)
+        self.connection.executemany("INSERT INTO column_readings VALUES (?, ?, ?)", column_readings)
+
+    def affected_columns(self, pairs):
+        """
+        Aligned columns containing both the character and the reading of
+        any of pairs.
+
+        Args:
+            pairs (iterable of (str, str)): (character, cleaned reading).
+
+        Returns:
+            list of tuple: (column id, page, sino_nom, sentence).
+        """
+        with self.connection:
+            self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS changed_pairs (char TEXT NOT NULL, reading TEXT NOT NULL)")
+            self.connection.execute("DELETE FROM changed_pairs")
+            self.connection.executemany("INSERT INTO changed_pairs VALUES (?, ?)", pairs)
+        return list(self.connection.execute("""
+            SELECT id, page, sino_nom, sentence FROM columns WHERE id IN (
+                SELECT column_chars.column_id FROM changed_pairs
+                JOIN column_chars ON column_chars.char = changed_pairs.char
+                JOIN column_readings ON column_readings.reading = changed_pairs.reading
+                                    AND column_readings.column_id = column_chars.column_id)
+            ORDER BY page, position"""))
+
+    def aligned_columns(self):
+        """Every aligned column as (column id, page, sino_nom, sentence)."""
+        return list(self.connection.execute(
+            "SELECT id, page, sino_nom, sentence FROM columns WHERE sino_nom != '' AND sentence != '' ORDER BY page, position"))
+
+    def patch_columns(self, results):
+        """
+        Replace the alignment of single columns and refresh their page counts.
+
+        Args:
+            results (list of tuple): (column id, Alignment, path).
+        """
+        with self.connection:
+            pages = set()
+            for column_id, aligned, path in results:
+                page, = self.connection.execute("SELECT page FROM columns WHERE id = ?", (column_id,)).fetchone()
+                pages.add(page)
+                self.connection.execute("DELETE FROM chars WHERE column_id = ?", (column_id,))
+                self.connection.executemany("INSERT INTO chars VALUES (?, ?, ?, ?, ?)", [
+                    (column_id, page, position, char, code) for position, (char, code) in enumerate(zip(aligned.chars, aligned.statuses.tolist()))])
+                self.connection.execute("UPDATE columns SET path = ? WHERE id = ?", (path, column_id))
+            for page in pages:
+                counts = dict(self.connection.execute("SELECT status, COUNT(*) FROM chars WHERE page = ? GROUP BY status", (page,)))
+                gaps, = self.connection.execute("SELECT COUNT(*) FROM chars WHERE page = ? AND char = ?", (page, GAP)).fetchone()
+                self.connection.execute(
+                    "UPDATE pages SET chars = ?, matches = ?, partial_matches = ?, not_matches = ?, gaps = ? WHERE page = ?",
+                    (sum(counts.values()), *(counts.get(code, 0) for code in range(len(STATUSES))), gaps, page))
+
+    def get_meta(self, key):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def record_dictionary(self, cache_path=CACHE_PATH, replace=False):
+        """
+        Record the compiled dictionary the rows were aligned with.
+
+        The store only keeps its fingerprint; the dictionary itself is kept
+        once per version by dictionary_cache.keep_snapshot. Without
+        replace, an existing record is kept: pages re-aligned with a newer
+        dictionary stay correct when incremental_align later replays the
+        change from the older one.
+        """
+        if not os.path.exists(cache_path) or (not replace and self.get_meta("dictionary") is not None):
+            return
+        self.set_meta("dictionary", json.dumps(keep_snapshot(cache_path, cache_path), ensure_ascii=False))
+
+    def dictionary_fingerprint(self, cache_path=CACHE_PATH):
+        """
+        The fingerprint record_dictionary recorded, None if there is none.
+
+        Stores that still hold a copy of the whole compiled dictionary get
+        it moved to the snapshot directory of cache_path.
+
+        Returns:
+            dict: {"sources": source fingerprints, "snapshot": key of the
+                  snapshot, see dictionary_cache.snapshot_path}.
+        """
+        value = self.get_meta("dictionary")
+        if isinstance(value, bytes):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "dictionary.bin")
+                with open(path, 'wb') as file:
+                    file.write(value)
+                fingerprint = keep_snapshot(path, cache_path)
+            self.set_meta("dictionary", json.dumps(fingerprint, ensure_ascii=False))
+            return fingerprint
+        return None if value is None else json.loads(value)
+
+    def pages(self):
+        return [page for page, in self.connection.execute("SELECT page FROM pages ORDER BY page")]
+
+    def rows(self, page):
+        """Rows of a page, as character_align returned them."""
+        boxes, chars, statuses = {}, {}, {}
+        for column_id, points in self.connection.execute(
+                "SELECT column_id, points FROM boxes WHERE page = ? ORDER BY column_id, position", (page,)):
+            boxes.setdefault(column_id, []).append(json.loads(points))
+        for column_id, char, status in self.connection.execute(
+                "SELECT column_id, char, status FROM chars WHERE page = ? ORDER BY column_id, position", (page,)):
+            chars.setdefault(column_id, []).append(char)
+            statuses.setdefault(column_id, []).append(status)
+        return [
+            AlignmentRow(
+                column_id,
+                page,
+                coordinate_array(boxes[column_id]) if column_id in boxes else None,
+                sino_nom,
+                Alignment("".join(chars.get(column_id, [])), np.array(statuses.get(column_id, []), dtype=np.uint8)),
+                sentence,
+                path,
+            )
+            for column_id, sino_nom, sentence, path in self.connection.execute(
+                "SELECT id, sino_nom, sentence, path FROM columns WHERE page = ? ORDER BY position", (page,))
+        ]
+
+    def char_occurrences(self, char, status=None):
+        """(column id, page, position, status) of every aligned occurrence of char."""
+        query = "SELECT column_id, page, position, status FROM chars WHERE char = ?"
+        parameters = (char,)
+        if status is not None:
+            query += " AND status = ?"
+            parameters += (STATUS_CODES[status],)
+        return [(column_id, page, position, STATUSES[code])
+                for column_id, page, position, code in self.connection.execute(query + " ORDER BY page, column_id, position", parameters)]
+
+    def pages_above(self, status, min_ratio):
+        """
+        (page, ratio) of the pages where more than min_ratio of the OCR
+        characters have status. Gap cells count neither way.
+        """
+        count = ("matches", "partial_matches", "not_matches - gaps")[STATUS_CODES[status]]
+        return list(self.connection.execute(
+            f"SELECT page, CAST({count} AS REAL) / (chars - gaps) FROM pages WHERE chars > gaps AND {count} > ? * (chars - gaps) ORDER BY page",
+            (min_ratio,)))
+
+    def status_counts(self):
+        """Characters per status over the whole store."""
+        totals = self.connection.execute("SELECT SUM(matches), SUM(partial_matches), SUM(not_matches) FROM pages").fetchone()
+        return {status: total or 0 for status, total in zip(STATUSES, totals)}
+
+    def close(self):
+        self.connection.close()
+
+
+def export_xlsx(store_path, xlsx_path, pages=None):
+    """
+    Write the stored rows to an xlsx workbook, as char_align would.
+
+    Args:
+        store_path (str): SQLite store.
+        xlsx_path (str): Workbook to write.
+        pages (list of int): Pages to export, in order; None for all.
+
+    Returns:
+        int: Number of rows written.
+    """
+    from output_sinks import XlsxSink
+
+    store = AlignmentStore(store_path)
+    sink = XlsxSink(xlsx_path)
+    row_count = 0
+    try:
+        for page in store.pages() if pages is None else pages:
+            rows = store.rows(page)
+            sink.write_page(rows)
+            row_count += len(rows)
+    finally:
+        sink.close()
+        store.close()
+    return row_count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query or export the SQLite alignment store.")
+    parser.add_argument("--store", default=STORE_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="write the stored rows to an xlsx workbook")
+    export_parser.add_argument("output", nargs="?", default="output.xlsx")
+
+    char_parser = subparsers.add_parser("char", help="list the aligned occurrences of a character")
+    char_parser.add_argument("char")
+    char_parser.add_argument("--status", choices=STATUSES, default=None)
+
+    pages_parser = subparsers.add_parser("pages", help="list the pages with a high share of one status")
+    pages_parser.add_argument("--status", choices=STATUSES, default="not match")
+    pages_parser.add_argument("--min-ratio", type=float, default=0.3)
+
+    subparsers.add_parser("summary", help="print the character counts per status")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        print(f"{export_xlsx(args.store, args.output)} rows written to {args.output}")
+    else:
+        store = AlignmentStore(args.store)
+        if args.command == "char":
+            for column_id, page, position, status in store.char_occurrences(args.char, args.status):
+                print(f"{column_id}\t{position}\t{status}")
+        elif args.command == "pages":
+            for page, ratio in store.pages_above(args.status, args.min_ratio):
+                print(f"{page}\t{ratio:.3f}")
+        else:
+            for status, total in store.status_counts().items():
+                print(f"{status}\t{total}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import json
+import os
+
+import numpy as np
+
+# File layout: MAGIC, little-endian uint64 header length, JSON header, then
+# every array at an ALIGNMENT-byte boundary so it can be viewed in place
+MAGIC = b'NOMARR01'
+ALIGNMENT = 64
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_array_file(path, arrays, meta=None):
+    """
+    Write named NumPy arrays and a JSON-serializable meta dict to one file.
+
+    The file is written next to its destination and moved into place, so
+    readers never observe a partially written file.
+
+    Args:
+        path (str): Destination file.
+        arrays (dict of str -> numpy.ndarray): Arrays to store.
+        meta (dict): Extra information stored in the header.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    # The header size depends on the offsets, which depend on the header size
+    header_size = 0
+    while True:
+        offset = _aligned(len(MAGIC) + 8 + header_size)
+        layout = {}
+        for name, array in arrays.items():
+            layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset = _aligned(offset + array.nbytes)
+        header = json.dumps({'meta': meta or {}, 'arrays': layout}, ensure_ascii=False).encode('utf-8')
+        if len(header) <= header_size:
+            break
+        header_size = len(header) + 64
+    header = header.ljust(header_size)
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(len(header).to_bytes(8, 'little'))
+        file.write(header)
+        for name, array in arrays.items():
+            file.seek(layout[name]['offset'])
+            file.write(array.tobytes())
+        file.truncate(offset)
+    os.replace(tmp_path, path)
+
+
+def read_array_header(path):
+    """Return the header of an array file without mapping its data."""
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an array file")
+        header_size = int.from_bytes(file.read(8), 'little')
+        return json.loads(file.read(header_size).decode('utf-8'))
+
+
+def read_array_file(path):
+    """
+    Memory-map an array file written by write_array_file.
+
+    Returns:
+        tuple: (meta dict, dict of read-only array views into the mapping).
+    """
+    header = read_array_header(path)
+    buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        start = spec['offset']
+        view = buffer[start:start + count * dtype.itemsize].view(dtype)
+        arrays[name] = view.reshape(spec['shape'])
+    return header['meta'], arrays
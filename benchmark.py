@@ -0,0 +1,417 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from box_geometry import BoxList
+from response_corpus import RESPONSE_DIR, parse_response_file
+
+RESULTS_PATH = "benchmark.json"
+SAMPLE_IMAGES_DIR = "extracted_images"
+
+FORMAT_VERSION = 1
+
+# Column lengths (characters) of the synthetic alignment pairs
+PAIR_LENGTHS = (8, 16, 32, 64, 128, 512)
+
+# Page layout of the synthetic pages, inside the char_align margins
+PAGE_TOP, PAGE_BOTTOM = 100.0, 610.0
+PAGE_LEFT, PAGE_RIGHT = 75.0, 390.0
+COLUMN_WIDTH = 18.0
+
+# A result slower than its baseline by more than this is a regression
+REGRESSION_THRESHOLD = 0.2
+
+# Modules whose cold import is timed. None of them loads cv2, fitz,
+# aiohttp, xlsxwriter or the dictionaries at import
+IMPORT_MODULES = ("cli", "char_align", "image_pre_process", "output_sinks", "alignment_store", "pipeline", "incremental_align")
+
+
+def measure(function, repeat=5, number=1):
+    """
+    Time function() repeat times, number calls each.
+
+    Returns:
+        dict: Best, median and mean seconds per call, and the call count.
+    """
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - started) / number)
+    return {"best_s": min(times), "median_s": statistics.median(times), "mean_s": statistics.fmean(times), "calls": repeat * number}
+
+
+def measure_process(command, repeat=5):
+    """Time command in a fresh process, run from the repository directory."""
+    cwd = os.path.dirname(os.path.abspath(__file__)) or "."
+    return measure(lambda: subprocess.run(command, check=True, cwd=cwd, stdout=subprocess.DEVNULL), repeat)
+
+
+class SyntheticBook:
+    """
+    Deterministic pages of OCR boxes and sentences built from the dictionary.
+
+    Every column is a run of dictionary characters whose sentence is made of
+    their readings, then noised: a share of the readings is replaced by a
+    random reading, dropped, or followed by an extra one, so the alignments
+    see matches, partial matches and indels. The same seed always gives the
+    same book.
+    """
+
+    def __init__(self, similarity_index, seed=0, noise=0.15):
+        self.seed = seed
+        self.random = np.random.default_rng(seed)
+        self.noise = noise
+        dictionary = similarity_index.dictionary
+        n_readings = len(dictionary.readings)
+        chars, readings = np.divmod(np.asarray(similarity_index.pair_keys), n_readings)
+        exact = np.asarray(similarity_index.pair_match) == chars
+        self.chars = [dictionary.chars[k] for k in chars[exact].tolist()]
+        self.readings = [dictionary.readings[k] for k in readings[exact].tolist()]
+        self.all_readings = dictionary.readings
+
+    def stream(self, name):
+        """
+        The same book with its own generator, so the data of one benchmark
+        does not depend on which benchmarks ran before it.
+        """
+        book = object.__new__(SyntheticBook)
+        book.__dict__.update(self.__dict__)
+        book.random = np.random.default_rng([self.seed, *name.encode('utf-8')])
+        return book
+
+    def pair(self, length):
+        """(OCR string, sentence) of a column of length characters."""
+        picks = self.random.integers(0, len(self.chars), size=length)
+        words = []
+        for k in picks.tolist():
+            draw = self.random.random()
+            if draw < self.noise / 3:
+                words.append(self.all_readings[int(self.random.integers(len(self.all_readings)))])
+            elif draw < 2 * self.noise / 3:
+                continue
+            elif draw < self.noise:
+                words.extend((self.readings[k], self.all_readings[int(self.random.integers(len(self.all_readings)))]))
+            else:
+                words.append(self.readings[k])
+        return "".join(self.chars[k] for k in picks.tolist()), " ".join(words)
+
+    def page(self, columns, min_length=6, max_length=24):
+        """
+        Boxes ([points, [text, confidence]]) and sentences of one page.
+
+        Columns run right to left; each is cut into one to three boxes.
+        """
+        boxes, sentences = [], []
+        step = (PAGE_RIGHT - PAGE_LEFT) / max(columns, 1)
+        for column in range(columns):
+            text, sentence = self.pair(int(self.random.integers(min_length, max_length + 1)))
+            sentences.append(sentence)
+            right = PAGE_RIGHT - column * step
+            left = right - min(COLUMN_WIDTH, step * 0.8)
+            cuts = sorted(self.random.choice(np.arange(1, len(text)), size=min(int(self.random.integers(0, 3)), len(text) - 1), replace=False).tolist())
+            char_height = (PAGE_BOTTOM - PAGE_TOP) / max_length
+            for start, end in zip([0] + cuts, cuts + [len(text)]):
+                top, bottom = PAGE_TOP + start * char_height, PAGE_TOP + end * char_height
+                points = [[left, top], [right, top], [right, bottom], [left, bottom]]
+                boxes.append([points, [text[start:end], float(self.random.uniform(0.3, 1.0))]])
+        order = self.random.permutation(len(boxes))
+        return [boxes[k] for k in order.tolist()], sentences
+
+    def pages(self, pages, columns):
+        return [self.page(columns) for _ in range(pages)]
+
+
+def read_response_pages(response_dir=RESPONSE_DIR):
+    """Boxes of every response file, as char_align reads them."""
+    pages = []
+    for name in sorted(os.listdir(response_dir)):
+        if not name.endswith(".txt"):
+            continue
+        try:
+            _, points, confidences, texts = parse_response_file(os.path.join(response_dir, name))
+        except ValueError:
+            continue
+        pages.append(BoxList.from_texts(points, texts, confidences))
+    return pages
+
+
+def bench_dictionary_load(repeat):
+    """Compiled dictionary and similarity index load, from cold imports and in process."""
+    import dictionary_cache
+    import similarity_index
+
+    def load():
+        dictionary_cache._loaded.clear()
+        similarity_index._loaded.clear()
+        similarity_index.load_similarity_index()
+
+    # char_align loads the index on first use, so touch it
+    command = [sys.executable, "-c", "import char_align; char_align.similarity_index"]
+    return {
+        "load_similarity_index": measure(load, repeat),
+        "import_char_align_process": measure_process(command, max(1, repeat // 2)),
+    }
+
+
+def bench_imports(repeat, response_dir=RESPONSE_DIR):
+    """Cold start: importing each IMPORT_MODULES module, and aligning one page through cli.py."""
+    import char_align
+
+    results = {f"import_{module}": measure_process([sys.executable, "-c", f"import {module}"], repeat) for module in IMPORT_MODULES}
+
+    prefix = os.path.basename(char_align.BOX_PATH_PREFIX)
+    pages = sorted(
+        int(name[len(prefix):-len(char_align.BOX_PATH_SUFFIX)])
+        for name in os.listdir(response_dir)
+        if name.startswith(prefix) and name.endswith(char_align.BOX_PATH_SUFFIX)
+    ) if os.path.isdir(response_dir) else []
+    if pages:
+        command = [sys.executable, "cli.py", "align", "--page", str(pages[0]), "--box-prefix", os.path.join(os.path.abspath(response_dir), prefix)]
+        results["cli_align_page"] = measure_process(command, repeat)
+    return results
+
+
+def bench_compute_cost(book, repeat, pairs=20000):
+    import char_align
+
+    chars = [book.chars[k] for k in book.random.integers(0, len(book.chars), size=pairs).tolist()]
+    words = [book.all_readings[k] for k in book.random.integers(0, len(book.all_readings), size=pairs).tolist()]
+    index = char_align.similarity_index
+
+    def cold():
+        index._memo.clear()
+        index._word_ids.clear()
+        for char, word in zip(chars, words):
+            char_align.compute_cost(char, word)
+
+    def warm():
+        for char, word in zip(chars, words):
+            char_align.compute_cost(char, word)
+
+    results = {"cold": measure(cold, repeat), "warm": measure(warm, repeat)}
+    for result in results.values():
+        result["pairs"] = pairs
+    return results
+
+
+def bench_alignment(book, repeat, real_pairs):
+    import char_align
+
+    results = {}
+    for length in PAIR_LENGTHS:
+        pairs = [book.pair(length) for _ in range(max(1, 256 // length))]
+
+        def run(pairs=pairs):
+            for text, sentence in pairs:
+                char_align.med_with_custom_cost(text, sentence)
+
+        results[f"synthetic_{length}"] = dict(measure(run, repeat), pairs=len(pairs))
+        results[f"batched_{length}"] = dict(measure(lambda pairs=pairs: char_align.align_columns(pairs), repeat), pairs=len(pairs))
+
+    if real_pairs:
+        def run_real():
+            for text, sentence in real_pairs:
+                char_align.med_with_custom_cost(text, sentence)
+
+        results["real"] = dict(measure(run_real, repeat), pairs=len(real_pairs))
+        results["real_batched"] = dict(measure(lambda: char_align.align_columns(real_pairs), repeat), pairs=len(real_pairs))
+    return results
+
+
+def real_alignment_pairs(response_pages, book):
+    """
+    Columns of the response corpus with a sentence read off the dictionary.
+
+    The OCR strings are real; each character is given one of its readings
+    (or a random one when it has none), then noised like SyntheticBook.
+    """
+    import char_align
+
+    readings = {}
+    for char, reading in zip(book.chars, book.readings):
+        readings.setdefault(char, reading)
+    pairs = []
+    for boxes in response_pages:
+        for column in char_align.group_boxes_in_columns(char_align.rearrange_with_custom_comparator(boxes)):
+            text = "".join(box[1][0] for box in column)
+            if not text:
+                continue
+            words = []
+            for char in text:
+                if char in readings and book.random.random() >= book.noise:
+                    words.append(readings[char])
+                else:
+                    words.append(book.all_readings[int(book.random.integers(len(book.all_readings)))])
+            pairs.append((text, " ".join(words)))
+    return pairs
+
+
+def bench_layout(response_pages, repeat):
+    import char_align
+
+    def run():
+        for boxes in response_pages:
+            ordered = char_align.rearrange_with_custom_comparator(boxes)
+            char_align.group_boxes_in_columns(ordered)
+            char_align.filter_bounding_boxes(ordered)
+
+    return dict(measure(run, repeat), pages=len(response_pages), boxes=sum(len(boxes) for boxes in response_pages))
+
+
+def bench_preprocess(image_dir, repeat, limit):
+    from image_pre_process import process_image
+
+    names = sorted(name for name in os.listdir(image_dir) if name.lower().endswith((".jpg", ".jpeg", ".png")))[:limit] if os.path.isdir(image_dir) else []
+    if not names:
+        return {}
+    paths = [os.path.join(image_dir, name) for name in names]
+    results = {}
+    for mode in ("hough", "projection"):
+        def run(mode=mode):
+            for path in paths:
+                process_image(path, mode)
+
+        results[mode] = dict(measure(run, repeat), images=len(paths))
+
+    def run_regions():
+        for path in paths:
+            process_image(path, "hough", "regions")
+
+    results["hough_regions"] = dict(measure(run_regions, repeat), images=len(paths))
+    return results
+
+
+def bench_pages(book, response_pages, repeat, pages, columns):
+    """The page loop of char_align: layout and alignment of whole pages."""
+    import char_align
+
+    synthetic = book.pages(pages, columns)
+
+    def run_synthetic():
+        for i, (boxes, sentences) in enumerate(synthetic):
+            char_align.align_boxes(boxes, sentences, i)
+
+    results = {"synthetic": dict(measure(run_synthetic, repeat), pages=pages, columns=columns)}
+    if response_pages:
+        sentences = [book.page(columns)[1] for _ in response_pages]
+
+        def run_response():
+            for i, boxes in enumerate(response_pages):
+                char_align.align_boxes(boxes, sentences[i], i)
+
+        results["response"] = dict(measure(run_response, repeat), pages=len(response_pages))
+    return results
+
+
+BENCHMARKS = ("imports", "dictionary", "compute_cost", "alignment", "layout", "preprocess", "pages")
+
+
+def run_benchmarks(selected=BENCHMARKS, repeat=5, seed=0, pages=20, columns=16, images=4, response_dir=RESPONSE_DIR, image_dir=SAMPLE_IMAGES_DIR):
+    """
+    Run the selected benchmarks.
+
+    Returns:
+        dict: {"meta": {...}, "results": {benchmark: {case: timings}}}.
+    """
+    results = {}
+    if "imports" in selected:
+        results["imports"] = bench_imports(max(1, repeat // 2), response_dir)
+    if "dictionary" in selected:
+        results["dictionary"] = bench_dictionary_load(repeat)
+
+    import char_align
+
+    book = SyntheticBook(char_align.similarity_index, seed)
+    response_pages = read_response_pages(response_dir) if os.path.isdir(response_dir) else []
+    if "compute_cost" in selected:
+        results["compute_cost"] = bench_compute_cost(book.stream("compute_cost"), repeat)
+    if "alignment" in selected:
+        results["alignment"] = bench_alignment(book.stream("alignment"), repeat, real_alignment_pairs(response_pages, book.stream("real")))
+    if "layout" in selected and response_pages:
+        results["layout"] = {"response": bench_layout(response_pages, repeat)}
+    if "preprocess" in selected:
+        results["preprocess"] = bench_preprocess(image_dir, max(1, repeat // 2), images)
+    if "pages" in selected:
+        results["pages"] = bench_pages(book.stream("pages"), response_pages, max(1, repeat // 2), pages, columns)
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    meta = {
+        "version": FORMAT_VERSION,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "settings": {"repeat": repeat, "seed": seed, "pages": pages, "columns": columns, "images": images},
+    }
+    return {"meta": meta, "results": results}
+
+
+def compare_results(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """
+    Median time ratios of the cases both runs have.
+
+    Returns:
+        list of tuple: (benchmark, case, baseline s, current s, ratio,
+                       regressed), in benchmark order.
+    """
+    rows = []
+    for benchmark, cases in current["results"].items():
+        for case, timing in cases.items():
+            before = baseline["results"].get(benchmark, {}).get(case)
+            if before is None or not before.get("median_s"):
+                continue
+            ratio = timing["median_s"] / before["median_s"]
+            rows.append((benchmark, case, before["median_s"], timing["median_s"], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark alignment, layout, preprocessing and dictionary loading.")
+    parser.add_argument("--only", action="append", choices=BENCHMARKS, help="benchmark to run, repeatable; default all")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pages", type=int, default=20, help="synthetic pages of the page loop")
+    parser.add_argument("--columns", type=int, default=16, help="columns per synthetic page")
+    parser.add_argument("--images", type=int, default=4, help="sample scans to preprocess")
+    parser.add_argument("--response-dir", default=RESPONSE_DIR)
+    parser.add_argument("--image-dir", default=SAMPLE_IMAGES_DIR)
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--compare", default=None, help="baseline results; exit 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.only or BENCHMARKS, args.repeat, args.seed, args.pages, args.columns, args.images, args.response_dir, args.image_dir)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+
+    for benchmark, cases in report["results"].items():
+        for case, timing in cases.items():
+            print(f"{benchmark:<13} {case:<26} median {timing['median_s'] * 1000:10.2f} ms  best {timing['best_s'] * 1000:10.2f} ms")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        rows = compare_results(baseline, report, args.threshold)
+        regressions = [row for row in rows if row[5]]
+        for benchmark, case, before, after, ratio, regressed in rows:
+            print(f"{'REGRESSION' if regressed else 'ok':<10} {benchmark:<13} {case:<26} {before * 1000:10.2f} -> {after * 1000:10.2f} ms ({ratio:.2f}x)")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+from functools import cmp_to_key
+from itertools import accumulate
+
+import numpy as np
+
+# One row per OCR box. The extents follow the conventions of char_align:
+# left/right are the x of the top-left/top-right points, top/bottom the y
+# of the top-right/bottom-right points, and height is calculate_bbox_length
+BOX_DTYPE = np.dtype([
+    ('left', np.float64),
+    ('right', np.float64),
+    ('top', np.float64),
+    ('bottom', np.float64),
+    ('height', np.float64),
+    ('confidence', np.float64),
+    ('text_index', np.int32),
+])
+
+# Boxes overlapping by at most this many pixels are in different columns
+COLUMN_OVERLAP_TOLERANCE = 1.0
+
+
+def points_to_array(points, confidences):
+    """
+    Build a BOX_DTYPE array from corner points.
+
+    Args:
+        points (numpy.ndarray): (n, 4, 2) corner points, clockwise from
+                                the top-left one.
+        confidences (array-like): OCR confidence of every box.
+
+    Returns:
+        numpy.ndarray: Structured array, text_index is the box position.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    boxes = np.zeros(len(points), dtype=BOX_DTYPE)
+    if len(points) == 0:
+        return boxes
+    boxes['left'] = points[:, 0, 0]
+    boxes['right'] = points[:, 1, 0]
+    boxes['top'] = points[:, 1, 1]
+    boxes['bottom'] = points[:, 2, 1]
+    boxes['height'] = np.abs(points[:, 2, 1] - points[:, 0, 1])
+    boxes['confidence'] = confidences
+    boxes['text_index'] = np.arange(len(points))
+    return boxes
+
+
+def boxes_to_array(bounding_boxes):
+    """
+    Convert result_bbox style boxes to a BOX_DTYPE array.
+
+    Args:
+        bounding_boxes (list): Boxes as [points, [text, confidence]].
+
+    Returns:
+        numpy.ndarray: Structured array, text_index is the position of each
+                       box in bounding_boxes.
+    """
+    if isinstance(bounding_boxes, BoxList):
+        return bounding_boxes.geometry()
+    if not bounding_boxes:
+        return np.zeros(0, dtype=BOX_DTYPE)
+    points = np.array([box[0][:3] for box in bounding_boxes], dtype=np.float64)
+    return points_to_array(points, [box[1][1] for box in bounding_boxes])
+
+
+def coordinate_array(points):
+    """Corner points as int32 when they are all whole numbers, float64 otherwise."""
+    points = np.asarray(points)
+    if points.dtype.kind in "iu":
+        return points.astype(np.int32, copy=False).reshape(-1, 4, 2)
+    points = points.astype(np.float64).reshape(-1, 4, 2)
+    if np.array_equal(points, np.round(points)):
+        return points.astype(np.int32)
+    return points
+
+
+class Box:
+    """
+    One box of a BoxList, read through to its arrays.
+
+    Indexing follows the result_bbox layout, box[0] the points and box[1]
+    [text, confidence], so code written for nested lists accepts a Box.
+    """
+
+    __slots__ = ("boxes", "index")
+
+    def __init__(self, boxes, index):
+        self.boxes = boxes
+        self.index = index
+
+    @property
+    def points(self):
+        return self.boxes.points[self.index]
+
+    @property
+    def text(self):
+        return self.boxes.box_text(self.index)
+
+    @property
+    def confidence(self):
+        return float(self.boxes.confidences[self.index])
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, key):
+        return [self.points.tolist(), [self.text, self.confidence]][key]
+
+
+class BoxList:
+    """
+    The OCR boxes of a page, or of a column of one, as arrays.
+
+    Attributes:
+        points (numpy.ndarray): (n, 4, 2) corner points, clockwise from
+                                the top-left one; int32 when the OCR gave
+                                whole pixels.
+        text (str): Texts of all boxes, concatenated.
+        text_offsets (numpy.ndarray): n + 1 offsets of every box text into
+                                      text.
+        confidences (numpy.ndarray): OCR confidence of every box.
+
+    An integer index gives a Box; a slice, an index array or a boolean
+    mask gives a BoxList (a slice shares the points of this one).
+    """
+
+    __slots__ = ("points", "text", "text_offsets", "confidences")
+
+    def __init__(self, points, text, text_offsets, confidences):
+        self.points = points
+        self.text = text
+        self.text_offsets = text_offsets
+        self.confidences = confidences
+
+    @classmethod
+    def from_texts(cls, points, texts, confidences):
+        """A BoxList from corner points, one text per box and confidences."""
+        offsets = np.fromiter(accumulate(map(len, texts), initial=0), dtype=np.int64, count=len(texts) + 1)
+        return cls(coordinate_array(points), "".join(texts), offsets, np.asarray(confidences, dtype=np.float64))
+
+    @classmethod
+    def from_boxes(cls, bounding_boxes):
+        """A BoxList from boxes as [points, [text, confidence]]."""
+        if isinstance(bounding_boxes, BoxList):
+            return bounding_boxes
+        return cls.from_texts([box[0] for box in bounding_boxes], [box[1][0] for box in bounding_boxes],
+                              [box[1][1] for box in bounding_boxes])
+
+    def __len__(self):
+        return len(self.points)
+
+    def __iter__(self):
+        return (Box(self, index) for index in range(len(self)))
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return Box(self, range(len(self))[key])
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self.split([start, max(start, stop)])[0]
+            key = np.arange(start, stop, step)
+        indices = np.arange(len(self))[key]
+        offsets = self.text_offsets.tolist()
+        texts = [self.text[offsets[index]:offsets[index + 1]] for index in indices.tolist()]
+        return BoxList.from_texts(self.points[indices], texts, self.confidences[indices])
+
+    def split(self, bounds):
+        """
+        Cut into consecutive BoxLists, e.g. the columns of a page.
+
+        Args:
+            bounds (list of int): Start of every part, followed by the end
+                                  of the last one.
+
+        Returns:
+            list of BoxList: Parts sharing the points of this one.
+        """
+        offsets = self.text_offsets.tolist()
+        return [BoxList(self.points[start:end], self.text[offsets[start]:offsets[end]], self.text_offsets[start:end + 1] - offsets[start],
+                        self.confidences[start:end]) for start, end in zip(bounds, bounds[1:])]
+
+    def box_text(self, index):
+        return self.text[self.text_offsets[index]:self.text_offsets[index + 1]]
+
+    def texts(self):
+        offsets = self.text_offsets.tolist()
+        return [self.text[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    def char_confidences(self):
+        """The confidence of its box for every character of text."""
+        return np.repeat(self.confidences, np.diff(self.text_offsets)).tolist()
+
+    def to_boxes(self):
+        """The boxes as [points, [text, confidence]] nested lists."""
+        return [[points, [text, confidence]] for points, text, confidence in zip(self.points.tolist(), self.texts(), self.confidences.tolist())]
+
+    def geometry(self):
+        """The boxes as a BOX_DTYPE array."""
+        return points_to_array(self.points, self.confidences)
+
+
+def column_labels(boxes):
+    """
+    Group boxes into columns the way they are read.
+
+    Boxes are sorted so that a box comes before every box it lies right of
+    (overlapping by at most COLUMN_OVERLAP_TOLERANCE), and boxes that
+    overlap in x come top to bottom. A new column starts wherever a box
+    lies entirely left of the box before it. Only neighbours in that order
+    are compared, so the staggered columns of e.g. a table of contents,
+    whose boxes overlap in x far apart vertically, are not chained into
+    one.
+
+    That comparison is not transitive on every page, so the sort starts
+    from a canonical order (right to left, top to bottom, then box
+    position) to not depend on the order the OCR service listed the boxes
+    in.
+
+    Returns:
+        numpy.ndarray: Column number of every box, 0 is the rightmost.
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    left, right, top = boxes['left'].tolist(), boxes['right'].tolist(), boxes['top'].tolist()
+
+    def compare(a, b):
+        if left[a] + COLUMN_OVERLAP_TOLERANCE >= right[b]:
+            return -1
+        if left[b] >= right[a] + COLUMN_OVERLAP_TOLERANCE:
+            return 1
+        return -1 if top[a] < top[b] else 1
+
+    canonical = np.lexsort((boxes['text_index'], boxes['bottom'], boxes['top'], -boxes['right'])).tolist()
+    order = np.array(sorted(canonical, key=cmp_to_key(compare)), dtype=np.int64)
+    starts = np.zeros(len(boxes), dtype=bool)
+    starts[1:] = boxes['right'][order[1:]] < boxes['left'][order[:-1]]
+
+    labels = np.empty(len(boxes), dtype=np.int64)
+    labels[order] = np.cumsum(starts)
+    return labels
+
+
+def reading_order(boxes, labels=None):
+    """
+    Deterministic reading order: columns right to left, boxes top to bottom.
+
+    Ties on top are broken right to left, then by bottom, and only then by
+    the original box position, so the order does not depend on the order
+    the OCR service listed the boxes in.
+
+    Returns:
+        numpy.ndarray: Indices that sort boxes into reading order.
+    """
+    if labels is None:
+        labels = column_labels(boxes)
+    return np.lexsort((boxes['text_index'], boxes['bottom'], -boxes['right'], boxes['top'], labels))
+
+
+def column_bounds(labels):
+    """
+    Split points of boxes already in reading order.
+
+    Returns:
+        numpy.ndarray: Start index of every column, followed by len(labels).
+    """
+    changes = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+    return np.concatenate(([0], changes, [len(labels)])).astype(np.int64) if len(labels) else np.zeros(1, dtype=np.int64)
+
+
+def margin_mask(boxes, top, bottom, left, right):
+    """True for boxes that reach outside the page margins."""
+    return (boxes['left'] < left) | (boxes['right'] > right) | (boxes['top'] < top) | (boxes['bottom'] > bottom)
+
+
+def short_column_mask(boxes, labels, max_length=21):
+    """True for boxes that are alone in their column and at most max_length tall."""
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=bool)
+    column_sizes = np.bincount(labels)
+    return (column_sizes[labels] == 1) & (boxes['height'] <= max_length)
@@ -1,12 +1,17 @@
 import json
-from functools import cmp_to_key
-from ast import literal_eval
-import pandas as pd
 import re
 import numpy as np
-import xlsxwriter
-from itertools import zip_longest
 import os
+import argparse
+import bisect
+from concurrent.futures import ProcessPoolExecutor
+import instrumentation
+from alignment_rows import GAP, MATCH, NOT_MATCH, PARTIAL_MATCH, Alignment, AlignmentRow, empty_alignment
+from box_geometry import BoxList, boxes_to_array, column_bounds, column_labels, margin_mask, reading_order, short_column_mask
+from output_sinks import open_sink
+from phien_am_corpus import PhienAmCorpus
+from response_corpus import INVALID_RESPONSE_ERRORS, ResponseCorpus, parse_response_file
+from similarity_index import load_similarity_index
 
 BOX_PATH_PREFIX = 'response/thanh_giao_yeu_ly_image_'
 BOX_PATH_SUFFIX = '.txt'
@@ -19,25 +24,42 @@ BOTTOM = 618.0
 LEFT = 71.0
 RIGHT = 394.0
 
-# Load dictionaries
-quoc_ngu_sino_nom_df = pd.read_excel("QuocNgu_SinoNom_Dic.xlsx")
-sino_nom_similar_df = pd.read_excel("SinoNom_similar_Dic.xlsx")
-
-# Build similar character dictionary from SinoNom_similar_Dic
-sino_nom_similar_dict = {}
-for _, row in sino_nom_similar_df.iterrows():
-    root_char = row['Input Character']
-    similar_chars = list(literal_eval(row['Top 20 Similar Characters']))
-    sino_nom_similar_dict[root_char] = similar_chars
-
-# Build Quoc Ngu to SinoNom dictionary from QuocNgu_SinoNom_Dic
-quoc_ngu_to_sino_nom_dict = {}
-for _, row in quoc_ngu_sino_nom_df.iterrows():
-    quoc_ngu_char = row['QuocNgu']
-    sino_nom_char = row['SinoNom']
-    if quoc_ngu_char not in quoc_ngu_to_sino_nom_dict:
-        quoc_ngu_to_sino_nom_dict[quoc_ngu_char] = set()
-    quoc_ngu_to_sino_nom_dict[quoc_ngu_char].add(sino_nom_char)
+# A column made of one box at most this tall is an OCR artifact
+SHORT_COLUMN_LENGTH = 21
+
+_similarity_index = None
+
+def get_similarity_index():
+    """
+    The dictionaries' similarity index, loaded on first use.
+
+    Dictionaries and index come from the compiled caches (both are rebuilt
+    when the xlsx files change), so importing this module stays cheap.
+    """
+    global _similarity_index
+    if _similarity_index is None:
+        _similarity_index = load_similarity_index()
+    return _similarity_index
+
+def use_similarity_index(similarity_index):
+    """
+    Align with similarity_index from now on, e.g. one loaded from another
+    dictionary cache.
+
+    Returns:
+        SimilarityIndex: The index used until now, None if none was loaded.
+    """
+    global _similarity_index
+    previous, _similarity_index = _similarity_index, similarity_index
+    return previous
+
+def __getattr__(name):
+    # char_align.similarity_index and char_align.dictionary load on access
+    if name == "similarity_index":
+        return get_similarity_index()
+    if name == "dictionary":
+        return get_similarity_index().dictionary
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def clean_data(sentence):
     # Remove punctuation
@@ -50,230 +72,539 @@ def clean_data(sentence):
     return sentence
 
 def group_boxes_in_columns(bounding_boxes):
-    grouped_columns = []  # List to store grouped columns
-    current_group = []  # Temporary group for the current column
+    """
+    Split boxes that are already in reading order into columns.
 
-    for i, bbox in enumerate(bounding_boxes):
-        if i == 0:
-            # First box, start a new group
-            current_group.append(bbox)
-        else:
-            # Compare the current box's left x-coordinate with the previous group's right x-coordinate
-            current_left_x = bbox[0][1][0]
-            previous_right_x = bounding_boxes[i - 1][0][0][0]
-
-            if current_left_x < previous_right_x:
-                # Not the same column, finalize the current group
-                grouped_columns.append(current_group)
-                # Start a new group
-                current_group = [bbox]
-            else:
-                # Add to the current group
-                current_group.append(bbox)
-
-    # Add the last group if it exists
-    if current_group:
-        grouped_columns.append(current_group)
-
-    return grouped_columns
-
-def custom_comparator(item_a, item_b):
-    a_bottom = item_a[0][2][1]
-    b_bottom = item_b[0][2][1]
-    a_top = item_a[0][1][1]
-    b_top = item_b[0][1][1]
-    a_right = item_a[0][1][0]
-    b_right = item_b[0][1][0]
-    a_left = item_a[0][0][0]
-    b_left = item_b[0][0][0]
-
-    if a_left + 1 >= b_right:
-        return -1
-    elif b_left >= a_right + 1:
-        return 1
-    else:
-        if a_top < b_top:
-            return -1
-        else:
-            return 1
+    Args:
+        bounding_boxes (BoxList or list): Boxes sorted by
+                                          rearrange_with_custom_comparator.
+
+    Returns:
+        list: Boxes of every column, right to left, each a slice of
+              bounding_boxes.
+    """
+    labels = column_labels(boxes_to_array(bounding_boxes))
+    bounds = column_bounds(labels).tolist()
+    instrumentation.count("columns", len(bounds) - 1)
+    if isinstance(bounding_boxes, BoxList):
+        return bounding_boxes.split(bounds)
+    return [bounding_boxes[start:end] for start, end in zip(bounds, bounds[1:])]
 
 def rearrange_with_custom_comparator(data):
-    return sorted(data, key=cmp_to_key(custom_comparator))
+    """
+    Sort boxes into reading order: columns right to left, then top to bottom.
+
+    Columns come from box_geometry.column_labels, which sorts from a
+    canonical order, so the order does not depend on the input order.
+    """
+    order = reading_order(boxes_to_array(data))
+    if isinstance(data, BoxList):
+        return data[order]
+    return [data[k] for k in order.tolist()]
 
 def filter_bounding_boxes(bounding_boxes):
     """
-    Filters out bounding boxes that lie outside the specified boundaries.
+    Find the bounding boxes that lie outside the TOP/BOTTOM/LEFT/RIGHT margins.
 
     Args:
-        bounding_boxes (list of tuples): List of bounding boxes, where each box is represented as 
-                                         (x_min, y_min, x_max, y_max).
-        top (float): Top boundary.
-        bottom (float): Bottom boundary.
-        left (float): Left boundary.
-        right (float): Right boundary.
+        bounding_boxes (BoxList or list): Boxes, or boxes as
+                                          [points, [text, confidence]].
 
     Returns:
-        list of tuples: Filtered list of bounding boxes within the boundaries.
-    """
-    invalid_boxes = set()
-    for i in range(0, len(bounding_boxes)):
-        left = bounding_boxes[i][0][0][0]
-        right = bounding_boxes[i][0][1][0]
-        top = bounding_boxes[i][0][1][1]
-        bottom = bounding_boxes[i][0][2][1]
-        # Check if the box is within the boundaries
-        if left < LEFT or right > RIGHT or top < TOP or bottom > BOTTOM:
-            invalid_boxes.add(i)
+        set of int: Indices of the boxes outside the margins.
+    """
+    mask = margin_mask(boxes_to_array(bounding_boxes), TOP, BOTTOM, LEFT, RIGHT)
+    invalid_boxes = set(np.flatnonzero(mask).tolist())
+    instrumentation.count("boxes_filtered", len(invalid_boxes))
     return invalid_boxes
 
 def compute_cost(ocr_char, quoc_ngu_word):
-    quoc_ngu_word = re.sub(r'[.,;:!?”“"]', '', quoc_ngu_word).lower()
-    S1 = sino_nom_similar_dict.get(ocr_char, {ocr_char})
-    S2 = quoc_ngu_to_sino_nom_dict.get(quoc_ngu_word, set())
-    
-    if ocr_char in S2:
-        return 0, ocr_char
+    # 0 for a match, 0.5 through a similar character, 2 otherwise
+    # (Levenstein: substitution cost = 2)
+    if instrumentation.enabled:
+        instrumentation.count("compute_cost_calls")
+    return get_similarity_index().lookup(ocr_char, quoc_ngu_word)
 
-    intersection = [char for char in S1 if char in S2]
-    
-    if len(intersection) >= 1:
-        return 0.5, list(intersection)[0]
-    else:
-        return 2, None # Levenstein: substitution cost = 2
+def build_cost_matrix(sino_nom_string, quoc_ngu_words):
+    """
+    Build the substitution cost matrix for one column/sentence pair.
 
-def med_with_custom_cost(sino_nom_string, quoc_ngu_string):
-    # quoc_ngu_string = clean_data(quoc_ngu_string)
-    quoc_ngu_string = quoc_ngu_string.split()
-    m, n = len(sino_nom_string), len(quoc_ngu_string)
-    dp = np.zeros((m + 1, n + 1))
-    
-    # Initialize dp array for insertion/deletion costs
-    for i in range(1, m + 1):
-        dp[i][0] = i
-    for j in range(1, n + 1):
-        dp[0][j] = j
+    The similarity index is probed once per unique (OCR character,
+    Quốc Ngữ word) pair and the result is broadcast to every position.
+
+    Args:
+        sino_nom_string (str): OCR characters of the column.
+        quoc_ngu_words (list of str): Quốc Ngữ syllables of the sentence.
 
-    aligned_result = []
+    Returns:
+        numpy.ndarray: (m, n) matrix, cost[i, j] is the cost of aligning
+                       sino_nom_string[i] with quoc_ngu_words[j].
+    """
+    char_ids = {}
+    char_index = [char_ids.setdefault(char, len(char_ids)) for char in sino_nom_string]
+    word_ids = {}
+    word_index = [word_ids.setdefault(word, len(word_ids)) for word in quoc_ngu_words]
 
-    # Fill dp table with computed costs
-    for i in range(1, m + 1):
-        for j in range(1, n + 1):
-            cost, _ = compute_cost(sino_nom_string[i - 1], quoc_ngu_string[j - 1])
-            dp[i][j] = min(dp[i - 1][j] + 1, dp[i][j - 1] + 1, dp[i - 1][j - 1] + cost)
+    instrumentation.count("cost_lookups", len(char_ids) * len(word_ids))
+    unique_costs = get_similarity_index().cost_matrix(list(char_ids), list(word_ids))
+    return unique_costs[np.ix_(char_index, word_index)]
 
-    # Backtrack to find the alignment path
+def fill_dp_wavefront(cost):
+    """
+    Fill the edit distance table one anti-diagonal at a time.
+
+    Every cell of an anti-diagonal only depends on the two previous
+    anti-diagonals, so each one is updated with a single vectorized step.
+
+    Args:
+        cost (numpy.ndarray): (m, n) substitution cost matrix.
+
+    Returns:
+        numpy.ndarray: (m + 1, n + 1) dp table.
+    """
+    m, n = cost.shape
+    instrumentation.count("dp_cells", m * n)
+    width = n + 1
+    dp = np.zeros((m + 1) * width)
+    dp[::width] = np.arange(m + 1)
+    dp[:width] = np.arange(n + 1)
+    flat_cost = cost.ravel()
+
+    for d in range(2, m + n + 1):
+        i = np.arange(max(1, d - n), min(m, d - 1) + 1)
+        cell = i * width + (d - i)
+        dp[cell] = np.minimum(
+            np.minimum(dp[cell - width], dp[cell - 1]) + 1,
+            dp[cell - width - 1] + flat_cost[(i - 1) * n + (d - i - 1)],
+        )
+    return dp.reshape(m + 1, width)
+
+def cost_status(cell_cost):
+    """Status code (see alignment_rows.STATUSES) of a substitution cost."""
+    return MATCH if cell_cost == 0 else PARTIAL_MATCH if cell_cost == 0.5 else NOT_MATCH
+
+def reversed_alignment(chars, statuses):
+    """The Alignment of characters and status codes collected end first."""
+    chars.reverse()
+    statuses.reverse()
+    return Alignment("".join(chars), np.array(statuses, dtype=np.uint8))
+
+def backtrack(sino_nom_string, m, n, table, costs):
+    """
+    Recover the alignment from a filled dp table.
+
+    Ties prefer the diagonal, then a deleted SinoNom character, then a
+    skipped Quốc Ngữ word. table(i, j) and costs(i, j) read the dp value
+    and the substitution cost of character i - 1 with word j - 1.
+
+    Returns:
+        Alignment: The aligned characters and their status codes.
+    """
+    chars, statuses = [], []
     i, j = m, n
     while i > 0 or j > 0:
         if i > 0 and j > 0:
-            cost, aligned_char = compute_cost(sino_nom_string[i - 1], quoc_ngu_string[j - 1])
-            if dp[i][j] == dp[i - 1][j - 1] + cost:
-                status = "match" if cost == 0 else "partial match" if cost == 0.5 else "not match"
-                aligned_result.append((sino_nom_string[i - 1], status))
+            cell_cost = costs(i, j)
+            if table(i, j) == table(i - 1, j - 1) + cell_cost:
+                chars.append(sino_nom_string[i - 1])
+                statuses.append(cost_status(cell_cost))
                 i, j = i - 1, j - 1
                 continue
-        if i > 0 and (j == 0 or dp[i][j] == dp[i - 1][j] + 1):
-            aligned_result.append((sino_nom_string[i - 1], "not match"))
+        if i > 0 and (j == 0 or table(i, j) == table(i - 1, j) + 1):
+            chars.append(sino_nom_string[i - 1])
             i -= 1
         elif j > 0:
-            aligned_result.append(('-', "not match"))
+            chars.append(GAP)
             j -= 1
+        statuses.append(NOT_MATCH)
+
+    return reversed_alignment(chars, statuses)
+
+# Fast lanes of align_column. The band is BAND_RADIUS cells wider than the
+# length difference on each side, and only tried when the lengths differ
+# by at most MAX_BAND_LENGTH_GAP
+BAND_RADIUS = 2
+MAX_BAND_LENGTH_GAP = 4
+ALIGNMENT_PATHS = ("diagonal", "banded", "full", "linear", "batched")
+
+def align_diagonal(sino_nom_string, quoc_ngu_words, confidences=None):
+    """
+    One-to-one alignment, if it is provably the optimal one.
+
+    Any other path needs at least one deletion and one insertion, so the
+    diagonal is the unique optimum whenever its total cost is below 2; the
+    full table would backtrack along it too. Costs are summed from the least
+    confident OCR character up, so a failing column usually stops after a
+    few lookups.
+
+    Returns:
+        tuple: (aligned_result, cost), or None if it cannot be proven.
+    """
+    m = len(sino_nom_string)
+    if m != len(quoc_ngu_words) or m == 0:
+        return None
+    order = sorted(range(m), key=confidences.__getitem__) if confidences else range(m)
+    costs = [0] * m
+    total = 0
+    for k in order:
+        costs[k] = compute_cost(sino_nom_string[k], quoc_ngu_words[k])[0]
+        total += costs[k]
+        if total >= 2:
+            return None
+    return Alignment(sino_nom_string, np.array([cost_status(cell_cost) for cell_cost in costs], dtype=np.uint8)), total
+
+def align_banded(sino_nom_string, quoc_ngu_words, cost, radius=BAND_RADIUS):
+    """
+    Edit distance restricted to a band around the diagonal, if it is
+    provably the optimal one.
+
+    Cells with j - i in [lo, hi] are filled, where the band covers the
+    length difference plus radius cells on each side. A path that leaves
+    the band needs at least |n - m| + 2 * (radius + 1) insertions and
+    deletions, so a band cost below that is the global optimum, every
+    optimal path lies in the band, and the backtrack matches the one over
+    the full table. The row minimum never decreases, so the fill stops as
+    soon as it reaches the bound.
+
+    Returns:
+        tuple: (aligned_result, cost), or None if it cannot be proven.
+    """
+    m, n = cost.shape
+    lo = min(0, n - m) - radius
+    hi = max(0, n - m) + radius
+    bound = abs(n - m) + 2 * (radius + 1)
+    inf = float("inf")
+    costs = cost.tolist()
+
+    # rows[i][j - i - lo] is dp[i][j]; cells outside the band read as inf
+    rows = [[float(j) if 0 <= j <= min(hi, n) else inf for j in range(lo, hi + 1)]]
+    for i in range(1, m + 1):
+        previous = rows[-1]
+        cost_row = costs[i - 1]
+        row = []
+        left = inf
+        for j in range(i + lo, i + hi + 1):
+            if j < 0 or j > n:
+                value = inf
+            elif j == 0:
+                value = float(i)
+            else:
+                # Same cell of the previous row is one slot further right
+                offset = j - i - lo
+                up = previous[offset + 1] if offset + 1 < len(previous) else inf
+                value = min(previous[offset] + cost_row[j - 1], up + 1, left + 1)
+            row.append(value)
+            left = value
+        instrumentation.count("dp_cells", len(row))
+        if min(row) >= bound:
+            return None
+        rows.append(row)
+
+    total = rows[m][n - m - lo]
+    if total >= bound:
+        return None
+
+    def table(i, j):
+        offset = j - i - lo
+        return rows[i][offset] if 0 <= offset <= hi - lo else inf
+
+    return backtrack(sino_nom_string, m, n, table, lambda i, j: costs[i - 1][j - 1]), total
+
+# Tables with more cells than this are aligned in linear memory
+LINEAR_MEMORY_CELLS = 1_000_000
+# Rows kept at once at the bottom of the linear-memory recursion
+LINEAR_MEMORY_BLOCK = 64
+
+def align_linear_memory(sino_nom_string, quoc_ngu_words, block=LINEAR_MEMORY_BLOCK):
+    """
+    Same result as the full table, in O(min(m, n) * log(max(m, n))) memory.
+
+    The table is laid out with the longer sequence along the rows, so a
+    row holds min(m, n) + 1 cells. Rows are filled forward from a stored
+    row with the left-to-right recurrence turned into a running minimum:
+    dp[j] = j + cummin(t[j] - j), where t holds the diagonal and vertical
+    candidates.
+
+    The backtrack is then replayed exactly, Hirschberg style: to trace the
+    path from (r1, j) up to where it first reaches row r0, the middle row
+    is recomputed from row r0, the lower half is traced first (giving the
+    column where the path reaches the middle row), then the upper half.
+    Only columns up to j can be on the path, so each half works on a
+    prefix. Spans of at most block rows are traced directly from stored
+    rows.
+
+    Returns:
+        tuple: (aligned_result, cost).
+    """
+    m, n = len(sino_nom_string), len(quoc_ngu_words)
+    similarity_index = get_similarity_index()
+    char_ids = np.array([similarity_index.char_id(char) for char in sino_nom_string], dtype=np.int64)
+    reading_ids = np.array([similarity_index.reading_id(word) for word in quoc_ngu_words], dtype=np.int64)
+
+    # Rows run along the longer sequence. In the transposed layout a step
+    # within a row is a deleted SinoNom character, which the backtrack
+    # prefers over a skipped word
+    transposed = n > m
+    if transposed:
+        rows, width = n, m
+        def cost_row(a, b_end):
+            return similarity_index.pair_costs(char_ids[:b_end], reading_ids[a - 1])
+        def cell_cost(a, b):
+            return float(similarity_index.pair_costs(char_ids[b - 1], reading_ids[a - 1]))
+    else:
+        rows, width = m, n
+        def cost_row(a, b_end):
+            return similarity_index.pair_costs(char_ids[a - 1], reading_ids[:b_end])
+        def cell_cost(a, b):
+            return float(similarity_index.pair_costs(char_ids[a - 1], reading_ids[b - 1]))
+
+    def next_row(previous, a):
+        b_end = len(previous) - 1
+        instrumentation.count("dp_cells", b_end)
+        candidates = np.empty(b_end + 1)
+        candidates[0] = a
+        candidates[1:] = np.minimum(previous[:-1] + cost_row(a, b_end), previous[1:] + 1)
+        offsets = np.arange(b_end + 1)
+        return np.minimum.accumulate(candidates - offsets) + offsets
+
+    moves = []
+    distance = []
+
+    def trace_block(r0, r1, b, first_row):
+        table = [first_row.tolist()]
+        for a in range(r0 + 1, r1 + 1):
+            first_row = next_row(first_row, a)
+            table.append(first_row.tolist())
+        if not distance:
+            distance.append(table[-1][b])
+
+        a = r1
+        while a > r0:
+            row, above = table[a - r0], table[a - r0 - 1]
+            if b > 0:
+                diagonal_cost = cell_cost(a, b)
+                if row[b] == above[b - 1] + diagonal_cost:
+                    moves.append(("diagonal", a, b, diagonal_cost))
+                    a, b = a - 1, b - 1
+                    continue
+            if transposed:
+                within = b > 0 and row[b] == row[b - 1] + 1
+            else:
+                within = b > 0 and row[b] != above[b] + 1
+            if within:
+                moves.append(("within", a, b, None))
+                b -= 1
+            else:
+                moves.append(("across", a, b, None))
+                a -= 1
+        return b
+
+    def trace(r0, r1, b, first_row):
+        if r1 - r0 <= block:
+            return trace_block(r0, r1, b, first_row)
+        middle = (r0 + r1) // 2
+        middle_row = first_row
+        for a in range(r0 + 1, middle + 1):
+            middle_row = next_row(middle_row, a)
+        b = trace(middle, r1, b, middle_row)
+        del middle_row
+        return trace(r0, middle, b, first_row[:b + 1])
+
+    b = trace(0, rows, width, np.arange(width + 1, dtype=np.float64))
+    moves.extend(("within", 0, k, None) for k in range(b, 0, -1))
+
+    chars, statuses = [], []
+    for move, a, b, diagonal_cost in moves:
+        i = b if transposed else a
+        if move == "diagonal":
+            chars.append(sino_nom_string[i - 1])
+            statuses.append(cost_status(diagonal_cost))
+        elif (move == "within") == transposed:
+            chars.append(sino_nom_string[i - 1])
+            statuses.append(NOT_MATCH)
+        else:
+            chars.append(GAP)
+            statuses.append(NOT_MATCH)
+    return reversed_alignment(chars, statuses), distance[0]
 
-    aligned_result.reverse()
-    return aligned_result, dp[m][n]
-
-# def character_align(columns, quoc_ngu_sentences, invalid_boxes, i):
-#     alignments = []
-#     box_index = 0
-#     sentence_index = 0
-
-#     # Align columns and sentences, handling cases where not all columns have sentences
-#     for column in columns:
-#         boxes = [box for box in column]
-#         valid_boxes = [box for idx, box in enumerate(column) if idx + box_index not in invalid_boxes]
-#         box_index += len(column)  # Update box index for next column
-        
-#         # Check if there are still sentences to align
-#         if sentence_index < len(quoc_ngu_sentences):
-#             if len(valid_boxes) > 0:
-#                 alignments.append((valid_boxes, quoc_ngu_sentences[sentence_index]))
-#                 sentence_index += 1
-#             else:
-#                 alignments.append((boxes, None))
-#         else:
-#             # No sentence available for this column
-#             alignments.append((valid_boxes, None))
-
-#     # Write results to Excel
-#     workbook = xlsxwriter.Workbook('output.xlsx')
-#     worksheet = workbook.add_worksheet("Alignment Output")
-
-#     # Define formatting
-#     font_perfect_match = workbook.add_format({'font_name': "Nom Na Tong", 'font_size': 14, 'color': 'black'})
-#     font_partial_match = workbook.add_format({'font_name': "Nom Na Tong", 'font_size': 14, 'color': 'blue'})
-#     font_no_match = workbook.add_format({'font_name': "Nom Na Tong", 'font_size': 14, 'color': 'red'})
-#     font_false_box = workbook.add_format({'font_name': "Nom Na Tong", 'font_size': 14, 'color': 'green'})
-
-#     # Headers
-#     worksheet.write_row(0, 0, ["ID", "Image Box", "SinoNom OCR", "Chữ Quốc Ngữ"])
-
-#     # Process alignments
-#     for index, (valid_boxes, quoc_ngu_sentence) in enumerate(alignments, start=1):
-#         # Generate unique box ID
-#         box_id = f"ppp{i}_ss{index}"
-
-#         # Construct SinoNom OCR string from valid boxes
-#         sino_nom_string = "".join(box[1][0] for box in valid_boxes) if valid_boxes else None
-
-#         # Perform alignment if both SinoNom OCR and Quốc Ngữ sentence exist
-#         if sino_nom_string and quoc_ngu_sentence:
-#             aligned_result, _ = med_with_custom_cost(sino_nom_string, quoc_ngu_sentence)
-#         else:
-#             aligned_result = []
-
-#         # Format SinoNom OCR output
-#         sino_nom_output = []
-#         for sino_char, status in aligned_result:
-#             if status == "match":
-#                 sino_nom_output.extend([font_perfect_match, sino_char])
-#             elif status == "partial match":
-#                 sino_nom_output.extend([font_partial_match, sino_char])
-#             else:
-#                 sino_nom_output.extend([font_no_match, sino_char])
-
-#         # Write data to Excel
-#         worksheet.write(index, 0, box_id)
-#         # Image boxes in new lines
-#         worksheet.write(index, 1, str([box[0] for box in valid_boxes]) if valid_boxes else "Invalid", font_false_box if not valid_boxes else None)
-        
-#         if sino_nom_output:
-#             worksheet.write_rich_string(index, 2, *sino_nom_output)
-#         else:
-#             worksheet.write(index, 2, sino_nom_string or "No OCR", font_false_box)
-        
-#         worksheet.write(index, 3, quoc_ngu_sentence or "No Sentence")
-
-#     workbook.close()
-
-# def process_single_box_text(box_path, text_path, i):
-#     with open(box_path, 'r', encoding='utf-8') as file:
-#         data = json.load(file)
-#         bounding_boxes = data.get("result_bbox", [])
-#         bounding_boxes = rearrange_with_custom_comparator(bounding_boxes)
-#         columns = group_boxes_in_columns(bounding_boxes)
-#         invalid_boxes = filter_bounding_boxes(bounding_boxes)
-
-#     with open(text_path, 'r', encoding='utf-8') as file:
-#         quoc_ngu_sentences = json.load(file)
-
-#     box_index = 0
-#     for column in columns:
-#         if len(column) == 1 and calculate_bbox_length(column[0][0]) <= 21:
-#             invalid_boxes.add(box_index)
-#             box_index += 1
-#         else:
-#             box_index += len(column)
-
-#     character_align(columns, quoc_ngu_sentences, invalid_boxes, i)
+def align_column(sino_nom_string, quoc_ngu_string, confidences=None):
+    """
+    Align a column with a sentence through the cheapest exact path.
+
+    Tries the diagonal, then the band, then fills the full table; all of
+    them return what the full table would. Tables of more than
+    LINEAR_MEMORY_CELLS cells are aligned by align_linear_memory instead
+    of being allocated.
+
+    Args:
+        sino_nom_string (str): OCR characters of the column.
+        quoc_ngu_string (str or list): Sentence, or its syllables.
+        confidences (list of float): OCR confidence of every character,
+                                     used to order the diagonal check.
+
+    Returns:
+        tuple: (aligned_result, cost, path), aligned_result an
+               alignment_rows.Alignment, path one of ALIGNMENT_PATHS.
+    """
+    quoc_ngu_words = quoc_ngu_string.split() if isinstance(quoc_ngu_string, str) else list(quoc_ngu_string)
+    m, n = len(sino_nom_string), len(quoc_ngu_words)
+
+    result = align_diagonal(sino_nom_string, quoc_ngu_words, confidences)
+    if result is not None:
+        instrumentation.count("path.diagonal")
+        return result[0], result[1], "diagonal"
+
+    if (m + 1) * (n + 1) > LINEAR_MEMORY_CELLS:
+        aligned_result, cost = align_linear_memory(sino_nom_string, quoc_ngu_words)
+        instrumentation.count("path.linear")
+        return aligned_result, cost, "linear"
+
+    # Costs are computed once per pair and reused by the backtrack
+    cost = build_cost_matrix(sino_nom_string, quoc_ngu_words)
+    if m and n and abs(m - n) <= MAX_BAND_LENGTH_GAP and abs(m - n) + 2 * BAND_RADIUS + 1 < n:
+        result = align_banded(sino_nom_string, quoc_ngu_words, cost)
+        if result is not None:
+            instrumentation.count("path.banded")
+            return result[0], result[1], "banded"
+
+    dp = fill_dp_wavefront(cost)
+    table, costs = dp.tolist(), cost.tolist()
+    aligned_result = backtrack(sino_nom_string, m, n, lambda i, j: table[i][j], lambda i, j: costs[i - 1][j - 1])
+    instrumentation.count("path.full")
+    return aligned_result, dp[m][n], "full"
+
+# align_columns fills the tables of many pairs at once, padded to the
+# largest pair of a batch. A batch holds at most BATCH_MAX_CELLS padded
+# cells, of which at most 1 / BATCH_MIN_FILL may be padding
+BATCH_MAX_CELLS = 2_000_000
+BATCH_MIN_FILL = 0.5
+
+def fill_dp_batch(cost):
+    """
+    The edit distance tables of a stack of cost matrices, filled together.
+
+    Each step fills one whole row of every table at once: the diagonal and
+    vertical candidates come from the previous row, and the left-to-right
+    dependency is a running minimum, dp[j] = j + cummin(t[j] - j), as in
+    align_linear_memory. The sweep runs along the shorter side (the table
+    of the transposed costs is the transposed table), so a batch takes
+    min(m, n) vectorized steps whatever its size. Pairs shorter than the
+    padded shape get the same values in their own cells as an unpadded
+    table: a cell only depends on the cells above and to the left of it.
+
+    Args:
+        cost (numpy.ndarray): (p, m, n) substitution costs, padded.
+
+    Returns:
+        numpy.ndarray: (p, m + 1, n + 1) dp tables.
+    """
+    p, m, n = cost.shape
+    if m > n:
+        return fill_dp_batch(cost.transpose(0, 2, 1)).transpose(0, 2, 1)
+    instrumentation.count("dp_cells", p * m * n)
+
+    dp = np.empty((p, m + 1, n + 1))
+    offsets = np.arange(n + 1, dtype=np.float64)
+    dp[:, 0] = offsets
+    candidates = np.empty((p, n + 1))
+    for i in range(1, m + 1):
+        previous = dp[:, i - 1]
+        candidates[:, 0] = i
+        np.minimum(previous[:, :-1] + cost[:, i - 1], previous[:, 1:] + 1, out=candidates[:, 1:])
+        candidates -= offsets
+        np.minimum.accumulate(candidates, axis=1, out=dp[:, i])
+        dp[:, i] += offsets
+    return dp
+
+def _align_batch(batch):
+    """Full-table alignment of (index, sino_nom_string, quoc_ngu_words) pairs of one batch."""
+    similarity_index = get_similarity_index()
+    m = max(len(sino_nom_string) for _, sino_nom_string, _ in batch)
+    n = max(len(words) for _, _, words in batch)
+
+    # Padding is an unknown ID; padded cells are never read back
+    char_ids = np.full((len(batch), m), -1, dtype=np.int64)
+    reading_ids = np.full((len(batch), n), -1, dtype=np.int64)
+    for k, (_, sino_nom_string, words) in enumerate(batch):
+        char_ids[k, :len(sino_nom_string)] = [similarity_index.char_id(char) for char in sino_nom_string]
+        reading_ids[k, :len(words)] = [similarity_index.reading_id(word) for word in words]
+    instrumentation.count("cost_lookups", char_ids.size * n)
+    cost = similarity_index.pair_costs(char_ids[:, :, None], reading_ids[:, None, :])
+    dp = fill_dp_batch(cost)
+
+    results = []
+    for k, (index, sino_nom_string, words) in enumerate(batch):
+        m_k, n_k = len(sino_nom_string), len(words)
+        table = dp[k, :m_k + 1, :n_k + 1].tolist()
+        costs = cost[k, :m_k, :n_k].tolist()
+        aligned_result = backtrack(sino_nom_string, m_k, n_k, lambda i, j: table[i][j], lambda i, j: costs[i - 1][j - 1])
+        results.append((index, aligned_result, table[m_k][n_k]))
+    return results
+
+def align_columns(pairs, confidences=None):
+    """
+    align_column for many (column, sentence) pairs, e.g. all the columns of
+    one or more pages.
+
+    Each pair first gets the diagonal check, and tables too large for
+    memory go to align_linear_memory, as in align_column. All other pairs
+    are sorted by size and their full tables are filled together by
+    fill_dp_batch, then backtracked one by one. Every
+    (aligned_result, cost) is the one align_column returns for the pair;
+    the path of a batched pair is "batched".
+
+    Args:
+        pairs (list of tuple): (sino_nom_string, quoc_ngu_string) pairs, the
+                               sentence as a string or its syllables.
+        confidences (list): Per-pair confidences as align_column takes
+                            them, or None.
+
+    Returns:
+        list of tuple: (aligned_result, cost, path) for every pair, in order.
+    """
+    results = [None] * len(pairs)
+    pending = []
+    for index, (sino_nom_string, quoc_ngu_string) in enumerate(pairs):
+        quoc_ngu_words = quoc_ngu_string.split() if isinstance(quoc_ngu_string, str) else list(quoc_ngu_string)
+        m, n = len(sino_nom_string), len(quoc_ngu_words)
+        if m == 0 or n == 0 or (m + 1) * (n + 1) > LINEAR_MEMORY_CELLS:
+            results[index] = align_column(sino_nom_string, quoc_ngu_words, confidences[index] if confidences else None)
+            continue
+        result = align_diagonal(sino_nom_string, quoc_ngu_words, confidences[index] if confidences else None)
+        if result is not None:
+            instrumentation.count("path.diagonal")
+            results[index] = (result[0], result[1], "diagonal")
+        else:
+            pending.append((index, sino_nom_string, quoc_ngu_words))
+
+    # Similar sizes share a batch, so little of it is padding
+    pending.sort(key=lambda pair: (len(pair[1]), len(pair[2])))
+    start = 0
+    while start < len(pending):
+        end, cells, m, n = start, 0, 0, 0
+        while end < len(pending):
+            _, sino_nom_string, words = pending[end]
+            next_m, next_n = max(m, len(sino_nom_string)), max(n, len(words))
+            padded = (end - start + 1) * (next_m + 1) * (next_n + 1)
+            next_cells = cells + (len(sino_nom_string) + 1) * (len(words) + 1)
+            if end > start and (padded > BATCH_MAX_CELLS or next_cells < BATCH_MIN_FILL * padded):
+                break
+            end, cells, m, n = end + 1, next_cells, next_m, next_n
+        if end - start == 1:
+            # A lone pair gains nothing from batching; the band is cheaper
+            index, sino_nom_string, words = pending[start]
+            results[index] = align_column(sino_nom_string, words, confidences[index] if confidences else None)
+        else:
+            for index, aligned_result, cost in _align_batch(pending[start:end]):
+                results[index] = (aligned_result, cost, "batched")
+            instrumentation.count("path.batched", end - start)
+        start = end
+    return results
+
+def med_with_custom_cost(sino_nom_string, quoc_ngu_string, confidences=None):
+    # quoc_ngu_string = clean_data(quoc_ngu_string)
+    aligned_result, cost, _ = align_column(sino_nom_string, quoc_ngu_string, confidences)
+    return aligned_result, cost
 
 def calculate_bbox_length(bbox):
     """
@@ -289,124 +620,286 @@ def calculate_bbox_length(bbox):
     top_y = bbox[0][1]  # y-coordinate of the top-left corner
     bottom_y = bbox[2][1]  # y-coordinate of the bottom-right corner
     return abs(bottom_y - top_y)
-def process_single_box_text(box_path, text_path, index, worksheet, current_row):
-    # Check if the text file exists
+
+def read_box_file(box_path, corpus=None):
+    """
+    Read the OCR boxes of one page.
+
+    Boxes come from the compiled response corpus when one is given and
+    holds the page, otherwise from the response file itself.
+
+    Args:
+        box_path (str): Path of the response file.
+        corpus (ResponseCorpus): Optional compiled response corpus.
+
+    Returns:
+        BoxList: Bounding boxes, empty if the file is missing or invalid.
+    """
+    name = os.path.splitext(os.path.basename(box_path))[0]
+    if corpus is not None and name in corpus:
+        return corpus.box_list(name)
+    if not os.path.exists(box_path):
+        print(f"Warning: {box_path} does not exist.")
+        return BoxList.from_boxes([])
+    try:
+        _, points, confidences, texts = parse_response_file(box_path)
+    except INVALID_RESPONSE_ERRORS as e:
+        print(f"Error: {box_path} contains invalid OCR data: {e}")
+        return BoxList.from_boxes([])
+    return BoxList.from_texts(points, texts, confidences)
+
+_corpora = {}
+
+def load_corpus(corpus_path):
+    """Open a compiled response corpus once per process."""
+    if corpus_path not in _corpora:
+        _corpora[corpus_path] = ResponseCorpus(corpus_path)
+    return _corpora[corpus_path]
+
+def load_sentence_corpus(sentences_path):
+    """Open a compiled phiên âm sentence file once per process."""
+    if sentences_path not in _corpora:
+        _corpora[sentences_path] = PhienAmCorpus(sentences_path)
+    return _corpora[sentences_path]
+
+def read_sentences(text_path):
+    """
+    Read the Quốc Ngữ sentences of one page.
+
+    Args:
+        text_path (str): Path of the JSON list of sentences.
+
+    Returns:
+        list of str: Sentences, empty if the file is missing or invalid.
+    """
     if not os.path.exists(text_path):
         print(f"Warning: {text_path} does not exist.")
-        quoc_ngu_sentences = []  # Default empty list if the file is missing
-    else:
-        try:
-            # Open and read the text file
-            with open(text_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-                
-                # Check if file is empty
-                if not content:
-                    print(f"Warning: {text_path} is empty.")
-                    quoc_ngu_sentences = []  # Default empty list if file is empty
-                else:
-                    try:
-                        # Try loading the content as JSON
-                        quoc_ngu_sentences = json.loads(content)
-                    except json.JSONDecodeError:
-                        print(f"Error: {text_path} contains invalid JSON.")
-                        quoc_ngu_sentences = []  # Default empty list if JSON is invalid
-
-        except Exception as e:
-            print(f"Error reading file {text_path}: {e}")
-            quoc_ngu_sentences = []  # Default empty list on other errors
-
-    # Processing the sentences from the JSON file (assuming it's a list of sentences or text blocks)
-    for sentence in quoc_ngu_sentences:
-        # Example of processing the sentences (you can replace with your actual processing logic)
-        print(f"Processing sentence {index}: {sentence}")
-        
-        # Assuming `worksheet` is a list and `current_row` is an index to place the data in the worksheet
-        worksheet[current_row] = sentence
-        current_row += 1  # Move to the next row for the next sentence
-
-    # Returning updated row index for the next process
-    return current_row
-
-
-def character_align(columns, quoc_ngu_sentences, invalid_boxes, i, worksheet, start_row):
-    alignments = []
-    box_index = 0
-    sentence_index = 0
+        return []
+    try:
+        with open(text_path, 'r', encoding='utf-8') as file:
+            content = file.read()
+    except Exception as e:
+        print(f"Error reading file {text_path}: {e}")
+        return []
+    if not content:
+        print(f"Warning: {text_path} is empty.")
+        return []
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        print(f"Error: {text_path} contains invalid JSON.")
+        return []
+
+def process_single_box_text(box_path, text_path, i, corpus_path=None, sentences_path=None):
+    """
+    Align one page.
 
-    # Align columns and sentences, handling cases where not all columns have sentences
-    for column in columns:
-        boxes = [box for box in column]
-        valid_boxes = [box for idx, box in enumerate(column) if idx + box_index not in invalid_boxes]
-        box_index += len(column)  # Update box index for next column
-        
-        # Check if there are still sentences to align
-        if sentence_index < len(quoc_ngu_sentences):
-            if len(valid_boxes) > 0:
-                alignments.append((valid_boxes, quoc_ngu_sentences[sentence_index]))
-                sentence_index += 1
-            else:
-                alignments.append((boxes, None))
-        else:
-            # No sentence available for this column
-            alignments.append((boxes, None))
-
-    # Process alignments and append to worksheet
-    current_row = start_row
-    font_perfect_match = workbook.add_format({'font_name': "Nom Na Tong", 'font_size': 14, 'color': 'black'})
-    font_partial_match = workbook.add_format({'font_name': "Nom Na Tong", 'font_size': 14, 'color': 'blue'})
-    font_no_match = workbook.add_format({'font_name': "Nom Na Tong", 'font_size': 14, 'color': 'red'})
-    font_false_box = workbook.add_format({'font_name': "Nom Na Tong", 'font_size': 14, 'color': 'green'})
-
-    for index, (valid_boxes, quoc_ngu_sentence) in enumerate(alignments, start=1):
-        # Generate unique box ID
-        box_id = f"ppp{i}_ss{index}"
-
-        # Construct SinoNom OCR string from valid boxes
-        sino_nom_string = "".join(box[1][0] for box in valid_boxes) if valid_boxes else None
-
-        # Perform alignment if both SinoNom OCR and Quốc Ngữ sentence exist
-        if sino_nom_string and quoc_ngu_sentence:
-            aligned_result, _ = med_with_custom_cost(sino_nom_string, quoc_ngu_sentence)
-        else:
-            aligned_result = []
-
-        # Format SinoNom OCR output
-        sino_nom_output = []
-        for sino_char, status in aligned_result:
-            if status == "match":
-                sino_nom_output.extend([font_perfect_match, sino_char])
-            elif status == "partial match":
-                sino_nom_output.extend([font_partial_match, sino_char])
+    Args:
+        box_path (str): OCR response file of the page.
+        text_path (str): Quốc Ngữ sentences of the page.
+        i (int): Page number used in the row ids.
+        corpus_path (str): Optional compiled response corpus to read the
+                           boxes from.
+        sentences_path (str): Optional compiled phiên âm sentence file to
+                              read the sentences of page i + 1 from,
+                              instead of text_path.
+
+    Returns:
+        list of AlignmentRow: See character_align.
+    """
+    with instrumentation.span("read_page", "align", page=i):
+        corpus = load_corpus(corpus_path) if corpus_path else None
+        bounding_boxes = read_box_file(box_path, corpus)
+        if sentences_path:
+            sentence_corpus = load_sentence_corpus(sentences_path)
+            if i + 1 in sentence_corpus:
+                quoc_ngu_sentences = sentence_corpus.sentences(i + 1)
             else:
-                sino_nom_output.extend([font_no_match, sino_char])
-
-        # Write data to worksheet
-        worksheet.write(current_row, 0, box_id)
-        # Image boxes in new lines
-        worksheet.write(current_row, 1, str([box[0] for box in valid_boxes]) if valid_boxes else "Invalid", font_false_box if not valid_boxes else None)
-        
-        if sino_nom_output:
-            worksheet.write_rich_string(current_row, 2, *sino_nom_output)
+                print(f"Warning: page {i + 1} is not in {sentences_path}.")
+                quoc_ngu_sentences = []
         else:
-            worksheet.write(current_row, 2, sino_nom_string or "No OCR", font_false_box)
-        
-        worksheet.write(current_row, 3, quoc_ngu_sentence or "No Sentence")
-        current_row += 1  # Move to the next row
+            quoc_ngu_sentences = read_sentences(text_path)
+    return align_boxes(bounding_boxes, quoc_ngu_sentences, i)
 
-    return current_row
 
-# Main loop to process all pairs of files
-workbook = xlsxwriter.Workbook('output.xlsx')  # Create workbook once
-worksheet = workbook.add_worksheet("Alignment Output")
+def align_boxes(bounding_boxes, quoc_ngu_sentences, i):
+    """
+    Align the OCR boxes of one page with its sentences.
 
-# Add headers
-worksheet.write_row(0, 0, ["ID", "Image Box", "SinoNom OCR", "Chữ Quốc Ngữ"])
-current_row = 1  # Start writing data below the headers
+    Args:
+        bounding_boxes (BoxList or list): Boxes, or boxes as
+                                          [points, [text, confidence]], in
+                                          any order.
+        quoc_ngu_sentences (list of str): Sentences of the page.
+        i (int): Page number used in the row ids.
 
-for i in range(6, 67, 2):
-    box_path = f"{BOX_PATH_PREFIX}{i}{BOX_PATH_SUFFIX}"
-    text_path = f"{TEXT_PATH_PREFIX}{i+1}{TEXT_PATH_SUFFIX}"
-    current_row = process_single_box_text(box_path, text_path, i, worksheet, current_row)
+    Returns:
+        list of AlignmentRow: See character_align.
+    """
+    with instrumentation.span("align_page", "align", page=i):
+        # Sort into reading order and split into columns on the box array
+        bounding_boxes = BoxList.from_boxes(bounding_boxes)
+        geometry = bounding_boxes.geometry()
+        labels = column_labels(geometry)
+        order = reading_order(geometry, labels)
+        geometry, labels = geometry[order], labels[order]
+        bounding_boxes = bounding_boxes[order]
+        bounds = column_bounds(labels).tolist()
+        columns = bounding_boxes.split(bounds)
+
+        # Boxes outside the margins and lone short boxes are not aligned
+        invalid = margin_mask(geometry, TOP, BOTTOM, LEFT, RIGHT) | short_column_mask(geometry, labels, SHORT_COLUMN_LENGTH)
+        invalid_boxes = set(np.flatnonzero(invalid).tolist())
+        instrumentation.count("boxes_filtered", len(invalid_boxes))
+        instrumentation.count("columns", len(columns))
+
+        return character_align(columns, quoc_ngu_sentences, invalid_boxes, i)
+
+def character_align(columns, quoc_ngu_sentences, invalid_boxes, i):
+    """
+    Align the columns of one page with its Quốc Ngữ sentences.
+
+    Args:
+        columns (list): Boxes of every column in reading order, as
+                        BoxLists or lists of [points, [text, confidence]].
+        quoc_ngu_sentences (list of str): Sentences of the page.
+        invalid_boxes (set of int): Page-wide positions of the boxes not
+                                    to align.
+        i (int): Page number used in the row ids.
 
-workbook.close()  # Save the workbook
+    Returns:
+        list of AlignmentRow: One per column. A column that gets a
+                              sentence keeps only its valid boxes.
+    """
+    rows = []
+    box_index = 0
+    sentence_index = 0
+    invalid_positions = sorted(invalid_boxes)
+
+    # Pair columns and sentences, handling cases where not all columns have sentences
+    for index, column in enumerate(columns, start=1):
+        column = BoxList.from_boxes(column)
+        size = len(column)
+        start, box_index = box_index, box_index + size  # Update box index for next column
+        first = bisect.bisect_left(invalid_positions, start)
+        last = bisect.bisect_left(invalid_positions, box_index)
+
+        quoc_ngu_sentence = None
+        if sentence_index < len(quoc_ngu_sentences) and last - first < size:
+            quoc_ngu_sentence = quoc_ngu_sentences[sentence_index]
+            sentence_index += 1
+            if last > first:
+                valid = np.ones(size, dtype=bool)
+                valid[np.array(invalid_positions[first:last]) - start] = False
+                column = column[valid]
+                size = len(column)
+        rows.append((column, AlignmentRow(
+            f"ppp{i}_ss{index}",  # Unique box ID
+            i,
+            column.points if size else None,
+            column.text if size else None,
+            empty_alignment(),
+            quoc_ngu_sentence,
+        )))
+
+    # Align every column that has both SinoNom OCR and a Quốc Ngữ sentence,
+    # all of the page at once. Every character carries the confidence of
+    # its box
+    to_align = [(column, row) for column, row in rows if row.sino_nom and row.sentence]
+    results = align_columns([(row.sino_nom, row.sentence) for _, row in to_align], [column.char_confidences() for column, _ in to_align])
+    for (_, row), (aligned_result, _, path) in zip(to_align, results):
+        row.aligned, row.path = aligned_result, path
+    return [row for _, row in rows]
+
+def page_pairs(pages, box_path_prefix=BOX_PATH_PREFIX, text_path_prefix=TEXT_PATH_PREFIX, corpus_path=None, sentences_path=None):
+    """(box file, text file, page, corpus, sentences) for every page; the text of page i is on page i + 1."""
+    return [
+        (f"{box_path_prefix}{i}{BOX_PATH_SUFFIX}", f"{text_path_prefix}{i + 1}{TEXT_PATH_SUFFIX}", i, corpus_path, sentences_path)
+        for i in pages
+    ]
+
+def _process_page_pair(pair):
+    return process_single_box_text(*pair)
+
+def align_pages(pages, box_path_prefix=BOX_PATH_PREFIX, text_path_prefix=TEXT_PATH_PREFIX, workers=None, output_paths=('output.xlsx',), corpus_path=None, sentences_path=None, stats=None):
+    """
+    Align many pages on a process pool and stream them to output sinks.
+
+    Workers load the dictionaries once (on first use) and only return
+    AlignmentRows; the sinks are written here, in page order, whatever order the
+    workers finish in. Each page is handed to the sinks as soon as it and
+    all pages before it are done.
+
+    Args:
+        pages (iterable of int): Page numbers of the box files.
+        box_path_prefix (str): Prefix of the OCR response files.
+        text_path_prefix (str): Prefix of the Quốc Ngữ sentence files.
+        workers (int): Process count, None for one per CPU, 1 to run inline.
+        output_paths (list of str): Outputs; .xlsx, .jsonl, .parquet or
+                                   .sqlite (see alignment_store).
+        corpus_path (str): Compiled response corpus, read instead of the
+                           response files when given.
+        sentences_path (str): Compiled phiên âm sentences, read instead of
+                              the text files when given.
+        stats (dict): If given, receives the number of columns aligned
+                      through each of ALIGNMENT_PATHS.
+
+    Returns:
+        int: Number of rows written.
+    """
+    pairs = page_pairs(pages, box_path_prefix, text_path_prefix, corpus_path, sentences_path)
+    sinks = [open_sink(path) for path in output_paths]
+    row_count = 0
+
+    def write_page(rows):
+        with instrumentation.span("write_page", "output", page=rows[0].page if rows else None):
+            for sink in sinks:
+                sink.write_page(rows)
+        if stats is not None:
+            for row in rows:
+                if row.path:
+                    stats[row.path] = stats.get(row.path, 0) + 1
+        return len(rows)
+
+    try:
+        if workers == 1:
+            for pair in pairs:
+                row_count += write_page(_process_page_pair(pair))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # map yields results in submission order
+                for rows in executor.map(_process_page_pair, pairs):
+                    row_count += write_page(rows)
+    finally:
+        for sink in sinks:
+            sink.close()
+    return row_count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Align SinoNom OCR columns with Quốc Ngữ sentences.")
+    parser.add_argument("--start", type=int, default=6, help="first box page")
+    parser.add_argument("--end", type=int, default=66, help="last box page (inclusive)")
+    parser.add_argument("--step", type=int, default=2)
+    parser.add_argument("--box-prefix", default=BOX_PATH_PREFIX)
+    parser.add_argument("--text-prefix", default=TEXT_PATH_PREFIX)
+    parser.add_argument("--corpus", default=None, help="compiled response corpus (see response_corpus.py)")
+    parser.add_argument("--sentences", default=None, help="compiled phiên âm sentences (see phien_am_corpus.py)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--output", action="append", help="output file (.xlsx, .jsonl, .parquet or .sqlite), repeatable; default output.xlsx")
+    parser.add_argument("--page", type=int, default=None, help="align only this box page and print its rows as JSON lines")
+    args = parser.parse_args(argv)
+
+    if args.page is not None:
+        pair = page_pairs([args.page], args.box_prefix, args.text_prefix, args.corpus, args.sentences)[0]
+        for row in process_single_box_text(*pair):
+            print(json.dumps(row.to_dict(), ensure_ascii=False))
+        return
+
+    stats = {}
+    rows = align_pages(range(args.start, args.end + 1, args.step), args.box_prefix, args.text_prefix, args.workers, args.output or ['output.xlsx'], args.corpus, args.sentences, stats)
+    aligned = sum(stats.values())
+    print(f"{rows} rows, {aligned} columns aligned: " + ", ".join(f"{path} {stats.get(path, 0)}" for path in ALIGNMENT_PATHS))
+
+
+if __name__ == "__main__":
+    main()
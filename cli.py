@@ -0,0 +1,49 @@
+import argparse
+import importlib
+
+# Command -> (module whose main() runs it, help). Modules are only imported
+# when their command runs, so e.g. "align --page" never loads cv2, fitz,
+# aiohttp or xlsxwriter
+COMMANDS = {
+    "scan": ("pdf_scanner", "scan a PDF once for phiên âm pages, their text and their images"),
+    "sentences": ("phien_am_corpus", "compile the phiên âm sentences of a scanned PDF"),
+    "preprocess": ("image_pre_process", "preprocess page images for OCR"),
+    "ocr": ("ocr_client", "OCR the processed images through the SinoNom API"),
+    "ocr-stub": ("ocr_stub_server", "serve recorded OCR responses with injected failures"),
+    "responses": ("response_corpus", "compile OCR response files into one corpus file"),
+    "align": ("char_align", "align OCR columns with Quốc Ngữ sentences (--page N for one page)"),
+    "update": ("incremental_align", "re-align the stored columns a dictionary change affects"),
+    "store": ("alignment_store", "query or export the SQLite alignment store"),
+    "serve": ("alignment_service", "serve character alignment over HTTP"),
+    "client": ("alignment_client", "query or load-test the alignment service"),
+    "pipeline": ("pipeline", "run every stage, redoing only out-of-date pages"),
+    "benchmark": ("benchmark", "time the alignment, layout and preprocessing entry points"),
+    "profile": ("instrumentation", "turn a NOM_TRACE_DIR recording into a summary and a Chrome trace"),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run one stage of the SinoNom / Quốc Ngữ alignment.",
+        epilog="\n".join(f"  {command:<11} {help}" for command, (_, help) in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--profile", metavar="PREFIX", default=None,
+                        help="record spans and counters of the command, written to PREFIX.json and PREFIX.trace.json")
+    parser.add_argument("command", choices=COMMANDS, metavar="command", help="one of the commands below; its own --help lists its options")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    module_name, _ = COMMANDS[args.command]
+    module = importlib.import_module(module_name)
+    if args.profile is None:
+        return module.main(args.args)
+
+    import instrumentation
+
+    with instrumentation.profile(f"{args.profile}.json", f"{args.profile}.trace.json"):
+        return module.main(args.args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from image_pre_process import COLUMN_MODES, INPUT_IMAGES_DIR, prepare_gray_image
+
+
+def ruler_centres(line_positions, tolerance):
+    """Collapse line positions closer than tolerance into one ruler each."""
+    xs = np.unique([pos[0] for pos in line_positions]).astype(np.int64)
+    if len(xs) == 0:
+        return xs
+    starts = np.ones(len(xs), dtype=bool)
+    starts[1:] = np.diff(xs) > tolerance
+    first = np.flatnonzero(starts)
+    last = np.append(first[1:] - 1, len(xs) - 1)
+    return (xs[first] + xs[last]) // 2
+
+
+def match_rulers(reference, candidate, tolerance):
+    """Greedy one-to-one matching of sorted ruler centres within tolerance."""
+    matched = 0
+    i = j = 0
+    while i < len(reference) and j < len(candidate):
+        if abs(int(reference[i]) - int(candidate[j])) <= tolerance:
+            matched += 1
+            i += 1
+            j += 1
+        elif reference[i] < candidate[j]:
+            i += 1
+        else:
+            j += 1
+    return matched
+
+
+def compare(input_dir=INPUT_IMAGES_DIR, tolerance=5, repeat=3, limit=None):
+    """
+    Run both column detectors on every page image and compare the rulers.
+
+    The Hough path is the reference. Its raw positions include several
+    segments per ruler, so both sides are first collapsed to ruler centres.
+    Timings cover the detector only, best of repeat runs, on the same
+    downscaled grayscale image process_image uses.
+
+    Returns:
+        dict: Per-page results and totals.
+    """
+    file_names = sorted(name for name in os.listdir(input_dir) if name.endswith(".jpeg"))
+    if limit:
+        file_names = file_names[:limit]
+
+    pages = []
+    for file_name in file_names:
+        gray_image = prepare_gray_image(cv2.imread(os.path.join(input_dir, file_name)))
+        page = {"image": file_name}
+        rulers = {}
+        for mode, find_lines in COLUMN_MODES.items():
+            best = float("inf")
+            for _ in range(repeat):
+                started = time.perf_counter()
+                line_positions, _ = find_lines(gray_image)
+                best = min(best, time.perf_counter() - started)
+            rulers[mode] = ruler_centres(line_positions, tolerance)
+            page[mode] = {"rulers": rulers[mode].tolist(), "seconds": best}
+        page["matched"] = match_rulers(rulers["hough"], rulers["projection"], tolerance)
+        pages.append(page)
+
+    hough_rulers = sum(len(page["hough"]["rulers"]) for page in pages)
+    projection_rulers = sum(len(page["projection"]["rulers"]) for page in pages)
+    matched = sum(page["matched"] for page in pages)
+    hough_seconds = sum(page["hough"]["seconds"] for page in pages)
+    projection_seconds = sum(page["projection"]["seconds"] for page in pages)
+    return {
+        "pages": pages,
+        "tolerance": tolerance,
+        "hough_rulers": hough_rulers,
+        "projection_rulers": projection_rulers,
+        "matched": matched,
+        "recall": matched / hough_rulers if hough_rulers else 1.0,
+        "precision": matched / projection_rulers if projection_rulers else 1.0,
+        "identical_pages": sum(page["hough"]["rulers"] == page["projection"]["rulers"] for page in pages),
+        "same_count_pages": sum(len(page["hough"]["rulers"]) == len(page["projection"]["rulers"]) == page["matched"] for page in pages),
+        "hough_seconds": hough_seconds,
+        "projection_seconds": projection_seconds,
+        "speedup": hough_seconds / projection_seconds if projection_seconds else float("inf"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the Hough and projection column detectors.")
+    parser.add_argument("--input-dir", default=INPUT_IMAGES_DIR)
+    parser.add_argument("--tolerance", type=int, default=5, help="pixels, at the processing scale")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--json", default=None, help="write the full report here")
+    parser.add_argument("--verbose", action="store_true", help="list pages that disagree")
+    args = parser.parse_args(argv)
+
+    report = compare(args.input_dir, args.tolerance, args.repeat, args.limit)
+    if args.verbose:
+        for page in report["pages"]:
+            if page["matched"] != len(page["hough"]["rulers"]) or page["matched"] != len(page["projection"]["rulers"]):
+                print(f"{page['image']}: hough {page['hough']['rulers']} projection {page['projection']['rulers']}")
+    print(f"{len(report['pages'])} pages, {report['same_count_pages']} with all rulers matched")
+    print(f"rulers: hough {report['hough_rulers']}, projection {report['projection_rulers']}, matched {report['matched']}")
+    print(f"recall {report['recall']:.3f}, precision {report['precision']:.3f}")
+    print(f"detector time: hough {report['hough_seconds']:.2f}s, projection {report['projection_seconds']:.2f}s, {report['speedup']:.1f}x faster")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
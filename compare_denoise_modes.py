@@ -0,0 +1,178 @@
+import argparse
+import difflib
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from image_pre_process import INPUT_IMAGES_DIR, RESPONSE_DIR, prepare_gray_image, process_gray_image
+from response_corpus import parse_response
+
+REFERENCE_DIR = "all_processed_images"
+
+
+def read_response(response_dir, file_name):
+    """Items of the recorded OCR response of an image, None if there is none."""
+    path = os.path.join(response_dir, os.path.splitext(file_name)[0] + ".txt")
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as file:
+        return parse_response(file.read())[1]
+
+
+def changed_boxes(items, changed):
+    """Response items whose box holds at least one changed pixel."""
+    height, width = changed.shape
+    boxes = []
+    for item in items:
+        points = np.array(item["points"])
+        left, top = np.maximum(np.floor(points.min(axis=0)).astype(int), 0)
+        right, bottom = np.ceil(points.max(axis=0)).astype(int) + 1
+        if changed[top:min(bottom, height), left:min(right, width)].any():
+            boxes.append(item)
+    return boxes
+
+
+def ocr_diff(reference_items, candidate_items):
+    """
+    Text differences between two OCR responses of a page.
+
+    Boxes are compared in reading order (right to left, top to bottom) as
+    one string per page.
+
+    Returns:
+        dict: {"boxes": (reference, candidate) counts, "ratio": similarity
+              of the page texts, "changes": [(reference text, candidate
+              text)] of every differing stretch}.
+    """
+    def page_text(items):
+        ordered = sorted(items, key=lambda item: (-item["points"][0][0], item["points"][0][1]))
+        return "".join(item["text"] for item in ordered)
+
+    reference, candidate = page_text(reference_items), page_text(candidate_items)
+    matcher = difflib.SequenceMatcher(None, reference, candidate, autojunk=False)
+    changes = [(reference[i1:i2], candidate[j1:j2]) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+    return {"boxes": (len(reference_items), len(candidate_items)), "ratio": matcher.ratio(), "changes": changes}
+
+
+def compare(input_dir=INPUT_IMAGES_DIR, reference_dir=REFERENCE_DIR, response_dir=RESPONSE_DIR, candidate_response_dir=None,
+            output_dir=None, column_mode=None, repeat=1, limit=None):
+    """
+    Run both denoise modes on every page image and diff the results.
+
+    The "full" mode is the reference. Each page is compared three ways:
+    the two modes pixel by pixel, the encoded "regions" image with the
+    processed image of reference_dir (byte for byte and, after decoding,
+    pixel by pixel), and the OCR boxes of the recorded response that cover
+    a changed pixel, i.e. the boxes whose text could change. With
+    candidate_response_dir, which holds OCR responses of the images
+    written to output_dir, the recorded and candidate texts are diffed
+    too. Timings cover process_gray_image, best of repeat runs.
+
+    Returns:
+        dict: Per-page results and totals.
+    """
+    file_names = sorted(name for name in os.listdir(input_dir) if name.endswith(".jpeg"))
+    if limit:
+        file_names = file_names[:limit]
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    pages = []
+    for file_name in file_names:
+        gray_image = prepare_gray_image(cv2.imread(os.path.join(input_dir, file_name)))
+        page = {"image": file_name}
+        images = {}
+        for mode in ("full", "regions"):
+            best = float("inf")
+            for _ in range(repeat):
+                started = time.perf_counter()
+                images[mode] = process_gray_image(gray_image, column_mode, mode)
+                best = min(best, time.perf_counter() - started)
+            page[f"{mode}_seconds"] = best
+        page["pixels"] = images["full"].size
+        page["mode_diff_pixels"] = int(np.count_nonzero(images["full"] != images["regions"]))
+
+        encoded = cv2.imencode(os.path.splitext(file_name)[1], images["regions"])[1].tobytes()
+        if output_dir:
+            with open(os.path.join(output_dir, file_name), 'wb') as file:
+                file.write(encoded)
+        reference_path = os.path.join(reference_dir, file_name)
+        if os.path.exists(reference_path):
+            with open(reference_path, 'rb') as file:
+                reference_bytes = file.read()
+            reference = cv2.imdecode(np.frombuffer(reference_bytes, np.uint8), cv2.IMREAD_UNCHANGED)
+            page["reference_identical"] = encoded == reference_bytes
+            if reference.shape == images["regions"].shape:
+                changed = cv2.imdecode(np.frombuffer(encoded, np.uint8), cv2.IMREAD_UNCHANGED) != reference
+            else:
+                changed = np.ones(images["regions"].shape, dtype=bool)
+            page["reference_diff_pixels"] = int(np.count_nonzero(changed))
+            items = read_response(response_dir, file_name)
+            if items is not None:
+                page["ocr_boxes"] = len(items)
+                page["ocr_boxes_changed"] = [item["text"] for item in changed_boxes(items, changed)]
+                candidate_items = read_response(candidate_response_dir, file_name) if candidate_response_dir else None
+                if candidate_items is not None:
+                    page["ocr_diff"] = ocr_diff(items, candidate_items)
+        pages.append(page)
+
+    full_seconds = sum(page["full_seconds"] for page in pages)
+    regions_seconds = sum(page["regions_seconds"] for page in pages)
+    referenced = [page for page in pages if "reference_identical" in page]
+    ocr_diffed = [page for page in pages if "ocr_diff" in page]
+    return {
+        "pages": pages,
+        "identical_pages": sum(page["mode_diff_pixels"] == 0 for page in pages),
+        "mode_diff_pixels": sum(page["mode_diff_pixels"] for page in pages),
+        "referenced_pages": len(referenced),
+        "reference_identical_pages": sum(page["reference_identical"] for page in referenced),
+        "reference_diff_pixels": sum(page["reference_diff_pixels"] for page in referenced),
+        "ocr_boxes": sum(page.get("ocr_boxes", 0) for page in pages),
+        "ocr_boxes_changed": sum(len(page.get("ocr_boxes_changed", ())) for page in pages),
+        "ocr_diffed_pages": len(ocr_diffed),
+        "ocr_changed_pages": sum(bool(page["ocr_diff"]["changes"]) for page in ocr_diffed),
+        "full_seconds": full_seconds,
+        "regions_seconds": regions_seconds,
+        "speedup": full_seconds / regions_seconds if regions_seconds else float("inf"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the full and region-restricted denoise modes.")
+    parser.add_argument("--input-dir", default=INPUT_IMAGES_DIR)
+    parser.add_argument("--reference-dir", default=REFERENCE_DIR, help="processed images of the current pipeline")
+    parser.add_argument("--response-dir", default=RESPONSE_DIR, help="OCR responses of the reference images")
+    parser.add_argument("--output-dir", default=None, help="write the regions images here, e.g. to OCR them")
+    parser.add_argument("--candidate-response-dir", default=None, help="OCR responses of the images in --output-dir")
+    parser.add_argument("--column-mode", default=None)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--json", default=None, help="write the full report here")
+    parser.add_argument("--verbose", action="store_true", help="list pages that differ")
+    args = parser.parse_args(argv)
+
+    report = compare(args.input_dir, args.reference_dir, args.response_dir, args.candidate_response_dir,
+                     args.output_dir, args.column_mode, args.repeat, args.limit)
+    if args.verbose:
+        for page in report["pages"]:
+            if page["mode_diff_pixels"] or page.get("reference_diff_pixels") or page.get("ocr_boxes_changed"):
+                print(f"{page['image']}: {page['mode_diff_pixels']} pixels differ between modes, "
+                      f"{page.get('reference_diff_pixels', '-')} from the reference, boxes affected {page.get('ocr_boxes_changed', [])}")
+            if page.get("ocr_diff", {}).get("changes"):
+                print(f"{page['image']}: OCR {page['ocr_diff']['changes']}")
+    print(f"{len(report['pages'])} pages, {report['identical_pages']} identical in both modes ({report['mode_diff_pixels']} pixels differ)")
+    print(f"reference: {report['reference_identical_pages']} of {report['referenced_pages']} byte-identical, {report['reference_diff_pixels']} pixels differ")
+    print(f"OCR boxes over changed pixels: {report['ocr_boxes_changed']} of {report['ocr_boxes']}")
+    if report["ocr_diffed_pages"]:
+        print(f"OCR text: {report['ocr_changed_pages']} of {report['ocr_diffed_pages']} pages differ")
+    print(f"process time: full {report['full_seconds']:.2f}s, regions {report['regions_seconds']:.2f}s, {report['speedup']:.1f}x faster")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
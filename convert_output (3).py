@@ -1,27 +1,25 @@
 import json
-import xlsxwriter
 from collections import defaultdict
-import pandas as pd
-import ast
 import numpy as np
-from extract_phien_am import *
-quoc_ngu_df = pd.read_excel('QuocNgu_SinoNom_Dic.xlsx')
-sino_nom_df = pd.read_excel('SinoNom_similar_Dic.xlsx')
-sino_nom_df['Top 20 Similar Characters'] = sino_nom_df['Top 20 Similar Characters'].apply(ast.literal_eval)
-def get_all_sino_nom_from_quoc_ngu(df, quoc_ngu):
+from response_corpus import parse_response
+from similarity_index import NO_MATCH_COST, load_similarity_index
+def get_all_sino_nom_from_quoc_ngu(dictionary, quoc_ngu):
     quoc_ngu = quoc_ngu.lower()
-    return df[df['QuocNgu'] == quoc_ngu]['SinoNom'].tolist()
-def get_similar_sino_nom_from_sino_nom(df, sino_nom):
+    return list(dictionary.quoc_ngu_to_sino_nom_dict.get(quoc_ngu, []))
+def get_similar_sino_nom_from_sino_nom(dictionary, sino_nom):
     sino_nom = sino_nom.lower()
-    values = np.array(df[df['Input Character'] == sino_nom]['Top 20 Similar Characters'].values.tolist()).reshape(-1)
+    values = np.array(dictionary.sino_nom_similar_dict.get(sino_nom, [])).reshape(-1)
     return values
 def get_intersection(sino_nom, quoc_ngu):
-    set1 = set(get_similar_sino_nom_from_sino_nom(sino_nom_df, sino_nom))
+    dictionary = load_similarity_index().dictionary
+    set1 = set(get_similar_sino_nom_from_sino_nom(dictionary, sino_nom))
     set1.add(sino_nom)
-    set2 = set(get_all_sino_nom_from_quoc_ngu(quoc_ngu_df, quoc_ngu))
+    set2 = set(get_all_sino_nom_from_quoc_ngu(dictionary, quoc_ngu))
     return set1.intersection(set2)
 def is_match(sino_nom, quoc_ngu):
-    return len(get_intersection(sino_nom, quoc_ngu)) > 0
+    # Same decision char_align makes: exact or similar-character match
+    cost, _ = load_similarity_index().lookup(sino_nom, quoc_ngu)
+    return cost < NO_MATCH_COST
 def align_strings(sino_nom_string, quoc_ngu_string):
     quoc_ngu_string = quoc_ngu_string.split()
     m, n = len(sino_nom_string), len(quoc_ngu_string)
@@ -67,24 +65,17 @@ def align_strings(sino_nom_string, quoc_ngu_string):
 def read_response_file(file_path):
     try:
         with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-            image_name = content[:content.index('[')]
-            image_name = image_name.strip()
-        try:
-            start_index = content.index('[')
-            json_data = json.loads(content[start_index:])
-            return image_name, json_data
-        except Exception as e:
-            print("Error parsing JSON from text file:", e)
-            exit()
-    except UnicodeDecodeError as e:
-        print(f"Encoding error: {e}")
+            return parse_response(file.read())
+    except (ValueError, UnicodeDecodeError) as e:
+        # Corrupt responses are reported, not fatal
+        print(f"Error parsing {file_path}: {e}")
         return None
 
 
-image_name, json_data = read_response_file('response/thanh_giao_yeu_ly_image_3.txt')
-output_array = [
-    [item["text"], item["confidence"], item["points"]]
-    for item in json_data
-]
+if __name__ == "__main__":
+    image_name, json_data = read_response_file('response/thanh_giao_yeu_ly_image_3.txt')
+    output_array = [
+        [item["text"], item["confidence"], item["points"]]
+        for item in json_data
+    ]
 
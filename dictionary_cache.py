@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import shutil
+from ast import literal_eval
+from collections.abc import Mapping
+
+import numpy as np
+
+import instrumentation
+from array_store import read_array_file, read_array_header, write_array_file
+
+QUOC_NGU_DIC_PATH = "QuocNgu_SinoNom_Dic.xlsx"
+SIMILAR_DIC_PATH = "SinoNom_similar_Dic.xlsx"
+CACHE_PATH = "dictionary_cache.bin"
+
+FORMAT_VERSION = 1
+
+# Earlier compiled dictionaries, one file per version, kept next to the
+# cache for incremental_align to diff against
+SNAPSHOT_DIR = "dictionary_snapshots"
+
+_loaded = {}
+
+
+def source_fingerprint(path):
+    """Size and SHA-1 of a source spreadsheet, or None if it is missing."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as file:
+        content = file.read()
+    return {'size': len(content), 'sha1': hashlib.sha1(content).hexdigest()}
+
+
+def snapshot_path(key, cache_path=CACHE_PATH):
+    """Path of the snapshot named key, in the snapshot directory of cache_path."""
+    return os.path.join(os.path.dirname(os.path.abspath(cache_path)), SNAPSHOT_DIR, f"{key}.bin")
+
+
+def keep_snapshot(path, cache_path=CACHE_PATH):
+    """
+    Keep a copy of a compiled dictionary file, once per version.
+
+    Snapshots are named by the digest of the file's meta (format version
+    and source fingerprints), so every store aligned with one version
+    shares a single copy.
+
+    Args:
+        path (str): Compiled dictionary to keep, e.g. the cache itself.
+        cache_path (str): Cache whose snapshot directory is used.
+
+    Returns:
+        dict: {"sources": source fingerprints, "snapshot": snapshot key}.
+    """
+    meta = read_array_header(path)['meta']
+    key = hashlib.sha1(json.dumps(meta, sort_keys=True).encode('utf-8')).hexdigest()
+    target = snapshot_path(key, cache_path)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.tmp"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, target)
+    return {"sources": meta['sources'], "snapshot": key}
+
+
+def _pack_strings(strings):
+    # NUL separated UTF-8, decoded in one call on load
+    return np.frombuffer('\0'.join(strings).encode('utf-8'), dtype=np.uint8)
+
+
+def _unpack_strings(buffer):
+    if len(buffer) == 0:
+        return []
+    return bytes(buffer).decode('utf-8').split('\0')
+
+
+def _csr(groups, ids):
+    indptr = np.zeros(len(groups) + 1, dtype=np.int32)
+    indptr[1:] = np.cumsum([len(group) for group in groups])
+    indices = np.fromiter((ids[item] for group in groups for item in group), dtype=np.int32, count=int(indptr[-1]))
+    return indptr, indices
+
+
+def compile_dictionaries(quoc_ngu_path=QUOC_NGU_DIC_PATH, similar_path=SIMILAR_DIC_PATH, cache_path=CACHE_PATH):
+    """
+    Compile both dictionary spreadsheets into a memory-mappable cache file.
+
+    Characters and Quốc Ngữ readings are interned to integer IDs (their
+    position in a sorted table). The similar-character lists and the
+    reading-to-SinoNom sets are stored as CSR arrays over those IDs, keeping
+    the spreadsheet order of every list.
+
+    Args:
+        quoc_ngu_path (str): QuocNgu_SinoNom_Dic.xlsx path.
+        similar_path (str): SinoNom_similar_Dic.xlsx path.
+        cache_path (str): Output file.
+    """
+    import pandas as pd
+
+    with instrumentation.span("read_excel", "dictionary", path=quoc_ngu_path):
+        quoc_ngu_sino_nom_df = pd.read_excel(quoc_ngu_path)
+    with instrumentation.span("read_excel", "dictionary", path=similar_path):
+        sino_nom_similar_df = pd.read_excel(similar_path)
+
+    similar_lists = {}
+    for root_char, similar_chars in zip(sino_nom_similar_df['Input Character'], sino_nom_similar_df['Top 20 Similar Characters']):
+        similar_lists[root_char] = list(literal_eval(similar_chars))
+
+    reading_lists = {}
+    for quoc_ngu_char, sino_nom_char in zip(quoc_ngu_sino_nom_df['QuocNgu'], quoc_ngu_sino_nom_df['SinoNom']):
+        # Empty cells come back as NaN and can never be looked up
+        if not isinstance(quoc_ngu_char, str):
+            continue
+        members = reading_lists.setdefault(quoc_ngu_char, [])
+        if sino_nom_char not in members:
+            members.append(sino_nom_char)
+
+    chars = set(similar_lists)
+    for group in similar_lists.values():
+        chars.update(group)
+    for group in reading_lists.values():
+        chars.update(group)
+    chars = sorted(chars)
+    char_ids = {char: index for index, char in enumerate(chars)}
+    readings = sorted(reading_lists)
+
+    similar_indptr, similar_indices = _csr([similar_lists.get(char, []) for char in chars], char_ids)
+    reading_indptr, reading_indices = _csr([reading_lists[reading] for reading in readings], char_ids)
+
+    meta = {
+        'version': FORMAT_VERSION,
+        'sources': {
+            'quoc_ngu': source_fingerprint(quoc_ngu_path),
+            'similar': source_fingerprint(similar_path),
+        },
+    }
+    write_array_file(cache_path, {
+        'chars': _pack_strings(chars),
+        'readings': _pack_strings(readings),
+        'similar_indptr': similar_indptr,
+        'similar_indices': similar_indices,
+        'reading_indptr': reading_indptr,
+        'reading_indices': reading_indices,
+    }, meta)
+
+
+def is_cache_fresh(quoc_ngu_path=QUOC_NGU_DIC_PATH, similar_path=SIMILAR_DIC_PATH, cache_path=CACHE_PATH):
+    """
+    Check whether the cache file was compiled from the current spreadsheets.
+
+    A missing spreadsheet is not treated as a change, so a deployed cache
+    keeps working without the sources next to it.
+    """
+    if not os.path.exists(cache_path):
+        return False
+    try:
+        meta = read_array_header(cache_path)['meta']
+    except (OSError, ValueError):
+        return False
+    if meta.get('version') != FORMAT_VERSION:
+        return False
+    for key, path in (('quoc_ngu', quoc_ngu_path), ('similar', similar_path)):
+        fingerprint = source_fingerprint(path)
+        if fingerprint is not None and fingerprint != meta['sources'].get(key):
+            return False
+    return True
+
+
+def load_dictionaries(quoc_ngu_path=QUOC_NGU_DIC_PATH, similar_path=SIMILAR_DIC_PATH, cache_path=CACHE_PATH):
+    """
+    Load the compiled dictionaries, recompiling them if the sources changed.
+
+    The result is memoized per process, so workers only pay for it once.
+
+    Returns:
+        CompiledDictionary: Memory-mapped dictionaries.
+    """
+    key = (os.path.abspath(quoc_ngu_path), os.path.abspath(similar_path), os.path.abspath(cache_path))
+    if key not in _loaded:
+        if not is_cache_fresh(quoc_ngu_path, similar_path, cache_path):
+            compile_dictionaries(quoc_ngu_path, similar_path, cache_path)
+        _loaded[key] = CompiledDictionary(cache_path)
+    return _loaded[key]
+
+
+class CompiledDictionary:
+    """Read-only view over a compiled dictionary cache file."""
+
+    def __init__(self, cache_path):
+        self.meta, arrays = read_array_file(cache_path)
+        self.chars = _unpack_strings(arrays['chars'])
+        self.readings = _unpack_strings(arrays['readings'])
+        self.char_ids = {char: index for index, char in enumerate(self.chars)}
+        self.reading_ids = {reading: index for index, reading in enumerate(self.readings)}
+        self.similar_indptr = arrays['similar_indptr']
+        self.similar_indices = arrays['similar_indices']
+        self.reading_indptr = arrays['reading_indptr']
+        self.reading_indices = arrays['reading_indices']
+
+        # Drop-in replacements for the dicts char_align used to build
+        self.sino_nom_similar_dict = _CsrMapping(self.char_ids, self.similar_indptr, self.similar_indices, self.chars, list)
+        self.quoc_ngu_to_sino_nom_dict = _CsrMapping(self.reading_ids, self.reading_indptr, self.reading_indices, self.chars, set)
+
+
+class _CsrMapping(Mapping):
+    """Mapping from a key to the decoded members of its CSR row."""
+
+    def __init__(self, key_ids, indptr, indices, values, container):
+        self._key_ids = key_ids
+        self._indptr = indptr
+        self._indices = indices
+        self._values = values
+        self._container = container
+        self._decoded = {}
+
+    def __getitem__(self, key):
+        if key in self._decoded:
+            return self._decoded[key]
+        index = self._key_ids.get(key) if isinstance(key, str) else None
+        if index is None:
+            raise KeyError(key)
+        start, end = self._indptr[index], self._indptr[index + 1]
+        if start == end:
+            raise KeyError(key)
+        members = self._container(self._values[member] for member in self._indices[start:end].tolist())
+        self._decoded[key] = members
+        return members
+
+    def __iter__(self):
+        for key, index in self._key_ids.items():
+            if self._indptr[index + 1] > self._indptr[index]:
+                yield key
+
+    def __len__(self):
+        return int(np.count_nonzero(np.diff(self._indptr)))
@@ -1,17 +1,18 @@
-from extract_phien_am import *
-from extract_image import *
-from image_pre_process import *
+from extract_image import output_images_dir
+from image_pre_process import process_pdf_images
+from pdf_scanner import scan_pdf
 pdf_path = "thanh_giao_yeu_ly.pdf"
 output_txt_file = "phien_am_pages.txt"
-phien_am_pages = []
 
+# Set KEEP_RAW_EXTRACTS to also fill extracted_images
+KEEP_RAW_EXTRACTS = False
 
-pdf_document = fitz.open(pdf_path)
-total_pages = get_total_pages(pdf_document)
-for i in range(get_total_pages(pdf_document)):
-    if is_phien_am_page(pdf_document, i):
-        phien_am_pages.append(i)
-extract_images_from_pdf(pdf_path, phien_am_pages)
+if __name__ == "__main__":
+    # One pass over the PDF finds the phiên âm pages, their text spans and
+    # their images; later stages read pdf_manifest.json instead
+    scan = scan_pdf(pdf_path, image_dir=None)
+    phien_am_pages = scan["phien_am_pages"]
 
-pdf_document.close()
-        
+    # Preprocess the page images straight from the PDF; pages already OCRed
+    # are skipped
+    process_pdf_images(pdf_path, phien_am_pages, raw_dir=output_images_dir if KEEP_RAW_EXTRACTS else None, scan=scan)
@@ -1,9 +1,10 @@
-import fitz
 import os
 output_images_dir = "extracted_images"
-os.makedirs(output_images_dir, exist_ok=True)
 
 def extract_images_from_pdf(pdf_path, phien_am_pages):
+    import fitz
+
+    os.makedirs(output_images_dir, exist_ok=True)
     file_name = os.path.splitext(os.path.basename(pdf_path))[0]
     pdf_document = fitz.open(pdf_path)
     image_filenames = []
@@ -21,4 +22,4 @@ def extract_images_from_pdf(pdf_path, phien_am_pages):
             image_filenames.append(image_filename)
             image_path = os.path.join(output_images_dir, image_filename)
             with open(image_path, "wb") as img_file:
-                img_file.write(image_bytes)   
\ No newline at end of file
+                img_file.write(image_bytes)
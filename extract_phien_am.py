@@ -1,4 +1,3 @@
-import fitz
 import string
 import re
 def get_total_pages(pdf_document):
@@ -14,12 +13,9 @@ def is_phien_am_page(pdf_document, page_number, min_length_threshold=100):
     current_page = pdf_document[page_number]
     text = current_page.get_text()
     return len(''.join(text.split("\n"))) > min_length_threshold
-def get_phien_am_sentences(pdf_document, page_number):
-    drop_parts = ['chú thích', 'phiên dịch', 'dịch nghĩa']
-    special_pages = [4]
-    page = pdf_document[page_number]
-    text_data = page.get_text("dict")
-    sorted_text = []
+def collect_spans(text_data):
+    """(bbox, text) of every non-empty span of a page.get_text("dict") result."""
+    spans = []
     for block in text_data.get("blocks", []):
         if "lines" not in block:
             continue
@@ -28,36 +24,66 @@ def get_phien_am_sentences(pdf_document, page_number):
                 bbox = span.get("bbox", None)
                 content = span.get("text", "")
                 if bbox and content:
-                    sorted_text.append((bbox, content))
-    sorted_text = sorted(sorted_text, key=lambda x: (x[0][1], x[0][0]))
-    sorted_content = "".join([text[1] for text in sorted_text])
-    raw_sentences = sorted_content.split("\uf022")
-    raw_sentences = raw_sentences[1:]
-    processed_sentences = []
-    for sentence in raw_sentences:
-        if "\n" in sentence:
-            last_newline_index = sentence.rindex("\n")
-            sentence = sentence[:last_newline_index]
-
-        for part in drop_parts:
-            if part in sentence.lower():
-                part_index = sentence.lower().index(part)
-                sentence = sentence[:part_index]
-        if page_number in special_pages:
-            sentence = re.sub(r"\s*\([^()]*\)\s*", " ", sentence)
-            while re.search(r"\([^()]*\)", sentence):
-                sentence = re.sub(r"\([^()]*\)", " ", sentence)
-            sentence = re.sub(r"\s+", " ", sentence).strip()
-        translation_table = str.maketrans(string.punctuation, ' ' * len(string.punctuation))
-        sentence = sentence.translate(translation_table)
-        sentence = re.sub(r'\d+', '', sentence)
-        sentence = sentence.replace("\n", " ").replace("\t", " ").replace("-", " ")
-        sentence = " ".join(sentence.split())
-        processed_sentences.append(sentence)
-    return processed_sentences
-
+                    spans.append((bbox, content))
+    return spans
+# Sentence normalization, compiled once
+DROP_PARTS = ['chú thích', 'phiên dịch', 'dịch nghĩa']
+SPECIAL_PAGES = [4]
+_DROP_PARTS = re.compile("|".join(re.escape(part) for part in DROP_PARTS))
+_SPACED_PARENTHESES = re.compile(r"\s*\([^()]*\)\s*")
+_PARENTHESES = re.compile(r"\([^()]*\)")
+_DIGITS = re.compile(r"\d+")
+_PUNCTUATION_TABLE = str.maketrans(string.punctuation, ' ' * len(string.punctuation))
+def normalize_sentence(sentence, special=False):
+    """
+    Clean one raw phiên âm sentence into space separated syllables.
 
+    Args:
+        sentence (str): Text between two sentence markers.
+        special (bool): Also drop parenthesized notes, for SPECIAL_PAGES.
+    """
+    last_newline_index = sentence.rfind("\n")
+    if last_newline_index != -1:
+        sentence = sentence[:last_newline_index]
 
+    # Cut at the first marker. Searching the lowered text is only safe when
+    # lowering keeps the length, otherwise cut marker by marker
+    lowered = sentence.lower()
+    if len(lowered) == len(sentence):
+        match = _DROP_PARTS.search(lowered)
+        if match:
+            sentence = sentence[:match.start()]
+    else:
+        for part in DROP_PARTS:
+            if part in sentence.lower():
+                sentence = sentence[:sentence.lower().index(part)]
 
+    if special:
+        sentence = _SPACED_PARENTHESES.sub(" ", sentence)
+        while _PARENTHESES.search(sentence):
+            sentence = _PARENTHESES.sub(" ", sentence)
+    # Punctuation (including "-") becomes a space; split() takes care of
+    # newlines, tabs and repeated whitespace
+    sentence = _DIGITS.sub('', sentence.translate(_PUNCTUATION_TABLE))
+    return " ".join(sentence.split())
+def sentences_from_spans(spans, page_number):
+    """
+    Phiên âm sentences of a page from its (bbox, text) spans.
 
+    Args:
+        spans (list): Spans as collect_spans returns them.
+        page_number (int): Page number, for SPECIAL_PAGES.
 
+    Returns:
+        list of str: Normalized sentences.
+    """
+    sorted_text = sorted(spans, key=lambda x: (x[0][1], x[0][0]))
+    sorted_content = "".join([text[1] for text in sorted_text])
+    raw_sentences = sorted_content.split("\uf022")
+    raw_sentences = raw_sentences[1:]
+    special = page_number in SPECIAL_PAGES
+    return [normalize_sentence(sentence, special) for sentence in raw_sentences]
+def get_phien_am_sentences(pdf_document, page_number):
+    page = pdf_document[page_number]
+    text_data = page.get_text("dict")
+    return sentences_from_spans(collect_spans(text_data), page_number)
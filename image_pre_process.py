@@ -1,13 +1,46 @@
-import cv2
 import numpy as np
 import os
+import argparse
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import instrumentation
+
+INPUT_IMAGES_DIR = "extracted_images"
+OUTPUT_IMAGES_DIR = "processed_images"
+RESPONSE_DIR = "response"
+MANIFEST_PATH = "preprocess_manifest.json"
+
+# Everything that changes the processed image; part of the manifest key
+PARAMETERS = {
+    "scale": 1 / 3,
+    "canny": [50, 150, 3],
+    "hough": {"threshold": 100, "min_line_length": 50, "max_line_gap": 3},
+    "column_mode": "hough",
+    "projection": {"min_line_length": 80, "max_line_gap": 3, "merge_distance": 3},
+    "denoise": [30, 7, 21],
+    "open_kernel": [1, 2],
+    "close_kernel": [7, 7],
+}
+
+# How handle_cropped_image denoises, see DENOISE_MODES. Not part of the
+# manifest key: both modes give the same image
+DENOISE_MODE = "full"
+
+def clean_column_full(cropped_image):
+    """Binarize, denoise and mask one column strip, denoising all of it."""
+    import cv2
 
-def handle_cropped_image(cropped_image):
     gray_image = cropped_image
     _, thresh = cv2.threshold(gray_image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    cleaned_image = cv2.fastNlMeansDenoising(thresh, None, 30, 7, 21)
-    closed_kernal = np.ones((7, 7), np.uint8)
-    open_kernal = np.ones((1, 2), np.uint8)
+    h, template_window, search_window = PARAMETERS["denoise"]
+    with instrumentation.span("denoise", "preprocess", width=int(thresh.shape[1])):
+        cleaned_image = cv2.fastNlMeansDenoising(thresh, None, h, template_window, search_window)
+    closed_kernal = np.ones(PARAMETERS["close_kernel"], np.uint8)
+    open_kernal = np.ones(PARAMETERS["open_kernel"], np.uint8)
     opened_image = cv2.morphologyEx(cleaned_image, cv2.MORPH_OPEN, open_kernal)
     closed_image = cv2.morphologyEx(opened_image, cv2.MORPH_CLOSE, closed_kernal)
     (cnt, hierarchy) = cv2.findContours(closed_image.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -22,20 +55,154 @@ def handle_cropped_image(cropped_image):
     masked_image = cv2.bitwise_not(masked_image)
     return masked_image
 
-def process_image(image_path):
-    original_image = cv2.imread(image_path)
-    scale = 1 / 3
-    width = int(original_image.shape[1] * scale) 
-    height = int(original_image.shape[0] * scale) 
-    dim = (width, height)
-    original_image = cv2.resize(original_image, dim, interpolation=cv2.INTER_AREA)
-    gray_image = cv2.cvtColor(original_image, cv2.COLOR_BGR2GRAY)
-    average_intensity = np.mean(gray_image)
-    if average_intensity > 127:
-        gray_image = cv2.bitwise_not(gray_image)
-    edges = cv2.Canny(gray_image, 50, 150, apertureSize=3)
+# Smallest contour box, in pixels, that survives into the column mask
+MIN_BOX_SIZE = 5
+
+_buffers = threading.local()
+
+def _buffer(name, shape):
+    """
+    A scratch uint8 array of shape, reused by the calling worker.
+
+    One flat array per name is kept per thread and grown as needed, so a
+    worker allocates its buffers once instead of once per strip.
+    """
+    size = shape[0] * shape[1]
+    flat = getattr(_buffers, name, None)
+    if flat is None or flat.size < size:
+        flat = np.empty(max(size, 1 << 16), np.uint8)
+        setattr(_buffers, name, flat)
+    return flat[:size].reshape(shape)
+
+def ink_bands(thresh, margin):
+    """
+    Row ranges of a binarized strip within margin of its ink.
+
+    Rows further than margin from any ink are blank in the denoised strip
+    as well: every patch the denoiser compares there is blank. Ink rows
+    less than 4 * margin apart share a band, as every band costs the
+    denoiser about that many rows of context.
+
+    Returns:
+        list of tuple: (first row, end row) of every band, top to bottom.
+    """
+    height = thresh.shape[0]
+    rows = np.flatnonzero(np.count_nonzero(thresh, axis=1))
+    if not len(rows):
+        return []
+    starts = np.ones(len(rows), dtype=bool)
+    starts[1:] = np.diff(rows) > 4 * margin
+    first = rows[np.flatnonzero(starts)]
+    last = rows[np.append(np.flatnonzero(starts)[1:] - 1, len(rows) - 1)]
+    return [(max(0, int(a) - margin), min(height, int(b) + margin + 1)) for a, b in zip(first, last)]
+
+def denoise_regions(thresh, h, template_window, search_window, cleaned):
+    """
+    fastNlMeansDenoising of the ink bands of thresh only, into cleaned.
+
+    The denoiser pads its input by search_window // 2 + template_window // 2
+    pixels (BORDER_REFLECT_101) and reads nothing further than that from an
+    output pixel. Each band is therefore cut from the strip padded the same
+    way, with that much context around it, which gives the band exactly the
+    pixels the whole-strip call would have written. Everything outside the
+    bands stays blank. The strip is denoised whole when the bands with
+    their context would not be smaller.
+
+    Returns:
+        int: Number of denoiser calls.
+    """
+    import cv2
+
+    height, width = thresh.shape
+    margin = search_window // 2 + template_window // 2
+    bands = ink_bands(thresh, margin)
+    if sum(end - start + 4 * margin for start, end in bands) * (width + 4 * margin) >= (height + 2 * margin) * (width + 2 * margin):
+        cv2.fastNlMeansDenoising(thresh, cleaned, h, template_window, search_window)
+        return 1
+    cleaned.fill(0)
+    if not bands:
+        return 0
+    padded = cv2.copyMakeBorder(thresh, margin, margin, margin, margin, cv2.BORDER_REFLECT_101,
+                                dst=_buffer("padded", (height + 2 * margin, width + 2 * margin)))
+    for start, end in bands:
+        # Rows start..end of the strip, with margin rows and columns around
+        tile = padded[start:end + 2 * margin]
+        denoised = cv2.fastNlMeansDenoising(tile, _buffer("tile", tile.shape), h, template_window, search_window)
+        cleaned[start:end] = denoised[margin:margin + end - start, margin:margin + width]
+    return len(bands)
+
+def clean_column_regions(cropped_image):
+    """
+    clean_column_full, denoising only the ink-bearing parts of the strip.
+
+    Strips too narrow or too short to hold a MIN_BOX_SIZE box come out
+    blank whatever the denoiser does, so they are not denoised at all;
+    otherwise only the ink bands are (see denoise_regions). The
+    intermediate images live in per-worker buffers.
+    """
+    import cv2
+
+    height, width = cropped_image.shape
+    masked_image = np.full((height, width), 255, np.uint8)
+    if width <= MIN_BOX_SIZE or height <= MIN_BOX_SIZE:
+        instrumentation.count("denoise_skipped_strips")
+        return masked_image
 
-    lines = cv2.HoughLinesP(edges, rho=1, theta=np.pi/180, threshold=100, minLineLength=50, maxLineGap=3)
+    shape = (height, width)
+    thresh = _buffer("thresh", shape)
+    cv2.threshold(cropped_image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=thresh)
+    h, template_window, search_window = PARAMETERS["denoise"]
+    cleaned_image = _buffer("cleaned", shape)
+    with instrumentation.span("denoise", "preprocess", width=width):
+        calls = denoise_regions(thresh, h, template_window, search_window, cleaned_image)
+    instrumentation.count("denoise_tiles", calls)
+    opened_image = _buffer("opened", shape)
+    closed_image = _buffer("closed", shape)
+    cv2.morphologyEx(cleaned_image, cv2.MORPH_OPEN, np.ones(PARAMETERS["open_kernel"], np.uint8), dst=opened_image)
+    cv2.morphologyEx(opened_image, cv2.MORPH_CLOSE, np.ones(PARAMETERS["close_kernel"], np.uint8), dst=closed_image)
+    contours, _ = cv2.findContours(closed_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # The rectangles are filled with 255 only, so the mask needs no threshold
+    mask = _buffer("mask", shape)
+    mask.fill(0)
+    for c in contours:
+        x, y, w, h = cv2.boundingRect(c)
+        if w > MIN_BOX_SIZE and h > MIN_BOX_SIZE:
+            cv2.rectangle(mask, (x, y), (x + w, y + h), 255, -1)
+    # bitwise_not of the masked strip: the inverted strip inside the mask, 255 outside
+    cv2.bitwise_not(cropped_image, dst=masked_image, mask=mask)
+    return masked_image
+
+# Checked against each other page by page by compare_denoise_modes
+DENOISE_MODES = {
+    "full": clean_column_full,
+    "regions": clean_column_regions,
+}
+
+def handle_cropped_image(cropped_image, denoise_mode=None):
+    """
+    Binarize, denoise and mask one column strip.
+
+    Args:
+        cropped_image (numpy.ndarray): Grayscale strip between two rulers.
+        denoise_mode (str): "full" or "regions", defaults to DENOISE_MODE.
+    """
+    return DENOISE_MODES[denoise_mode or DENOISE_MODE](cropped_image)
+
+def find_lines_hough(gray_image):
+    """
+    Column rulers as near-vertical Hough segments.
+
+    Returns:
+        tuple: (line_positions as (x, 0, 0, height), mask of the ruler pixels).
+    """
+    import cv2
+
+    low, high, aperture = PARAMETERS["canny"]
+    edges = cv2.Canny(gray_image, low, high, apertureSize=aperture)
+
+    hough = PARAMETERS["hough"]
+    with instrumentation.span("hough", "preprocess"):
+        lines = cv2.HoughLinesP(edges, rho=1, theta=np.pi/180, threshold=hough["threshold"], minLineLength=hough["min_line_length"], maxLineGap=hough["max_line_gap"])
     line_positions = []
     line_mask = np.zeros_like(edges)
     if lines is not None:
@@ -43,13 +210,143 @@ def process_image(image_path):
             x1, y1, x2, y2 = line[0]
             if abs(x1 - x2) < 3:
                 cv2.line(line_mask, (x1, y1), (x2, y2), 255, 2)
-                line_positions.append((x1, 0, 0, original_image.shape[0]))
+                line_positions.append((x1, 0, 0, gray_image.shape[0]))
     line_positions = sorted(line_positions, key=lambda pos: pos[0])
+    return line_positions, line_mask
+
+def find_lines_projection(gray_image):
+    """
+    Column rulers from the vertical ink projection of long strokes.
+
+    The binarized page is opened with a one pixel wide vertical kernel, which
+    keeps only ink runs at least min_line_length tall (after bridging gaps
+    of up to max_line_gap pixels). Summing what is left per x gives a
+    profile that is non-zero exactly under a ruler; neighbouring x within
+    merge_distance are one ruler, reported once at its centre.
+
+    Returns:
+        tuple: (line_positions as (x, 0, 0, height), mask of the ruler pixels).
+    """
+    import cv2
+
+    projection = PARAMETERS["projection"]
+    _, ink = cv2.threshold(gray_image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if projection["max_line_gap"] > 0:
+        ink = cv2.morphologyEx(ink, cv2.MORPH_CLOSE, np.ones((projection["max_line_gap"] + 1, 1), np.uint8))
+    strokes = cv2.morphologyEx(ink, cv2.MORPH_OPEN, np.ones((projection["min_line_length"], 1), np.uint8))
+    profile = np.count_nonzero(strokes, axis=0)
+
+    columns = np.flatnonzero(profile)
+    line_positions = []
+    if len(columns):
+        starts = np.ones(len(columns), dtype=bool)
+        starts[1:] = np.diff(columns) > projection["merge_distance"]
+        first = np.flatnonzero(starts)
+        last = np.append(first[1:] - 1, len(columns) - 1)
+        centres = (columns[first] + columns[last]) // 2
+        line_positions = [(int(x), 0, 0, gray_image.shape[0]) for x in centres]
+    # Widen the strokes by a pixel, like the thickness 2 lines of the Hough mask
+    line_mask = cv2.dilate(strokes, np.ones((1, 3), np.uint8))
+    return line_positions, line_mask
+
+COLUMN_MODES = {
+    "hough": find_lines_hough,
+    "projection": find_lines_projection,
+}
+
+# JPEG can be decoded straight to 1/2, 1/4 or 1/8 of its size
+# (cv2 flag names; cv2 itself is imported by the functions that use it)
+REDUCED_DECODE_FLAGS = {
+    1: "IMREAD_COLOR",
+    2: "IMREAD_REDUCED_COLOR_2",
+    4: "IMREAD_REDUCED_COLOR_4",
+    8: "IMREAD_REDUCED_COLOR_8",
+}
+
+def target_size(width, height):
+    """(width, height) of a page after downscaling, as cv2.resize takes it."""
+    scale = PARAMETERS["scale"]
+    return (int(width * scale), int(height * scale))
+
+def prepare_gray_image(original_image, dim=None):
+    """
+    Downscale, convert to grayscale and invert light pages.
+
+    Args:
+        original_image (numpy.ndarray): BGR page image.
+        dim (tuple): Target (width, height); defaults to the scaled size of
+                     original_image. Pass it when original_image was decoded
+                     at reduced resolution.
+    """
+    import cv2
+
+    if dim is None:
+        dim = target_size(original_image.shape[1], original_image.shape[0])
+    original_image = cv2.resize(original_image, dim, interpolation=cv2.INTER_AREA)
+    gray_image = cv2.cvtColor(original_image, cv2.COLOR_BGR2GRAY)
+    average_intensity = np.mean(gray_image)
+    if average_intensity > 127:
+        gray_image = cv2.bitwise_not(gray_image)
+    return gray_image
+
+def decode_image_bytes(image_bytes, width, height, reduced=True):
+    """
+    Decode an encoded page image, by default at the smallest size that is
+    still at least its downscaled target size.
+
+    Args:
+        image_bytes (bytes): Encoded image, e.g. from fitz extract_image.
+        width (int): Full width of the image.
+        height (int): Full height of the image.
+        reduced (bool): Decode at reduced resolution where the codec can.
+                        The result is close to, but not pixel-identical
+                        with, downscaling the full-size image.
+
+    Returns:
+        tuple: (BGR image, target (width, height)).
+
+    Raises:
+        ValueError: If the bytes cannot be decoded.
+    """
+    import cv2
+
+    dim = target_size(width, height)
+    factor = 1
+    if reduced:
+        factor = max(f for f in REDUCED_DECODE_FLAGS if -(-width // f) >= dim[0] and -(-height // f) >= dim[1])
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), getattr(cv2, REDUCED_DECODE_FLAGS[factor]))
+    if image is None:
+        raise ValueError("image bytes could not be decoded")
+    return image, dim
+
+def process_image(image_path, column_mode=None, denoise_mode=None):
+    """
+    Args:
+        image_path (str): Page image.
+        column_mode (str): "hough" or "projection", defaults to
+                           PARAMETERS["column_mode"].
+        denoise_mode (str): "full" or "regions", defaults to DENOISE_MODE.
+    """
+    import cv2
+
+    return process_gray_image(prepare_gray_image(cv2.imread(image_path)), column_mode, denoise_mode)
+
+def process_image_bytes(image_bytes, width, height, column_mode=None, reduced=True, denoise_mode=None):
+    """process_image for an encoded image held in memory."""
+    original_image, dim = decode_image_bytes(image_bytes, width, height, reduced)
+    return process_gray_image(prepare_gray_image(original_image, dim), column_mode, denoise_mode)
+
+def process_gray_image(gray_image, column_mode=None, denoise_mode=None):
+    """Split the downscaled page at its rulers and clean every column."""
+    import cv2
+
+    height, width = gray_image.shape
+    line_positions, line_mask = COLUMN_MODES[column_mode or PARAMETERS["column_mode"]](gray_image)
     line_mask = cv2.bitwise_not(line_mask)
     gray_image = cv2.bitwise_and(gray_image, gray_image, mask=line_mask)
     if line_positions:
-        line_positions = [(0, 0, 0, original_image.shape[0])] + line_positions
-        line_positions.append((original_image.shape[1], 0, 0, original_image.shape[0]))
+        line_positions = [(0, 0, 0, height)] + line_positions
+        line_positions.append((width, 0, 0, height))
 
         cropped_images = []
         for i in range(len(line_positions) - 1):
@@ -59,23 +356,259 @@ def process_image(image_path):
             if x1 < x2:
                 cropped = gray_image[:, x1:x2]
                 cropped_images.append(cropped)
-
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
     else:
         cropped_images = [gray_image]
     for i, cropped_image in enumerate(cropped_images):
-        cropped_images[i] = handle_cropped_image(cropped_image)
+        cropped_images[i] = handle_cropped_image(cropped_image, denoise_mode)
 
     final_image = np.hstack(cropped_images)
     return final_image
 
-output_images_dir = "processed_images"
-os.makedirs(output_images_dir, exist_ok=True)
-folder_path = "extracted_images"
-for filename in os.listdir(folder_path):
-    if filename.endswith(".jpeg"):
-        image_path = os.path.join(folder_path, filename)
-        final_image = process_image(image_path)
-        output_image_path = os.path.join(output_images_dir, filename)
-        cv2.imwrite(output_image_path, final_image)
+def _parameters_digest(parameters):
+    return hashlib.sha1(json.dumps(parameters, sort_keys=True).encode('utf-8'))
+
+def page_key(image_path, parameters=PARAMETERS):
+    """SHA-1 of the input bytes and the processing parameters."""
+    digest = _parameters_digest(parameters)
+    with open(image_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def bytes_key(image_bytes, parameters=PARAMETERS):
+    """page_key for an image held in memory."""
+    digest = _parameters_digest(parameters)
+    digest.update(image_bytes)
+    return digest.hexdigest()
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {"pages": {}}
+    with open(manifest_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def save_manifest(manifest, manifest_path):
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def _process_file(image_path, output_image_path, column_mode=None, denoise_mode=None):
+    import cv2
+
+    with instrumentation.span("preprocess_page", "preprocess", image=os.path.basename(image_path)):
+        started = time.perf_counter()
+        final_image = process_image(image_path, column_mode, denoise_mode)
+        processed = time.perf_counter()
+        with instrumentation.span("imwrite", "preprocess"):
+            cv2.imwrite(output_image_path, final_image)
+        written = time.perf_counter()
+    return {"process": processed - started, "write": written - processed, "total": written - started}
+
+def _process_bytes(image_bytes, width, height, output_image_path, column_mode=None, reduced=True, denoise_mode=None):
+    import cv2
+
+    with instrumentation.span("preprocess_page", "preprocess", image=os.path.basename(output_image_path)):
+        started = time.perf_counter()
+        final_image = process_image_bytes(image_bytes, width, height, column_mode, reduced, denoise_mode)
+        processed = time.perf_counter()
+        with instrumentation.span("imwrite", "preprocess"):
+            cv2.imwrite(output_image_path, final_image)
+        written = time.perf_counter()
+    return {"process": processed - started, "write": written - processed, "total": written - started}
+
+def _needs_processing(pages, summary, filename, key, output_image_path, response_dir):
+    """
+    Apply the manifest rules to one page and record skipped pages.
+
+    Returns:
+        bool: True if the page has to be processed.
+    """
+    entry = pages.get(filename, {})
+    response_path = os.path.join(response_dir, os.path.splitext(filename)[0] + ".txt")
+    if entry.get("key", key) == key and os.path.exists(response_path):
+        # OCR is done, the processed image is no longer needed
+        if os.path.exists(output_image_path):
+            os.remove(output_image_path)
+        pages[filename] = dict(entry, key=key, status="ocr_done")
+        summary["ocr_done"].append(filename)
+        return False
+    if entry.get("key") == key and os.path.exists(output_image_path):
+        summary["skipped"].append(filename)
+        return False
+    return True
+
+def _run_pending(pending, manifest, manifest_path, summary, workers=None, max_in_flight=None):
+    """
+    Run (filename, output_image_path, key, function, args) jobs on a process
+    pool, at most max_in_flight at a time, recording each in the manifest.
+
+    pending may be a generator; it is only advanced when there is room for
+    another job, so its items are produced as the pool drains them.
+    """
+    pages = manifest["pages"]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if max_in_flight is None:
+        max_in_flight = 2 * workers
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = {}
+        queue = iter(pending)
+        while True:
+            for filename, output_image_path, key, function, args in queue:
+                future = executor.submit(function, *args)
+                in_flight[future] = (filename, output_image_path, key)
+                if len(in_flight) >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                filename, output_image_path, key = in_flight.pop(future)
+                try:
+                    timings = future.result()
+                except Exception as e:
+                    print(f"Error processing {filename}: {e}")
+                    pages.pop(filename, None)
+                    continue
+                pages[filename] = {"key": key, "output": output_image_path, "status": "processed", "seconds": timings}
+                summary["processed"].append(filename)
+            save_manifest(manifest, manifest_path)
+
+    save_manifest(manifest, manifest_path)
+    return summary
+
+def batch_process(input_dir=INPUT_IMAGES_DIR, output_dir=OUTPUT_IMAGES_DIR, response_dir=RESPONSE_DIR, manifest_path=MANIFEST_PATH, workers=None, max_in_flight=None, column_mode=None, denoise_mode=None):
+    """
+    Preprocess every page image on a process pool, skipping unchanged work.
+
+    The manifest keys every page by the SHA-1 of its input bytes and the
+    processing parameters. A page is skipped when its key is unchanged and
+    its processed image still exists, or when it already has an OCR
+    response for the same input; in that case its processed image is
+    deleted so the OCR client does not upload it again.
+
+    Args:
+        input_dir (str): Extracted page images.
+        output_dir (str): Destination of the processed images.
+        response_dir (str): OCR responses, one .txt per image.
+        manifest_path (str): JSON manifest, updated after every page.
+        workers (int): Process count, None for one per CPU.
+        max_in_flight (int): Pages submitted at once, bounds the memory
+                             held by queued work. Defaults to 2 * workers.
+        column_mode (str): "hough" or "projection", defaults to
+                           PARAMETERS["column_mode"].
+        denoise_mode (str): "full" or "regions", defaults to DENOISE_MODE.
+
+    Returns:
+        dict: {"processed": [...], "skipped": [...], "ocr_done": [...]}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(manifest_path)
+    pages = manifest.setdefault("pages", {})
+    parameters = dict(PARAMETERS, column_mode=column_mode or PARAMETERS["column_mode"])
+    manifest["parameters"] = parameters
+    summary = {"processed": [], "skipped": [], "ocr_done": []}
+
+    pending = []
+    for filename in sorted(os.listdir(input_dir)):
+        if not filename.endswith(".jpeg"):
+            continue
+        image_path = os.path.join(input_dir, filename)
+        output_image_path = os.path.join(output_dir, filename)
+        key = page_key(image_path, parameters)
+        if _needs_processing(pages, summary, filename, key, output_image_path, response_dir):
+            pending.append((filename, output_image_path, key, _process_file, (image_path, output_image_path, parameters["column_mode"], denoise_mode)))
+
+    return _run_pending(pending, manifest, manifest_path, summary, workers, max_in_flight)
+
+def process_pdf_images(pdf_path, phien_am_pages, output_dir=OUTPUT_IMAGES_DIR, response_dir=RESPONSE_DIR, manifest_path=MANIFEST_PATH, workers=None, max_in_flight=None, column_mode=None, reduced=True, raw_dir=None, scan=None, denoise_mode=None):
+    """
+    Preprocess the page images of a PDF straight from memory.
+
+    Selects the same images as extract_image.extract_images_from_pdf (the
+    image of page N for every phiên âm page N + 1, named the same way), but
+    hands the encoded bytes to the workers instead of writing them to disk
+    and reading them back. The workers decode at reduced resolution and
+    write only the processed image. Pages are read from the PDF as the pool
+    drains, so at most max_in_flight images are held in memory. The
+    manifest rules of batch_process apply.
+
+    Args:
+        pdf_path (str): Source PDF.
+        phien_am_pages (list of int): Phiên âm page numbers, as extract_all
+                                      collects them.
+        reduced (bool): Decode at reduced resolution, see decode_image_bytes.
+        raw_dir (str): Also write the raw extracts here, as
+                       extract_images_from_pdf does. None to skip them.
+        scan (dict): pdf_scanner manifest of the PDF. Its image xrefs are
+                     used instead of walking the pages again, and
+                     phien_am_pages is ignored.
+        denoise_mode (str): "full" or "regions", defaults to DENOISE_MODE.
+
+    Returns:
+        dict: {"processed": [...], "skipped": [...], "ocr_done": [...]}.
+    """
+    import fitz
+
+    os.makedirs(output_dir, exist_ok=True)
+    if raw_dir is not None:
+        os.makedirs(raw_dir, exist_ok=True)
+    manifest = load_manifest(manifest_path)
+    pages = manifest.setdefault("pages", {})
+    parameters = dict(PARAMETERS, column_mode=column_mode or PARAMETERS["column_mode"], reduced_decode=reduced)
+    manifest["parameters"] = parameters
+    summary = {"processed": [], "skipped": [], "ocr_done": []}
+    file_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    phien_am_pages = set(phien_am_pages)
+
+    def page_images(pdf_document):
+        if scan is not None:
+            for record in scan["pages"]:
+                yield record["image"]["page"], record["image"]["xref"]
+            return
+        for page_number in range(pdf_document.page_count):
+            if page_number + 1 not in phien_am_pages:
+                continue
+            image_list = pdf_document[page_number].get_images(full=True)
+            if image_list:
+                # Every image of a page is written to the same file name,
+                # so only the last one survives extract_images_from_pdf
+                yield page_number, image_list[-1][0]
+
+    def pending(pdf_document):
+        for page_number, xref in page_images(pdf_document):
+            base_image = pdf_document.extract_image(xref)
+            image_bytes = base_image["image"]
+            filename = f"{file_name}_image_{page_number}.{base_image['ext']}"
+            if raw_dir is not None:
+                with open(os.path.join(raw_dir, filename), "wb") as img_file:
+                    img_file.write(image_bytes)
+            output_image_path = os.path.join(output_dir, filename)
+            key = bytes_key(image_bytes, parameters)
+            if _needs_processing(pages, summary, filename, key, output_image_path, response_dir):
+                args = (image_bytes, base_image["width"], base_image["height"], output_image_path, parameters["column_mode"], reduced, denoise_mode)
+                yield filename, output_image_path, key, _process_bytes, args
+
+    with fitz.open(pdf_path) as pdf_document:
+        return _run_pending(pending(pdf_document), manifest, manifest_path, summary, workers, max_in_flight)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Preprocess page images for OCR.")
+    parser.add_argument("--input-dir", default=INPUT_IMAGES_DIR)
+    parser.add_argument("--output-dir", default=OUTPUT_IMAGES_DIR)
+    parser.add_argument("--response-dir", default=RESPONSE_DIR)
+    parser.add_argument("--manifest", default=MANIFEST_PATH)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-in-flight", type=int, default=None)
+    parser.add_argument("--column-mode", choices=sorted(COLUMN_MODES), default=PARAMETERS["column_mode"])
+    parser.add_argument("--denoise-mode", choices=sorted(DENOISE_MODES), default=DENOISE_MODE)
+    args = parser.parse_args(argv)
+
+    summary = batch_process(args.input_dir, args.output_dir, args.response_dir, args.manifest, args.workers, args.max_in_flight, args.column_mode, args.denoise_mode)
+    print(f"{len(summary['processed'])} processed, {len(summary['skipped'])} unchanged, {len(summary['ocr_done'])} already OCRed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+import instrumentation
+from alignment_store import STORE_PATH, AlignmentStore
+from dictionary_cache import CACHE_PATH, CompiledDictionary, snapshot_path
+from similarity_index import build_index_arrays, index_path_for, load_similarity_index
+
+# Fewer affected columns than this are re-aligned inline; a pool would
+# spend longer loading the dictionaries in every worker
+PARALLEL_MIN_COLUMNS = 256
+COLUMNS_PER_TASK = 64
+
+
+def _pair_codes(dictionary, pair_keys, pair_match, char_ids, reading_ids):
+    """
+    Every matching (char, reading) pair of a dictionary as key * 2 + partial.
+
+    Keys are char_id * len(reading_ids) + reading_id in the shared ID space
+    of changed_pairs, so the codes of two dictionaries can be compared
+    directly.
+    """
+    n_readings = len(dictionary.readings)
+    local_chars, local_readings = np.divmod(np.asarray(pair_keys), n_readings)
+    partial = np.asarray(pair_match) != local_chars
+    char_map = np.array([char_ids[char] for char in dictionary.chars], dtype=np.int64)
+    reading_map = np.array([reading_ids[reading] for reading in dictionary.readings], dtype=np.int64)
+    keys = char_map[local_chars] * len(reading_ids) + reading_map[local_readings]
+    return keys * 2 + partial
+
+
+def changed_pairs(old_dictionary, new_dictionary, new_index=None):
+    """
+    (char, reading) pairs whose cost differs between two dictionaries.
+
+    The cost of a pair only depends on the pair index, so comparing the
+    indexes of both snapshots finds exactly the lookups that can change:
+    pairs that appear, disappear or move between match and partial match.
+
+    Args:
+        old_dictionary (CompiledDictionary): Dictionary the rows were
+                                             aligned with.
+        new_dictionary (CompiledDictionary): Current dictionary.
+        new_index (SimilarityIndex): Index already built over
+                                     new_dictionary, to avoid rebuilding it.
+
+    Returns:
+        list of (str, str): Changed pairs, reading cleaned as in the
+                            dictionary.
+    """
+    chars = sorted(set(old_dictionary.chars) | set(new_dictionary.chars))
+    readings = sorted(set(old_dictionary.readings) | set(new_dictionary.readings))
+    char_ids = {char: index for index, char in enumerate(chars)}
+    reading_ids = {reading: index for index, reading in enumerate(readings)}
+
+    old_arrays = build_index_arrays(old_dictionary)
+    old_codes = _pair_codes(old_dictionary, old_arrays['pair_keys'], old_arrays['pair_match'], char_ids, reading_ids)
+    if new_index is None:
+        new_arrays = build_index_arrays(new_dictionary)
+        new_codes = _pair_codes(new_dictionary, new_arrays['pair_keys'], new_arrays['pair_match'], char_ids, reading_ids)
+    else:
+        new_codes = _pair_codes(new_dictionary, new_index.pair_keys, new_index.pair_match, char_ids, reading_ids)
+    keys = np.unique(np.setxor1d(old_codes, new_codes, assume_unique=True) // 2)
+    char_index, reading_index = np.divmod(keys, len(readings))
+    return [(chars[c], readings[r]) for c, r in zip(char_index.tolist(), reading_index.tolist())]
+
+
+def _load_index(cache_path):
+    # The loader char_align uses, memoized per process and cache
+    return load_similarity_index(index_path_for(cache_path), cache_path=cache_path)
+
+
+def _realign_columns(columns, cache_path=CACHE_PATH):
+    import char_align
+
+    previous = char_align.use_similarity_index(_load_index(cache_path))
+    try:
+        with instrumentation.span("realign_columns", "align", columns=len(columns)):
+            aligned = char_align.align_columns([(sino_nom, sentence) for _, _, sino_nom, sentence in columns])
+    finally:
+        char_align.use_similarity_index(previous)
+    return [(column_id, aligned_result, path) for (column_id, _, _, _), (aligned_result, _, path) in zip(columns, aligned)]
+
+
+def update_store(store_path=STORE_PATH, cache_path=CACHE_PATH, workers=None):
+    """
+    Bring a store up to date with the current dictionaries.
+
+    The store records the compiled dictionary it was aligned with; its
+    snapshot is diffed against the current one (recompiled from the xlsx
+    files if they changed). Only the columns whose OCR characters and
+    syllables meet in a changed pair are aligned again, and only their
+    characters and page counts are rewritten. The current dictionary then
+    becomes the store's record. Without the snapshot file every aligned
+    column is aligned again.
+
+    Args:
+        store_path (str): SQLite store written by char_align.
+        cache_path (str): Compiled dictionary cache the current dictionary
+                          is loaded from, for the diff and re-alignment.
+        workers (int): Process count for large updates, None for one per
+                       CPU, 1 to always run inline.
+
+    Returns:
+        dict: {"pairs", "columns", "pages"}; pairs is None when there
+              was no snapshot to diff against.
+    """
+    store = AlignmentStore(store_path)
+    try:
+        fingerprint = store.dictionary_fingerprint(cache_path)
+        if fingerprint is None:
+            store.record_dictionary(cache_path)
+            return {"pairs": None, "columns": 0, "pages": 0}
+
+        new_index = _load_index(cache_path)
+        new_dictionary = new_index.dictionary
+        if fingerprint['sources'] == new_dictionary.meta['sources']:
+            return {"pairs": 0, "columns": 0, "pages": 0}
+        old_path = snapshot_path(fingerprint['snapshot'], cache_path)
+        if os.path.exists(old_path):
+            pairs = changed_pairs(CompiledDictionary(old_path), new_dictionary, new_index)
+            columns = store.affected_columns(pairs)
+        else:
+            pairs, columns = None, store.aligned_columns()
+
+        if workers == 1 or len(columns) < PARALLEL_MIN_COLUMNS:
+            results = _realign_columns(columns, cache_path)
+        else:
+            chunks = [columns[start:start + COLUMNS_PER_TASK] for start in range(0, len(columns), COLUMNS_PER_TASK)]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = [result for chunk in executor.map(partial(_realign_columns, cache_path=cache_path), chunks) for result in chunk]
+        store.patch_columns(results)
+        store.record_dictionary(cache_path, replace=True)
+        return {"pairs": None if pairs is None else len(pairs), "columns": len(columns), "pages": len({page for _, page, _, _ in columns})}
+    finally:
+        store.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-align only the stored columns a dictionary change affects.")
+    parser.add_argument("--store", default=STORE_PATH)
+    parser.add_argument("--cache", default=CACHE_PATH, help="compiled dictionary cache to update the store to")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--export", default=None, help="also rewrite this xlsx workbook from the store")
+    args = parser.parse_args(argv)
+
+    summary = update_store(args.store, args.cache, workers=args.workers)
+    if summary["pairs"] is None:
+        print(f"No dictionary snapshot to diff against; {summary['columns']} columns re-aligned on {summary['pages']} pages, "
+              "recorded the current dictionary")
+    else:
+        print(f"{summary['pairs']} changed pairs, {summary['columns']} columns re-aligned on {summary['pages']} pages")
+    if args.export:
+        from alignment_store import export_xlsx
+
+        export_xlsx(args.store, args.export)
+
+
+if __name__ == "__main__":
+    main()
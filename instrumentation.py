@@ -0,0 +1,271 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Directory the recorded spans and counters go to. Setting it turns
+# recording on, and child processes inherit it, so pool workers record too
+TRACE_DIR_ENV = "NOM_TRACE_DIR"
+
+# Read by the hot paths before calling in here; everything below is a no-op
+# while it is False
+enabled = False
+_directory = None
+_local = threading.local()
+_file_lock = threading.Lock()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "category", "args", "started")
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        _thread_state()["depth"] += 1
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        ended = time.perf_counter_ns()
+        state = _thread_state()
+        state["events"].append((self.name, self.category, self.started, ended - self.started, self.args))
+        state["depth"] -= 1
+        if state["depth"] == 0:
+            _flush_state(state)
+        return False
+
+
+def _thread_state():
+    state = getattr(_local, "state", None)
+    if state is None:
+        state = _local.state = {"depth": 0, "events": [], "counters": {}}
+    return state
+
+
+def _reset_after_fork():
+    # A forked worker starts with its own buffers, not a copy of the parent's
+    global _local
+    _local = threading.local()
+
+
+def enable(directory):
+    """Record spans and counters into directory, in this process and its children."""
+    global enabled, _directory
+    os.makedirs(directory, exist_ok=True)
+    os.environ[TRACE_DIR_ENV] = directory
+    _directory = directory
+    enabled = True
+
+
+def disable():
+    """Flush what this thread recorded and stop recording."""
+    global enabled, _directory
+    flush()
+    os.environ.pop(TRACE_DIR_ENV, None)
+    enabled = False
+    _directory = None
+
+
+def span(name, category="run", **args):
+    """
+    Context manager timing one step, e.g. span("align_page", "align", page=7).
+
+    Spans nest; a thread's recording is written out whenever its outermost
+    span ends.
+    """
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name, category, args)
+
+
+def count(name, n=1):
+    """Add n to a counter of the current thread."""
+    if not enabled:
+        return
+    counters = _thread_state()["counters"]
+    counters[name] = counters.get(name, 0) + n
+
+
+def flush():
+    """Write out what the current thread recorded so far."""
+    if enabled:
+        _flush_state(_thread_state())
+
+
+def _flush_state(state):
+    if not state["events"] and not state["counters"]:
+        return
+    thread = threading.current_thread()
+    record = {
+        "pid": os.getpid(),
+        "tid": threading.get_native_id(),
+        "thread": thread.name,
+        "events": state["events"],
+        "counters": state["counters"],
+    }
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    state["events"] = []
+    state["counters"] = {}
+    with _file_lock:
+        with open(os.path.join(_directory, f"trace-{os.getpid()}.jsonl"), 'a', encoding='utf-8') as file:
+            file.write(line)
+
+
+def read_records(directory):
+    """Every flushed record of every process, in no particular order."""
+    records = []
+    for path in sorted(glob.glob(os.path.join(directory, "trace-*.jsonl"))):
+        with open(path, 'r', encoding='utf-8') as file:
+            records.extend(json.loads(line) for line in file if line.strip())
+    return records
+
+
+def summarize(records):
+    """
+    Totals of a recording.
+
+    Returns:
+        dict: {"wall_s", "spans": {name: {"count", "total_s", "mean_s",
+              "max_s"}}, "pages": {page: {name: seconds}}, "counters":
+              {name: total}}. Nested spans are each counted in full, so
+              totals of a parent and its children overlap.
+    """
+    spans = {}
+    pages = {}
+    counters = {}
+    first, last = None, None
+    for record in records:
+        for name, total in record["counters"].items():
+            counters[name] = counters.get(name, 0) + total
+        for name, _, started, duration, args in record["events"]:
+            seconds = duration / 1e9
+            totals = spans.setdefault(name, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+            totals["count"] += 1
+            totals["total_s"] += seconds
+            totals["max_s"] = max(totals["max_s"], seconds)
+            if args.get("page") is not None:
+                page = pages.setdefault(str(args["page"]), {})
+                page[name] = page.get(name, 0.0) + seconds
+            first = started if first is None else min(first, started)
+            last = started + duration if last is None else max(last, started + duration)
+    for totals in spans.values():
+        totals["mean_s"] = totals["total_s"] / totals["count"]
+    return {
+        "wall_s": (last - first) / 1e9 if first is not None else 0.0,
+        "spans": dict(sorted(spans.items(), key=lambda item: -item[1]["total_s"])),
+        "pages": dict(sorted(pages.items(), key=lambda item: int(item[0]) if item[0].lstrip('-').isdigit() else item[0])),
+        "counters": dict(sorted(counters.items())),
+    }
+
+
+def chrome_trace(records):
+    """
+    A recording in the Chrome trace event format, for chrome://tracing or
+    Perfetto: one complete event per span, thread names, and the counters
+    of every process at its end.
+    """
+    origin = min((started for record in records for _, _, started, _, _ in record["events"]), default=0)
+    events = []
+    threads = {}
+    process_counters = {}
+    process_end = {}
+    for record in records:
+        pid, tid = record["pid"], record["tid"]
+        threads[(pid, tid)] = record["thread"]
+        for name, category, started, duration, args in record["events"]:
+            events.append({"name": name, "cat": category, "ph": "X", "ts": (started - origin) / 1000, "dur": duration / 1000,
+                           "pid": pid, "tid": tid, "args": args})
+            process_end[pid] = max(process_end.get(pid, 0), started + duration - origin)
+        counters = process_counters.setdefault(pid, {})
+        for name, total in record["counters"].items():
+            counters[name] = counters.get(name, 0) + total
+    for (pid, tid), name in threads.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+    for pid, counters in process_counters.items():
+        if counters:
+            events.append({"name": "counters", "ph": "C", "ts": process_end.get(pid, 0) / 1000, "pid": pid, "args": counters})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def _write_json(data, path, indent=None):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, indent=indent)
+    os.replace(tmp_path, path)
+
+
+def write_report(directory, summary_path=None, trace_path=None):
+    """
+    Write the summary and the Chrome trace of a recording directory.
+
+    Returns:
+        dict: The summary.
+    """
+    records = read_records(directory)
+    summary = summarize(records)
+    if summary_path:
+        _write_json(summary, summary_path, indent=2)
+    if trace_path:
+        _write_json(chrome_trace(records), trace_path)
+    return summary
+
+
+@contextlib.contextmanager
+def profile(summary_path=None, trace_path=None):
+    """
+    Record everything run inside the block, then write its summary and
+    Chrome trace. Processes started inside the block record too, as long
+    as they finish inside it.
+    """
+    directory = tempfile.mkdtemp(prefix="nom-trace-")
+    enable(directory)
+    try:
+        yield
+    finally:
+        disable()
+        write_report(directory, summary_path, trace_path)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+if os.environ.get(TRACE_DIR_ENV):
+    enable(os.environ[TRACE_DIR_ENV])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Turn a recording directory (see NOM_TRACE_DIR) into a summary and a Chrome trace.")
+    parser.add_argument("directory")
+    parser.add_argument("--summary", default="profile.json")
+    parser.add_argument("--trace", default="profile.trace.json", help="Chrome trace event file, for chrome://tracing or Perfetto")
+    args = parser.parse_args(argv)
+
+    summary = write_report(args.directory, args.summary, args.trace)
+    for name, totals in summary["spans"].items():
+        print(f"{name:<20} {totals['count']:>7} x  {totals['total_s']:10.3f} s total  {totals['mean_s'] * 1000:10.3f} ms mean")
+    for name, total in summary["counters"].items():
+        print(f"{name:<20} {total}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import aiohttp
+
+# Same folders as ocr_image.go and image_pre_process
+OUTPUT_IMAGES_DIR = "processed_images"
+RESPONSE_DIR = "response"
+
+BASE_URL = "https://tools.clc.hcmus.edu.vn"
+UPLOAD_PATH = "/api/web/clc-sinonom/image-upload"
+CLASSIFY_PATH = "/api/web/clc-sinonom/image-classification"
+OCR_PATH = "/api/web/clc-sinonom/image-ocr"
+
+LEDGER_PATH = "ocr_ledger.jsonl"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tiff")
+
+# ocr_image.go always forces the first model instead of classifying
+DEFAULT_OCR_ID = 1
+
+CONCURRENCY = 4
+RATE = 2.0  # requests per second, all stages together
+BURST = 4
+
+# (attempts, base delay in seconds) per failure code. "000403" is the
+# upload rejection, "000500" the OCR failure seen in log.txt; "http" covers
+# 5xx/429 statuses and "network" dropped connections and timeouts
+RETRY_POLICY = {
+    "000403": (6, 4.0),
+    "000500": (5, 1.0),
+    "http": (5, 1.0),
+    "network": (5, 0.5),
+}
+MAX_DELAY = 60.0
+
+
+class OCRError(Exception):
+    """A stage of the OCR flow failed; code is the API code or "http"/"network"."""
+
+    def __init__(self, stage, code, message=""):
+        super().__init__(f"{stage} failed with code {code}{': ' + message if message else ''}")
+        self.stage = stage
+        self.code = code
+
+
+class TokenBucket:
+    """Allow rate acquisitions per second on average, with bursts of capacity."""
+
+    def __init__(self, rate=RATE, capacity=BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def retry_delay(code, attempt):
+    """Full-jitter exponential backoff for the attempt-th retry of code."""
+    _, base = RETRY_POLICY.get(code, RETRY_POLICY["http"])
+    return random.uniform(0, min(MAX_DELAY, base * 2 ** (attempt - 1)))
+
+
+def _go_number(value):
+    # encoding/json writes integral float64 values without a fraction
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e21:
+        return int(value)
+    return value
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def ocr_items(ocr_data):
+    """
+    Response items of an OCR result, filtered as saveOCRResults does.
+
+    Args:
+        ocr_data (dict): "data" of the OCR response, with "result_bbox"
+                         entries [points, [text, confidence]] and
+                         "result_ocr_text".
+
+    Returns:
+        list of dict: {"text", "confidence", "points"} items.
+    """
+    items = []
+    texts = ocr_data.get("result_ocr_text") or []
+    for i, bbox_item in enumerate(ocr_data.get("result_bbox") or []):
+        if i >= len(texts):
+            break
+        if len(bbox_item) < 2:
+            continue
+        points = [[_go_number(point[0]), _go_number(point[1])] for point in bbox_item[0]
+                  if isinstance(point, list) and len(point) == 2 and _is_number(point[0]) and _is_number(point[1])]
+        text_info = bbox_item[1]
+        if len(text_info) < 2 or not isinstance(text_info[0], str) or not _is_number(text_info[1]):
+            continue
+        items.append({"text": text_info[0], "confidence": text_info[1], "points": points})
+    return items
+
+
+def format_response(image_name, items):
+    """
+    Content of a response file, byte for byte as ocr_image.go writes it.
+
+    An image without boxes gets an empty list where Go would write null.
+    """
+    content = json.dumps(items, ensure_ascii=False, indent=4)
+    # Go escapes these even inside non-ASCII output
+    for char, escape in (("&", "\\u0026"), ("<", "\\u003c"), (">", "\\u003e"), ("\u2028", "\\u2028"), ("\u2029", "\\u2029")):
+        content = content.replace(char, escape)
+    return f"{image_name} {content}\n"
+
+
+def save_response(image_name, items, response_dir=RESPONSE_DIR):
+    """Write the response file of an image atomically. Returns its path."""
+    path = os.path.join(response_dir, f"{os.path.splitext(image_name)[0]}.txt")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(format_response(image_name, items))
+    os.replace(tmp_path, path)
+    return path
+
+
+class Ledger:
+    """
+    Append-only record of the OCR state of every image.
+
+    Each line is {"image", "status", "attempts", "code", "time"}; the last
+    line of an image wins, so an interrupted run resumes from the file.
+    Statuses are "done" and "failed"; images never recorded are pending.
+    """
+
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash
+                        continue
+                    self.entries[entry["image"]] = entry
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def record(self, image, status, attempts, code=None):
+        entry = {"image": image, "status": status, "attempts": attempts, "code": code, "time": time.time()}
+        self.entries[image] = entry
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def pending(self, images, response_dir=RESPONSE_DIR, retry_failed=True):
+        """Images that still need OCR: not done, or done but without a response file."""
+        result = []
+        for image in images:
+            entry = self.entries.get(image)
+            response_path = os.path.join(response_dir, f"{os.path.splitext(image)[0]}.txt")
+            if entry is not None and entry["status"] == "done" and os.path.exists(response_path):
+                continue
+            if entry is None and os.path.exists(response_path):
+                continue
+            if entry is not None and entry["status"] == "failed" and not retry_failed:
+                continue
+            result.append(image)
+        return result
+
+    def close(self):
+        self.file.close()
+
+
+class OCRClient:
+    """
+    Upload → (classify) → OCR flow of ocr_image.go over one pooled session.
+
+    At most concurrency images are in flight; every HTTP request first takes
+    a token from the shared bucket. A failing stage is retried on its own
+    with the backoff of its code, so an OCR failure does not upload the
+    image again.
+    """
+
+    def __init__(self, session, base_url=BASE_URL, concurrency=CONCURRENCY, rate=RATE, burst=BURST, ocr_id=DEFAULT_OCR_ID, proxy=None):
+        self.session = session
+        self.base_url = base_url.rstrip("/")
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate, burst)
+        self.ocr_id = ocr_id
+        self.proxy = proxy
+        self.stats = {"requests": 0, "retries": {}, "done": 0, "failed": 0}
+
+    async def _post(self, stage, path, **kwargs):
+        await self.bucket.acquire()
+        self.stats["requests"] += 1
+        try:
+            async with self.session.post(self.base_url + path, proxy=self.proxy, **kwargs) as response:
+                if response.status == 429 or response.status >= 500:
+                    raise OCRError(stage, "http", str(response.status))
+                body = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise OCRError(stage, "network", type(e).__name__) from e
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise OCRError(stage, "http", "invalid JSON") from None
+        if not payload.get("is_success"):
+            raise OCRError(stage, payload.get("code") or "unknown")
+        return payload.get("data") or {}
+
+    async def _with_retries(self, stage, make_request):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await make_request(), attempt
+            except OCRError as e:
+                attempts, _ = RETRY_POLICY.get(e.code, (1, 0))
+                if attempt >= attempts:
+                    e.attempts = attempt
+                    raise
+                self.stats["retries"][e.code] = self.stats["retries"].get(e.code, 0) + 1
+                await asyncio.sleep(retry_delay(e.code, attempt))
+
+    async def ocr_image(self, image_path):
+        """
+        OCR one image file.
+
+        Returns:
+            tuple: (items, attempts); items as ocr_items returns them.
+
+        Raises:
+            OCRError: Once a stage has used up its retries.
+        """
+        with open(image_path, 'rb') as file:
+            image_bytes = file.read()
+        image_name = os.path.basename(image_path)
+
+        def upload():
+            form = aiohttp.FormData()
+            form.add_field("image_file", image_bytes, filename=image_name)
+            return self._post("upload", UPLOAD_PATH, data=form)
+
+        data, attempts = await self._with_retries("upload", upload)
+        file_name = data.get("file_name")
+
+        ocr_id = self.ocr_id
+        if ocr_id is None:
+            data, more = await self._with_retries("classification", lambda: self._post("classification", CLASSIFY_PATH, json={"file_name": file_name}))
+            attempts += more
+            ocr_id = data.get("ocr_id")
+
+        data, more = await self._with_retries("OCR", lambda: self._post("OCR", OCR_PATH, json={"file_name": file_name, "ocr_id": str(ocr_id)}))
+        return ocr_items(data), attempts + more
+
+    async def process(self, image_path, ledger, response_dir=RESPONSE_DIR):
+        image_name = os.path.basename(image_path)
+        async with self.semaphore:
+            try:
+                items, attempts = await self.ocr_image(image_path)
+            except OCRError as e:
+                ledger.record(image_name, "failed", getattr(e, "attempts", 1), e.code)
+                self.stats["failed"] += 1
+                return False
+            save_response(image_name, items, response_dir)
+            ledger.record(image_name, "done", attempts)
+            self.stats["done"] += 1
+            return True
+
+
+def list_images(image_dir=OUTPUT_IMAGES_DIR):
+    return sorted(name for name in os.listdir(image_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+async def run_ocr(image_dir=OUTPUT_IMAGES_DIR, response_dir=RESPONSE_DIR, ledger_path=LEDGER_PATH, base_url=BASE_URL, concurrency=CONCURRENCY, rate=RATE, burst=BURST, ocr_id=DEFAULT_OCR_ID, proxy=None, retry_failed=True, timeout=120):
+    """
+    OCR every image of image_dir that the ledger does not mark as done.
+
+    Unlike ocr_image.go the images are kept; the ledger and the response
+    files say what is left to do.
+
+    Returns:
+        dict: Counts of images done and failed, requests, retries per code
+              and the elapsed seconds.
+    """
+    os.makedirs(response_dir, exist_ok=True)
+    ledger = Ledger(ledger_path)
+    images = ledger.pending(list_images(image_dir), response_dir, retry_failed)
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=30)
+    started = time.perf_counter()
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+            client = OCRClient(session, base_url, concurrency, rate, burst, ocr_id, proxy)
+            await asyncio.gather(*(client.process(os.path.join(image_dir, image), ledger, response_dir) for image in images))
+    finally:
+        ledger.close()
+    return dict(client.stats, pending=len(images), seconds=time.perf_counter() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OCR the processed images through the CLC SinoNom API.")
+    parser.add_argument("--image-dir", default=OUTPUT_IMAGES_DIR)
+    parser.add_argument("--response-dir", default=RESPONSE_DIR)
+    parser.add_argument("--ledger", default=LEDGER_PATH)
+    parser.add_argument("--base-url", default=BASE_URL, help="API root, e.g. the URL of ocr_stub_server.py")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=RATE, help="requests per second")
+    parser.add_argument("--burst", type=int, default=BURST)
+    parser.add_argument("--classify", action="store_true", help="classify every image instead of forcing the first OCR model")
+    parser.add_argument("--proxy", default=None, help="HTTP proxy URL")
+    parser.add_argument("--skip-failed", action="store_true", help="do not retry images the ledger marks as failed")
+    args = parser.parse_args(argv)
+
+    summary = asyncio.run(run_ocr(args.image_dir, args.response_dir, args.ledger, args.base_url, args.concurrency, args.rate, args.burst,
+                                  None if args.classify else DEFAULT_OCR_ID, args.proxy, not args.skip_failed))
+    retries = ", ".join(f"{code} {count}" for code, count in sorted(summary["retries"].items())) or "none"
+    print(f"{summary['done']} done, {summary['failed']} failed of {summary['pending']} pending in {summary['seconds']:.1f}s "
+          f"({summary['requests']} requests; retries: {retries})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import os
+import random
+import uuid
+
+from aiohttp import web
+
+from ocr_client import CLASSIFY_PATH, OCR_PATH, RESPONSE_DIR, UPLOAD_PATH
+from response_corpus import parse_response
+
+HOST = "127.0.0.1"
+PORT = 8766
+
+
+def _reply(data=None, code="000000", success=True, message=""):
+    return web.json_response({"is_success": success, "code": code, "message": message, "data": data or {}})
+
+
+class StubOCRServer:
+    """
+    Local stand-in for the CLC SinoNom API.
+
+    OCR results are replayed from recorded response files, looked up by the
+    name of the uploaded image. Failures are injected at the given rates:
+    upload_failure_rate answers uploads with code 000403, ocr_failure_rate
+    answers OCR requests with 000500 and http_error_rate answers any
+    request with a 503. Every stage waits latency seconds on average.
+    """
+
+    def __init__(self, response_dir=RESPONSE_DIR, upload_failure_rate=0.0, ocr_failure_rate=0.0, http_error_rate=0.0, latency=0.0, seed=None):
+        self.response_dir = response_dir
+        self.upload_failure_rate = upload_failure_rate
+        self.ocr_failure_rate = ocr_failure_rate
+        self.http_error_rate = http_error_rate
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.uploads = {}
+        self.counters = {"upload": 0, "classification": 0, "OCR": 0, "000403": 0, "000500": 0, "503": 0}
+
+    def application(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post(UPLOAD_PATH, self.upload)
+        app.router.add_post(CLASSIFY_PATH, self.classify)
+        app.router.add_post(OCR_PATH, self.ocr)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+    async def _enter(self, stage):
+        self.counters[stage] += 1
+        if self.latency:
+            await asyncio.sleep(self.random.expovariate(1 / self.latency))
+        if self.random.random() < self.http_error_rate:
+            self.counters["503"] += 1
+            raise web.HTTPServiceUnavailable()
+
+    async def upload(self, request):
+        await self._enter("upload")
+        image_name = None
+        async for field in await request.multipart():
+            if field.name == "image_file":
+                image_name = field.filename
+                await field.read()
+        if image_name is None:
+            return _reply(code="000400", success=False, message="image_file missing")
+        if self.random.random() < self.upload_failure_rate:
+            self.counters["000403"] += 1
+            return _reply(code="000403", success=False)
+        file_name = f"{uuid.uuid4().hex}_{image_name}"
+        self.uploads[file_name] = image_name
+        return _reply({"file_name": file_name})
+
+    async def classify(self, request):
+        await self._enter("classification")
+        payload = await request.json()
+        if payload.get("file_name") not in self.uploads:
+            return _reply(code="000404", success=False)
+        return _reply({"ocr_id": 1, "ocr_name": "stub"})
+
+    async def ocr(self, request):
+        await self._enter("OCR")
+        payload = await request.json()
+        image_name = self.uploads.get(payload.get("file_name"))
+        if image_name is None:
+            return _reply(code="000404", success=False)
+        if self.random.random() < self.ocr_failure_rate:
+            self.counters["000500"] += 1
+            return _reply(code="000500", success=False)
+
+        items = []
+        response_path = os.path.join(self.response_dir, f"{os.path.splitext(image_name)[0]}.txt")
+        if os.path.exists(response_path):
+            with open(response_path, 'r', encoding='utf-8') as file:
+                _, items = parse_response(file.read())
+        return _reply({
+            "ocr_id": int(payload.get("ocr_id") or 1),
+            "result_file_name": payload["file_name"],
+            "result_ocr_text": [item["text"] for item in items],
+            "result_bbox": [[item["points"], [item["text"], item["confidence"]]] for item in items],
+        })
+
+    async def stats(self, request):
+        return web.json_response(dict(self.counters, uploads=len(self.uploads)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve recorded OCR responses with injected failures, for ocr_client.py.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--response-dir", default=RESPONSE_DIR, help="recorded response files to replay")
+    parser.add_argument("--upload-failure-rate", type=float, default=0.0, help="share of uploads answered with 000403")
+    parser.add_argument("--ocr-failure-rate", type=float, default=0.0, help="share of OCR requests answered with 000500")
+    parser.add_argument("--http-error-rate", type=float, default=0.0, help="share of requests answered with HTTP 503")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean delay of every request")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    server = StubOCRServer(args.response_dir, args.upload_failure_rate, args.ocr_failure_rate, args.http_error_rate, args.latency_ms / 1000, args.seed)
+    web.run_app(server.application(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import json
+import os
+
+import instrumentation
+
+HEADERS = ["ID", "Image Box", "SinoNom OCR", "Chữ Quốc Ngữ"]
+
+
+class XlsxSink:
+    """
+    Alignment rows to an xlsx workbook.
+
+    The workbook runs in constant-memory mode: each row is flushed to disk
+    as soon as the next one starts, so memory stays flat however many pages
+    are written. Rows therefore have to arrive in order. xlsxwriter is
+    only imported when this sink is used.
+    """
+
+    def __init__(self, path):
+        import xlsxwriter
+
+        self.workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+        self.worksheet = self.workbook.add_worksheet("Alignment Output")
+
+        # The four Nom Na Tong formats, created once per workbook; the
+        # status formats are indexed by status code
+        font = {'font_name': "Nom Na Tong", 'font_size': 14}
+        self.status_formats = [self.workbook.add_format(dict(font, color=color)) for color in ('black', 'blue', 'red')]
+        self.false_box_format = self.workbook.add_format(dict(font, color='green'))
+
+        self.worksheet.write_row(0, 0, HEADERS)
+        self.current_row = 1  # Start writing data below the headers
+
+    def write_page(self, rows):
+        with instrumentation.span("xlsx_write", "output", rows=len(rows)):
+            self._write_rows(rows)
+
+    def _write_rows(self, rows):
+        for row in rows:
+            # Format SinoNom OCR output, one fragment per run of a status
+            sino_nom_output = []
+            for code, chars in row.aligned.runs():
+                sino_nom_output.extend([self.status_formats[code], chars])
+
+            worksheet, current_row = self.worksheet, self.current_row
+            worksheet.write(current_row, 0, row.id)
+            # Image boxes in new lines
+            boxes = row.box_points()
+            worksheet.write(current_row, 1, str(boxes) if boxes else "Invalid", self.false_box_format if not boxes else None)
+
+            # A rich string needs at least two fragments
+            if len(sino_nom_output) > 2:
+                worksheet.write_rich_string(current_row, 2, *sino_nom_output)
+            elif sino_nom_output:
+                worksheet.write(current_row, 2, sino_nom_output[1], sino_nom_output[0])
+            else:
+                worksheet.write(current_row, 2, row.sino_nom or "No OCR", self.false_box_format)
+
+            worksheet.write(current_row, 3, row.sentence or "No Sentence")
+            self.current_row += 1
+
+    def close(self):
+        with instrumentation.span("xlsx_close", "output"):
+            self.workbook.close()
+
+
+class JsonlSink:
+    """Alignment rows as JSON lines, flushed after every page."""
+
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write_page(self, rows):
+        for row in rows:
+            record = {
+                "id": row.id,
+                "page": row.page,
+                "boxes": row.box_points(),
+                "sino_nom": row.sino_nom,
+                "chars": list(row.aligned.chars),
+                "statuses": row.aligned.status_names(),
+                "sentence": row.sentence,
+            }
+            self.file.write(json.dumps(record, ensure_ascii=False))
+            self.file.write('\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    """
+    Alignment rows as a Parquet file, one row group per page.
+
+    Needs pyarrow, which is only imported when this sink is used.
+    """
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self.schema = pa.schema([
+            ("id", pa.string()),
+            ("page", pa.int32()),
+            ("boxes", pa.list_(pa.list_(pa.list_(pa.float64())))),
+            ("sino_nom", pa.string()),
+            ("chars", pa.list_(pa.string())),
+            ("statuses", pa.list_(pa.string())),
+            ("sentence", pa.string()),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write_page(self, rows):
+        if not rows:
+            return
+        columns = {
+            "id": [row.id for row in rows],
+            "page": [row.page for row in rows],
+            "boxes": [row.box_points() for row in rows],
+            "sino_nom": [row.sino_nom for row in rows],
+            "chars": [list(row.aligned.chars) for row in rows],
+            "statuses": [row.aligned.status_names() for row in rows],
+            "sentence": [row.sentence for row in rows],
+        }
+        self.writer.write_table(self._pa.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class SqliteSink:
+    """
+    Alignment rows into an alignment_store database, replacing each page
+    written. A new store also records the compiled dictionary in use.
+    """
+
+    def __init__(self, path):
+        from alignment_store import AlignmentStore
+
+        self.store = AlignmentStore(path)
+        self.store.record_dictionary()
+
+    def write_page(self, rows):
+        self.store.write_page(rows)
+
+    def close(self):
+        self.store.close()
+
+
+SINKS = {
+    '.xlsx': XlsxSink,
+    '.jsonl': JsonlSink,
+    '.parquet': ParquetSink,
+    '.sqlite': SqliteSink,
+    '.db': SqliteSink,
+}
+
+
+def open_sink(path):
+    """Create the sink matching the file extension of path."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SINKS:
+        raise ValueError(f"Unsupported output format: {path}")
+    return SINKS[extension](path)
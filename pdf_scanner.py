@@ -0,0 +1,182 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from extract_phien_am import collect_spans
+
+PDF_PATH = "thanh_giao_yeu_ly.pdf"
+SCAN_MANIFEST_PATH = "pdf_manifest.json"
+IMAGE_DIR = "extracted_images"
+
+FORMAT_VERSION = 1
+MIN_LENGTH_THRESHOLD = 100
+PAGES_PER_CHUNK = 64
+
+
+def source_fingerprint(pdf_path):
+    """Size and SHA-1 of the PDF."""
+    digest = hashlib.sha1()
+    with open(pdf_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return {'size': os.path.getsize(pdf_path), 'sha1': digest.hexdigest()}
+
+
+def image_file_name(pdf_path, page_number, image_ext):
+    """Name extract_images_from_pdf gives the image of a page."""
+    file_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    return f"{file_name}_image_{page_number}.{image_ext}"
+
+
+def _scan_range(pdf_path, start, end, image_dir=None, min_length_threshold=MIN_LENGTH_THRESHOLD):
+    """
+    Scan pages [start, end) of a PDF.
+
+    Every page is loaded once. Its image list is kept for the next page,
+    which is all extract_phien_am.is_phien_am_page needs from page N - 1;
+    only the first page of the range has to look back at the page before.
+    The plain text and the text spans come from the same text page.
+
+    Returns:
+        list of dict: One record per phiên âm page.
+    """
+    import fitz
+
+    records = []
+    with fitz.open(pdf_path) as pdf_document:
+        previous_images = pdf_document[start - 1].get_images(full=True) if start > 0 else []
+        for page_number in range(start, end):
+            page = pdf_document[page_number]
+            images = page.get_images(full=True)
+            if page_number > 0 and previous_images:
+                textpage = page.get_textpage(flags=fitz.TEXTFLAGS_TEXT)
+                text = page.get_text(textpage=textpage)
+                text_length = len(''.join(text.split("\n")))
+                if text_length > min_length_threshold:
+                    records.append(_page_record(pdf_document, pdf_path, page, page_number, textpage, text_length, previous_images, image_dir))
+            previous_images = images
+    return records
+
+
+def _page_record(pdf_document, pdf_path, page, page_number, textpage, text_length, previous_images, image_dir):
+    spans = [[*bbox, content] for bbox, content in collect_spans(page.get_text("dict", textpage=textpage))]
+
+    # The image of phiên âm page N is on page N - 1. Every image of a page
+    # is saved under the same name, so the last one is the page image
+    xref = previous_images[-1][0]
+    base_image = pdf_document.extract_image(xref)
+    image_name = image_file_name(pdf_path, page_number - 1, base_image["ext"])
+    if image_dir is not None:
+        with open(os.path.join(image_dir, image_name), "wb") as img_file:
+            img_file.write(base_image["image"])
+
+    return {
+        'page': page_number,
+        'text_length': text_length,
+        'spans': spans,
+        'image': {
+            'name': image_name,
+            'page': page_number - 1,
+            'xref': xref,
+            'ext': base_image["ext"],
+            'width': base_image["width"],
+            'height': base_image["height"],
+            'sha1': hashlib.sha1(base_image["image"]).hexdigest(),
+        },
+    }
+
+
+def _scan_chunk(args):
+    return _scan_range(*args)
+
+
+def load_scan_manifest(manifest_path=SCAN_MANIFEST_PATH):
+    with open(manifest_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def scan_pdf(pdf_path=PDF_PATH, manifest_path=SCAN_MANIFEST_PATH, image_dir=IMAGE_DIR, workers=None, pages_per_chunk=PAGES_PER_CHUNK, min_length_threshold=MIN_LENGTH_THRESHOLD, force=False):
+    """
+    Classify, extract and record every phiên âm page of a PDF in one pass.
+
+    Replaces the is_phien_am_page loop of extract_all plus the second walk
+    of extract_images_from_pdf. Page ranges of pages_per_chunk pages are
+    scanned on a process pool; a PDF of at most one chunk is scanned
+    inline. The manifest lists, for every phiên âm page N, its text spans
+    (as get_phien_am_sentences collects them) and the image of page N - 1.
+    It is reused as is while the PDF and the settings are unchanged.
+
+    Args:
+        pdf_path (str): Source PDF.
+        manifest_path (str): JSON manifest to write.
+        image_dir (str): Where to write the page images, as
+                         extract_images_from_pdf does. None to only record
+                         them.
+        workers (int): Process count, None for one per CPU.
+        pages_per_chunk (int): Pages per worker task.
+        min_length_threshold (int): Same as is_phien_am_page.
+        force (bool): Scan even if the manifest is current.
+
+    Returns:
+        dict: The manifest.
+    """
+    import fitz
+
+    source = source_fingerprint(pdf_path)
+    settings = {'min_length_threshold': min_length_threshold, 'image_dir': image_dir}
+    if not force and os.path.exists(manifest_path):
+        manifest = load_scan_manifest(manifest_path)
+        images_present = image_dir is None or all(
+            os.path.exists(os.path.join(image_dir, record['image']['name'])) for record in manifest.get('pages', []))
+        if manifest.get('version') == FORMAT_VERSION and manifest.get('source') == source and manifest.get('settings') == settings and images_present:
+            return manifest
+
+    if image_dir is not None:
+        os.makedirs(image_dir, exist_ok=True)
+    with fitz.open(pdf_path) as pdf_document:
+        page_count = pdf_document.page_count
+
+    chunks = [(pdf_path, start, min(start + pages_per_chunk, page_count), image_dir, min_length_threshold)
+              for start in range(0, page_count, pages_per_chunk)]
+    if len(chunks) <= 1 or workers == 1:
+        results = [_scan_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_scan_chunk, chunks))
+    records = [record for result in results for record in result]
+
+    manifest = {
+        'version': FORMAT_VERSION,
+        'pdf': pdf_path,
+        'source': source,
+        'settings': settings,
+        'page_count': page_count,
+        'phien_am_pages': [record['page'] for record in records],
+        'pages': records,
+    }
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan a PDF once for phiên âm pages, their text and their images.")
+    parser.add_argument("--pdf", default=PDF_PATH)
+    parser.add_argument("--output", default=SCAN_MANIFEST_PATH)
+    parser.add_argument("--image-dir", default=IMAGE_DIR)
+    parser.add_argument("--no-images", action="store_true", help="record the page images without writing them")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--pages-per-chunk", type=int, default=PAGES_PER_CHUNK)
+    parser.add_argument("--force", action="store_true")
+    args = parser.parse_args(argv)
+
+    manifest = scan_pdf(args.pdf, args.output, None if args.no_images else args.image_dir, args.workers, args.pages_per_chunk, force=args.force)
+    print(f"{len(manifest['phien_am_pages'])} phiên âm pages of {manifest['page_count']}")
+
+
+if __name__ == "__main__":
+    main()
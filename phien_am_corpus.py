@@ -0,0 +1,141 @@
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from array_store import read_array_file, write_array_file
+from extract_phien_am import SPECIAL_PAGES, sentences_from_spans
+from pdf_scanner import SCAN_MANIFEST_PATH, load_scan_manifest
+
+SENTENCES_PATH = "phien_am_sentences.bin"
+
+# Bump when normalize_sentence changes, so every page is redone
+FORMAT_VERSION = 1
+
+
+def page_fingerprint(spans, page_number):
+    """SHA-1 of the spans of a page and whether it is a special page."""
+    digest = hashlib.sha1(json.dumps([page_number in SPECIAL_PAGES, spans], ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def compile_sentences(scan_manifest_path=SCAN_MANIFEST_PATH, sentences_path=SENTENCES_PATH):
+    """
+    Extract the phiên âm sentences of every scanned page into one file.
+
+    The text spans come from the pdf_scanner manifest, so the PDF is not
+    opened. Sentences are stored already split into the syllables
+    med_with_custom_cost aligns against. Pages whose spans did not change
+    since the last compile are copied from the existing file instead of
+    being normalized again.
+
+    Args:
+        scan_manifest_path (str): Manifest written by pdf_scanner.scan_pdf.
+        sentences_path (str): Sentence file to create or update.
+
+    Returns:
+        dict: {"pages", "updated", "reused"}.
+    """
+    scan = load_scan_manifest(scan_manifest_path)
+    previous = PhienAmCorpus(sentences_path) if os.path.exists(sentences_path) else None
+    if previous is not None and previous.meta.get('version') != FORMAT_VERSION:
+        previous = None
+
+    pages, fingerprints, page_tokens = [], {}, []
+    updated = reused = 0
+    for record in scan['pages']:
+        page_number = record['page']
+        fingerprint = page_fingerprint(record['spans'], page_number)
+        if previous is not None and previous.meta['fingerprints'].get(str(page_number)) == fingerprint:
+            tokens = previous.tokens(page_number)
+            reused += 1
+        else:
+            spans = [(span[:4], span[4]) for span in record['spans']]
+            tokens = [sentence.split() for sentence in sentences_from_spans(spans, page_number)]
+            updated += 1
+        pages.append(page_number)
+        fingerprints[str(page_number)] = fingerprint
+        page_tokens.append(tokens)
+
+    sentences = [sentence for tokens in page_tokens for sentence in tokens]
+    encoded = [token.encode('utf-8') for sentence in sentences for token in sentence]
+    token_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    token_offsets[1:] = np.cumsum([len(token) for token in encoded])
+    sentence_offsets = np.zeros(len(sentences) + 1, dtype=np.int64)
+    sentence_offsets[1:] = np.cumsum([len(sentence) for sentence in sentences])
+    page_offsets = np.zeros(len(pages) + 1, dtype=np.int64)
+    page_offsets[1:] = np.cumsum([len(tokens) for tokens in page_tokens])
+
+    arrays = {
+        'text': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'token_offsets': token_offsets,
+        'sentence_offsets': sentence_offsets,
+        'page_offsets': page_offsets,
+    }
+    meta = {
+        'version': FORMAT_VERSION,
+        'pages': pages,
+        'fingerprints': fingerprints,
+    }
+    # Release the old mapping before the file is replaced
+    del previous
+    write_array_file(sentences_path, arrays, meta)
+    return {'pages': len(pages), 'updated': updated, 'reused': reused}
+
+
+class PhienAmCorpus:
+    """
+    Read-only access to compiled phiên âm sentences, by text page number.
+
+    A page is a run of sentences and a sentence a run of syllable tokens;
+    both are offset slices into the mapped arrays.
+    """
+
+    def __init__(self, sentences_path=SENTENCES_PATH):
+        self.meta, arrays = read_array_file(sentences_path)
+        self.pages = self.meta['pages']
+        self.index = {page: k for k, page in enumerate(self.pages)}
+        self.text_buffer = arrays['text']
+        self.token_offsets = arrays['token_offsets']
+        self.sentence_offsets = arrays['sentence_offsets']
+        self.page_offsets = arrays['page_offsets']
+
+    def __contains__(self, page_number):
+        return page_number in self.index
+
+    def __len__(self):
+        return len(self.pages)
+
+    def tokens(self, page_number):
+        """Sentences of a page as lists of syllables."""
+        k = self.index[page_number]
+        first, last = int(self.page_offsets[k]), int(self.page_offsets[k + 1])
+        bounds = self.sentence_offsets[first:last + 1].tolist()
+        if len(bounds) < 2:
+            return []
+        starts = self.token_offsets[bounds[0]:bounds[-1] + 1].tolist()
+        text = bytes(self.text_buffer[starts[0]:starts[-1]])
+        base = starts[0]
+        words = [text[start - base:end - base].decode('utf-8') for start, end in zip(starts, starts[1:])]
+        offset = bounds[0]
+        return [words[start - offset:end - offset] for start, end in zip(bounds, bounds[1:])]
+
+    def sentences(self, page_number):
+        """Sentences of a page, as get_phien_am_sentences returns them."""
+        return [" ".join(tokens) for tokens in self.tokens(page_number)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the phiên âm sentences of a scanned PDF into one file.")
+    parser.add_argument("--scan", default=SCAN_MANIFEST_PATH, help="manifest written by pdf_scanner.py")
+    parser.add_argument("--output", default=SENTENCES_PATH)
+    args = parser.parse_args(argv)
+
+    summary = compile_sentences(args.scan, args.output)
+    print(f"{summary['pages']} pages ({summary['updated']} updated, {summary['reused']} reused)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import instrumentation
+
+STATE_PATH = "pipeline_state.jsonl"
+
+# Items waiting between two stages; a stage that runs ahead blocks
+QUEUE_SIZE = 4
+
+
+def file_digest(path):
+    """SHA-1 of a file, or None if it is missing."""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(*parts):
+    """SHA-1 of JSON-serializable parts."""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class PipelineState:
+    """
+    Input fingerprint of every (stage, item) that last ran successfully.
+
+    Stored as JSON lines appended after each item, the last line winning,
+    so an interrupted run keeps everything finished before it stopped. The
+    file is compacted when it is opened.
+    """
+
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self.fingerprints = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.fingerprints[(entry["stage"], entry["key"])] = entry["fingerprint"]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            for (stage, key), value in self.fingerprints.items():
+                file.write(json.dumps({"stage": stage, "key": key, "fingerprint": value}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+        self.file = open(path, 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+
+    def get(self, stage, key):
+        return self.fingerprints.get((stage, key))
+
+    def record(self, stage, key, value):
+        with self.lock:
+            self.fingerprints[(stage, key)] = value
+            self.file.write(json.dumps({"stage": stage, "key": key, "fingerprint": value}, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class Stage:
+    """
+    One per-item step of a Pipeline.
+
+    Args:
+        name (str): Stage name, used in the state file.
+        run (callable): run(item) does the work; it is called from one of
+                        workers threads, so CPU-bound stages hand it to a
+                        process pool.
+        fingerprint (callable): fingerprint(item) -> str over everything
+                                the step reads. Called once the stage
+                                before has finished the item. None when
+                                the input is gone, e.g. a processed image
+                                removed once OCR'd; the recorded
+                                fingerprint then stands while the outputs
+                                are present.
+        present (callable): present(item) -> bool, whether the outputs
+                            exist. None when there is nothing to check.
+        workers (int): Threads taking items from the stage's queue.
+        adopt_existing (bool): Treat outputs found without a recorded
+                               fingerprint as up to date (for outputs
+                               made before the pipeline existed, like
+                               response files).
+    """
+
+    def __init__(self, name, run, fingerprint, present=None, workers=1, adopt_existing=False):
+        self.name = name
+        self.run = run
+        self.fingerprint = fingerprint
+        self.present = present
+        self.workers = workers
+        self.adopt_existing = adopt_existing
+
+
+class Pipeline:
+    """
+    Stream items through stages, skipping work whose inputs did not change.
+
+    Stages are connected by bounded queues and each runs its own worker
+    threads, so page N can be aligned while page N + 1 is preprocessed.
+    A stage runs an item only when the fingerprint of its inputs differs
+    from the recorded one or its outputs are missing. An item that fails
+    in a stage goes no further in this run.
+    """
+
+    def __init__(self, stages, state_path=STATE_PATH, queue_size=QUEUE_SIZE, verbose=False):
+        self.stages = stages
+        self.state_path = state_path
+        self.queue_size = queue_size
+        self.verbose = verbose
+
+    def _work(self, stage, state, inbox, outbox, summary, lock):
+        while True:
+            item = inbox.get()
+            if item is None:
+                return
+            key = item["key"]
+            try:
+                value = stage.fingerprint(item)
+                present = stage.present is None or stage.present(item)
+                recorded = state.get(stage.name, key)
+                if present and (recorded == value or (recorded is None and stage.adopt_existing) or (value is None and recorded is not None)):
+                    if recorded is None:
+                        state.record(stage.name, key, value)
+                    outcome = "skipped"
+                else:
+                    started = time.perf_counter()
+                    with instrumentation.span(stage.name, "pipeline", key=key, page=item.get("page")):
+                        stage.run(item)
+                    state.record(stage.name, key, value)
+                    outcome = "ran"
+                    if self.verbose:
+                        print(f"{stage.name} {key}: {time.perf_counter() - started:.2f}s")
+            except Exception as e:
+                outcome = "failed"
+                with lock:
+                    summary["errors"].append((stage.name, key, f"{type(e).__name__}: {e}"))
+            with lock:
+                summary[stage.name][outcome] += 1
+            if outcome != "failed" and outbox is not None:
+                outbox.put(item)
+
+    def run(self, items):
+        """
+        Run every item (a dict with a unique "key") through the stages.
+
+        Returns:
+            dict: {stage name: {"ran", "skipped", "failed"}, "errors": [...]}.
+        """
+        state = PipelineState(self.state_path)
+        summary = {stage.name: {"ran": 0, "skipped": 0, "failed": 0} for stage in self.stages}
+        summary["errors"] = []
+        lock = threading.Lock()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+
+        groups = []
+        for k, stage in enumerate(self.stages):
+            outbox = queues[k + 1] if k + 1 < len(self.stages) else None
+            threads = [threading.Thread(target=self._work, args=(stage, state, queues[k], outbox, summary, lock), name=f"{stage.name}-{n}")
+                       for n in range(stage.workers)]
+            for thread in threads:
+                thread.start()
+            groups.append(threads)
+
+        try:
+            for item in items:
+                queues[0].put(item)
+        finally:
+            # Close each stage once the one before it has drained
+            for k, threads in enumerate(groups):
+                for _ in threads:
+                    queues[k].put(None)
+                for thread in threads:
+                    thread.join()
+            state.close()
+        return summary
+
+
+_documents = {}
+
+
+def _preprocess_page(pdf_path, xref, output_image_path, column_mode, reduced, denoise_mode=None):
+    import fitz
+    from image_pre_process import _process_bytes
+
+    if pdf_path not in _documents:
+        _documents[pdf_path] = fitz.open(pdf_path)
+    base_image = _documents[pdf_path].extract_image(xref)
+    return _process_bytes(base_image["image"], base_image["width"], base_image["height"], output_image_path, column_mode, reduced, denoise_mode)
+
+
+def _align_page(box_path, i, sentences_path):
+    import char_align
+
+    return char_align.process_single_box_text(box_path, None, i, None, sentences_path)
+
+
+class _OCRWorker:
+    """An ocr_client.OCRClient on its own event loop, callable from threads."""
+
+    def __init__(self, base_url, concurrency):
+        import ocr_client
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="ocr-loop", daemon=True)
+        self.thread.start()
+
+        async def start():
+            import aiohttp
+
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency))
+            return ocr_client.OCRClient(self.session, base_url, concurrency)
+
+        self.client = asyncio.run_coroutine_threadsafe(start(), self.loop).result()
+
+    def ocr(self, image_path):
+        items, _ = asyncio.run_coroutine_threadsafe(self.client.ocr_image(image_path), self.loop).result()
+        return items
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def book_stages(pdf_path, sentences_path, store, dictionary_sources, preprocess_executor, align_executor, ocr_worker=None,
+                preprocess_workers=2, ocr_workers=4, align_workers=2, output_dir=None, response_dir=None, column_mode=None, reduced=True, denoise_mode=None):
+    """
+    The preprocess → OCR → align stages of one book, per scanned page.
+
+    Items are the pages of the pdf_scanner manifest. Preprocessing reads the
+    image straight from the PDF; OCR goes through ocr_worker, or only
+    accepts existing response files when it is None; alignment writes the
+    rows of the page into store, an AlignmentStore opened for use across
+    threads.
+    """
+    import image_pre_process
+    from phien_am_corpus import PhienAmCorpus
+
+    output_dir = output_dir or image_pre_process.OUTPUT_IMAGES_DIR
+    response_dir = response_dir or image_pre_process.RESPONSE_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(response_dir, exist_ok=True)
+    parameters = dict(image_pre_process.PARAMETERS, column_mode=column_mode or image_pre_process.PARAMETERS["column_mode"], reduced_decode=reduced)
+    parameters_digest = image_pre_process._parameters_digest(parameters).hexdigest()
+
+    def image_path(item):
+        return os.path.join(output_dir, item["image"]["name"])
+
+    def response_path(item):
+        return os.path.join(response_dir, f"{os.path.splitext(item['image']['name'])[0]}.txt")
+
+    def preprocess(item):
+        preprocess_executor.submit(_preprocess_page, pdf_path, item["image"]["xref"], image_path(item), parameters["column_mode"], reduced, denoise_mode).result()
+
+    def ocr(item):
+        if ocr_worker is None:
+            raise RuntimeError("no response file and no OCR service configured")
+        from ocr_client import save_response
+
+        save_response(item["image"]["name"], ocr_worker.ocr(image_path(item)), response_dir)
+
+    sentences = PhienAmCorpus(sentences_path)
+    store_lock = threading.Lock()
+    stored_pages = set(store.pages())
+
+    def align(item):
+        rows = align_executor.submit(_align_page, response_path(item), item["page"], sentences_path).result()
+        with store_lock:
+            store.write_page(rows, item["page"])
+            stored_pages.add(item["page"])
+
+    def align_fingerprint(item):
+        text_page = item["page"] + 1
+        return fingerprint(file_digest(response_path(item)), sentences.tokens(text_page) if text_page in sentences else None, dictionary_sources)
+
+    # The preprocessing manifest removes processed images once they are
+    # OCR'd, so a response file also stands for the image
+    return [
+        Stage("preprocess", preprocess, lambda item: fingerprint(item["image"]["sha1"], parameters_digest),
+              lambda item: os.path.exists(image_path(item)) or os.path.exists(response_path(item)), preprocess_workers, adopt_existing=True),
+        Stage("ocr", ocr, lambda item: file_digest(image_path(item)),
+              lambda item: os.path.exists(response_path(item)), ocr_workers, adopt_existing=True),
+        Stage("align", align, align_fingerprint, lambda item: item["page"] in stored_pages, align_workers),
+    ]
+
+
+def run_book(pdf_path="thanh_giao_yeu_ly.pdf", store_path=None, xlsx_path="output.xlsx", state_path=STATE_PATH, ocr_url=None,
+             preprocess_workers=2, ocr_workers=4, align_workers=2, queue_size=QUEUE_SIZE, column_mode=None, verbose=False, denoise_mode=None):
+    """
+    Bring every output of a book up to date with the least work.
+
+    The whole-book steps are already incremental: the PDF scan is reused
+    while the PDF is unchanged and compile_sentences only redoes changed
+    pages. Pages then stream through book_stages; the workbook is exported
+    from the store when any page was aligned.
+
+    Returns:
+        dict: The Pipeline summary.
+    """
+    from alignment_store import STORE_PATH, AlignmentStore, export_xlsx
+    from dictionary_cache import load_dictionaries
+    from pdf_scanner import scan_pdf
+    from phien_am_corpus import SENTENCES_PATH, compile_sentences
+
+    store_path = store_path or STORE_PATH
+    scan = scan_pdf(pdf_path, image_dir=None)
+    compile_sentences(sentences_path=SENTENCES_PATH)
+    dictionary_sources = load_dictionaries().meta['sources']
+    items = [{"key": str(record["image"]["page"]), "page": record["image"]["page"], "image": record["image"]} for record in scan["pages"]]
+
+    ocr_worker = _OCRWorker(ocr_url, ocr_workers) if ocr_url else None
+    store = AlignmentStore(store_path, check_same_thread=False)
+    try:
+        with ProcessPoolExecutor(max_workers=preprocess_workers) as preprocess_executor, \
+                ProcessPoolExecutor(max_workers=align_workers) as align_executor:
+            stages = book_stages(pdf_path, SENTENCES_PATH, store, dictionary_sources, preprocess_executor, align_executor, ocr_worker,
+                                 preprocess_workers, ocr_workers, align_workers, column_mode=column_mode, denoise_mode=denoise_mode)
+            summary = Pipeline(stages, state_path, queue_size, verbose).run(items)
+    finally:
+        store.close()
+        if ocr_worker is not None:
+            ocr_worker.close()
+
+    if summary["align"]["ran"] or not os.path.exists(xlsx_path):
+        export_xlsx(store_path, xlsx_path)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run PDF scan, preprocessing, OCR and alignment, redoing only out-of-date pages.")
+    parser.add_argument("--pdf", default="thanh_giao_yeu_ly.pdf")
+    parser.add_argument("--store", default=None, help="alignment store (default alignment.sqlite)")
+    parser.add_argument("--output", default="output.xlsx")
+    parser.add_argument("--state", default=STATE_PATH)
+    parser.add_argument("--ocr-url", default=None, help="OCR API root; without it only existing response files are used")
+    parser.add_argument("--preprocess-workers", type=int, default=2)
+    parser.add_argument("--ocr-workers", type=int, default=4)
+    parser.add_argument("--align-workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--column-mode", default=None)
+    parser.add_argument("--denoise-mode", default=None, help="full or regions, see image_pre_process.DENOISE_MODES")
+    parser.add_argument("--verbose", action="store_true", help="print every stage run")
+    args = parser.parse_args(argv)
+
+    summary = run_book(args.pdf, args.store, args.output, args.state, args.ocr_url, args.preprocess_workers, args.ocr_workers,
+                       args.align_workers, args.queue_size, args.column_mode, args.verbose, args.denoise_mode)
+    for stage, counts in summary.items():
+        if stage != "errors":
+            print(f"{stage}: {counts['ran']} ran, {counts['skipped']} up to date, {counts['failed']} failed")
+    for stage, key, error in summary["errors"]:
+        print(f"  {stage} {key}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from array_store import read_array_file, write_array_file
+from box_geometry import BoxList, coordinate_array, points_to_array
+
+RESPONSE_DIR = "response"
+CORPUS_PATH = "response_corpus.bin"
+
+FORMAT_VERSION = 1
+
+# What reading a response file raises when it is not a valid response
+INVALID_RESPONSE_ERRORS = (ValueError, UnicodeDecodeError)
+
+
+def parse_response(content):
+    """
+    Parse the content of an OCR response file.
+
+    A response file holds the image name followed by the JSON list of
+    {"text", "confidence", "points"} items written by ocr_image.go.
+
+    Returns:
+        tuple: (image name, list of items).
+
+    Raises:
+        ValueError: If the content is not a valid response, i.e. not a
+                    list of items with a str text, a numeric confidence
+                    and four [x, y] points.
+    """
+    start_index = content.find('[')
+    if start_index == -1:
+        raise ValueError("no JSON list found")
+    image_name = content[:start_index].strip()
+    items = json.loads(content[start_index:])
+    if not isinstance(items, list):
+        raise ValueError("response is not a list")
+    for item in items:
+        if not _valid_item(item):
+            raise ValueError(f"invalid box {item!r}")
+    return image_name, items
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _valid_item(item):
+    """Whether a response item has a str text, a numeric confidence and four [x, y] points."""
+    if not isinstance(item, dict) or not isinstance(item.get("text"), str) or not _is_number(item.get("confidence")):
+        return False
+    points = item.get("points")
+    return (isinstance(points, list) and len(points) == 4
+            and all(isinstance(point, list) and len(point) == 2 and all(map(_is_number, point)) for point in points))
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def parse_response_file(path):
+    """
+    Read an OCR response file into arrays.
+
+    Returns:
+        tuple: (image name, (n, 4, 2) points, see box_geometry.coordinate_array,
+               confidences, list of texts).
+
+    Raises:
+        ValueError: If the content is not a valid response.
+        UnicodeDecodeError: If the file is not UTF-8.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        image_name, items = parse_response(file.read())
+    points = coordinate_array([item["points"] for item in items])
+    confidences = np.array([item["confidence"] for item in items], dtype=np.float64)
+    texts = [item["text"] for item in items]
+    return image_name, points, confidences, texts
+
+
+def compile_corpus(response_dir=RESPONSE_DIR, corpus_path=CORPUS_PATH):
+    """
+    Compile every response file into one memory-mappable corpus file.
+
+    Files whose size and modification time did not change since the last
+    compile are copied from the existing corpus instead of being parsed
+    again. Files that cannot be parsed are skipped and reported.
+
+    Args:
+        response_dir (str): Directory of response/*.txt files.
+        corpus_path (str): Corpus file to create or update.
+
+    Returns:
+        dict: {"pages", "parsed", "reused", "errors"}; errors maps file
+              names to messages.
+    """
+    previous = ResponseCorpus(corpus_path) if os.path.exists(corpus_path) else None
+    if previous is not None and previous.meta.get('version') != FORMAT_VERSION:
+        previous = None
+
+    names, image_names, fingerprints, errors = [], [], {}, {}
+    points, confidences, texts = [], [], []
+    parsed = reused = 0
+
+    for file_name in sorted(os.listdir(response_dir)):
+        if not file_name.endswith('.txt'):
+            continue
+        path = os.path.join(response_dir, file_name)
+        stem = os.path.splitext(file_name)[0]
+        fingerprint = _fingerprint(path)
+
+        if previous is not None and previous.meta['files'].get(file_name) == fingerprint and stem in previous.index:
+            k = previous.index[stem]
+            start, end = previous.box_offsets[k], previous.box_offsets[k + 1]
+            image_name = previous.image_names[k]
+            page_points = np.array(previous.points[start:end])
+            page_confidences = np.array(previous.confidences[start:end])
+            page_texts = [previous.text(box) for box in range(start, end)]
+            reused += 1
+        else:
+            try:
+                image_name, page_points, page_confidences, page_texts = parse_response_file(path)
+            except INVALID_RESPONSE_ERRORS as e:
+                print(f"Error: {path} is not a valid OCR response: {e}")
+                errors[file_name] = str(e)
+                continue
+            parsed += 1
+
+        names.append(stem)
+        image_names.append(image_name)
+        fingerprints[file_name] = fingerprint
+        points.append(page_points)
+        confidences.append(page_confidences)
+        texts.extend(page_texts)
+
+    box_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    box_offsets[1:] = np.cumsum([len(page) for page in confidences])
+    encoded = [text.encode('utf-8') for text in texts]
+    text_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    text_offsets[1:] = np.cumsum([len(text) for text in encoded])
+
+    # Integer coordinates (what the OCR service returns) are stored as
+    # int32 so boxes read back exactly as they were written
+    points = np.concatenate(points) if points else np.zeros((0, 4, 2), dtype=np.int32)
+    if points.dtype != np.int32 and np.array_equal(points, np.round(points)):
+        points = points.astype(np.int32)
+
+    arrays = {
+        'points': points,
+        'confidences': np.concatenate(confidences) if confidences else np.zeros(0),
+        'text': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'text_offsets': text_offsets,
+        'box_offsets': box_offsets,
+    }
+    meta = {
+        'version': FORMAT_VERSION,
+        'names': names,
+        'image_names': image_names,
+        'files': fingerprints,
+        'errors': errors,
+    }
+    # Release the old mapping before the file is replaced
+    del previous
+    write_array_file(corpus_path, arrays, meta)
+    return {'pages': len(names), 'parsed': parsed, 'reused': reused, 'errors': errors}
+
+
+class ResponseCorpus:
+    """
+    Read-only access to a compiled response corpus.
+
+    Every lookup is an offset slice into the mapped arrays; no JSON is
+    parsed after the corpus is compiled.
+    """
+
+    def __init__(self, corpus_path=CORPUS_PATH):
+        self.meta, arrays = read_array_file(corpus_path)
+        self.names = self.meta['names']
+        self.image_names = self.meta['image_names']
+        self.errors = self.meta['errors']
+        self.index = {name: k for k, name in enumerate(self.names)}
+        self.points = arrays['points']
+        self.confidences = arrays['confidences']
+        self.text_buffer = arrays['text']
+        self.text_offsets = arrays['text_offsets']
+        self.box_offsets = arrays['box_offsets']
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.names)
+
+    def text(self, box):
+        start, end = self.text_offsets[box], self.text_offsets[box + 1]
+        return bytes(self.text_buffer[start:end]).decode('utf-8')
+
+    def box_range(self, name):
+        """(first box, end box) of a response file, by file name without .txt."""
+        k = self.index[name]
+        return int(self.box_offsets[k]), int(self.box_offsets[k + 1])
+
+    def boxes(self, name):
+        """Boxes of one page as [points, [text, confidence]], like result_bbox."""
+        start, end = self.box_range(name)
+        points = self.points[start:end].tolist()
+        confidences = self.confidences[start:end].tolist()
+        return [[points[k], [self.text(start + k), confidences[k]]] for k in range(end - start)]
+
+    def box_list(self, name):
+        """Boxes of one page as a box_geometry.BoxList over the mapped points."""
+        start, end = self.box_range(name)
+        return BoxList.from_texts(self.points[start:end], [self.text(box) for box in range(start, end)], self.confidences[start:end])
+
+    def box_array(self, name):
+        """
+        Boxes of one page as a box_geometry.BOX_DTYPE array.
+
+        Returns:
+            tuple: (BOX_DTYPE array, list of box texts).
+        """
+        start, end = self.box_range(name)
+        boxes = points_to_array(self.points[start:end], self.confidences[start:end])
+        return boxes, [self.text(box) for box in range(start, end)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile OCR response files into one corpus file.")
+    parser.add_argument("--response-dir", default=RESPONSE_DIR)
+    parser.add_argument("--output", default=CORPUS_PATH)
+    args = parser.parse_args(argv)
+
+    summary = compile_corpus(args.response_dir, args.output)
+    print(f"{summary['pages']} pages ({summary['parsed']} parsed, {summary['reused']} reused), {len(summary['errors'])} errors")
+
+
+if __name__ == "__main__":
+    main()
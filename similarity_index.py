@@ -0,0 +1,249 @@
+import os
+import re
+
+import numpy as np
+
+import instrumentation
+from array_store import read_array_file, read_array_header, write_array_file
+from dictionary_cache import CACHE_PATH, QUOC_NGU_DIC_PATH, SIMILAR_DIC_PATH, load_dictionaries
+
+INDEX_PATH = "similarity_index.bin"
+
+FORMAT_VERSION = 1
+
+# Substitution costs, same values compute_cost has always returned
+MATCH_COST = 0
+PARTIAL_MATCH_COST = 0.5
+NO_MATCH_COST = 2
+
+_PUNCTUATION = re.compile(r'[.,;:!?”“"]')
+
+_loaded = {}
+
+
+def clean_word(quoc_ngu_word):
+    """Normalize a Quốc Ngữ syllable the way the dictionary keys are written."""
+    return _PUNCTUATION.sub('', quoc_ngu_word).lower()
+
+
+def build_index_arrays(dictionary):
+    """
+    Build the (character, reading) inverted index from a compiled dictionary.
+
+    Every pair a character can match is encoded as the integer key
+    char_id * len(readings) + reading_id. Pairs are kept sorted by key, so
+    the readings of one character form a contiguous run. For each key the
+    representative matched character is stored: the character itself for an
+    exact match, otherwise the first character of its similar list (in
+    spreadsheet order) that is written with the reading.
+
+    Returns:
+        dict: 'pair_keys' (int64, sorted) and 'pair_match' (int32 char IDs).
+    """
+    n_chars = len(dictionary.chars)
+    n_readings = len(dictionary.readings)
+
+    # Exact pairs, straight from the reading -> SinoNom CSR
+    exact_char = np.asarray(dictionary.reading_indices, dtype=np.int64)
+    exact_reading = np.repeat(np.arange(n_readings, dtype=np.int64), np.diff(dictionary.reading_indptr))
+    exact_keys = exact_char * n_readings + exact_reading
+
+    # Same pairs grouped by character
+    order = np.argsort(exact_char, kind='stable')
+    readings_by_char = exact_reading[order]
+    reading_counts = np.bincount(exact_char, minlength=n_chars)
+    reading_starts = np.concatenate(([0], np.cumsum(reading_counts)[:-1]))
+
+    # Expand every (character, similar character) entry to the readings of
+    # the similar character, remembering its position in the similar list
+    similar_indptr = np.asarray(dictionary.similar_indptr, dtype=np.int64)
+    similar_char = np.asarray(dictionary.similar_indices, dtype=np.int64)
+    similar_counts = np.diff(similar_indptr)
+    owner = np.repeat(np.arange(n_chars, dtype=np.int64), similar_counts)
+    position = np.arange(len(similar_char)) - np.repeat(similar_indptr[:-1], similar_counts)
+
+    fanout = reading_counts[similar_char]
+    total = int(fanout.sum())
+    offsets = np.arange(total) - np.repeat(np.cumsum(fanout) - fanout, fanout)
+    partial_keys = np.repeat(owner, fanout) * n_readings + readings_by_char[np.repeat(reading_starts[similar_char], fanout) + offsets]
+    partial_match = np.repeat(similar_char, fanout)
+    partial_position = np.repeat(position, fanout)
+
+    # Keep the first similar character per pair, and only pairs that are not
+    # already exact matches
+    order = np.lexsort((partial_position, partial_keys))
+    partial_keys, partial_match = partial_keys[order], partial_match[order]
+    first = np.ones(len(partial_keys), dtype=bool)
+    first[1:] = partial_keys[1:] != partial_keys[:-1]
+    keep = first & ~np.isin(partial_keys, exact_keys)
+
+    pair_keys = np.concatenate((exact_keys, partial_keys[keep]))
+    pair_match = np.concatenate((exact_char, partial_match[keep]))
+    order = np.argsort(pair_keys, kind='stable')
+    return {
+        'pair_keys': pair_keys[order],
+        'pair_match': pair_match[order].astype(np.int32),
+    }
+
+
+def index_path_for(cache_path=CACHE_PATH):
+    """Index file of a compiled dictionary cache; INDEX_PATH for the default cache."""
+    if os.path.abspath(cache_path) == os.path.abspath(CACHE_PATH):
+        return INDEX_PATH
+    return f"{os.path.splitext(cache_path)[0]}.index.bin"
+
+
+def load_similarity_index(index_path=INDEX_PATH, quoc_ngu_path=QUOC_NGU_DIC_PATH, similar_path=SIMILAR_DIC_PATH, cache_path=CACHE_PATH):
+    """
+    Load the similarity index, rebuilding it when the dictionaries changed.
+
+    The index file records the source fingerprints of the dictionary it was
+    built from. The result is memoized per process.
+
+    Returns:
+        SimilarityIndex: Index over the current dictionaries.
+    """
+    key = (os.path.abspath(index_path), os.path.abspath(cache_path))
+    if key not in _loaded:
+        dictionary = load_dictionaries(quoc_ngu_path, similar_path, cache_path)
+        meta = {'version': FORMAT_VERSION, 'sources': dictionary.meta['sources']}
+        try:
+            fresh = read_array_header(index_path)['meta'] == meta
+        except (OSError, ValueError):
+            fresh = False
+        if not fresh:
+            with instrumentation.span("build_similarity_index", "dictionary"):
+                write_array_file(index_path, build_index_arrays(dictionary), meta)
+        _, arrays = read_array_file(index_path)
+        _loaded[key] = SimilarityIndex(dictionary, arrays['pair_keys'], arrays['pair_match'])
+    return _loaded[key]
+
+
+class SimilarityIndex:
+    """
+    Decide match, partial match or no match for (OCR character, syllable).
+
+    Characters and cleaned syllables are interned to the dictionary IDs, and
+    each decision is a single probe into the sorted pair keys. Results are
+    memoized; the counters in stats show how well the memo works.
+    """
+
+    def __init__(self, dictionary, pair_keys, pair_match):
+        self.dictionary = dictionary
+        self.pair_keys = pair_keys
+        self.pair_match = pair_match
+        self.n_readings = len(dictionary.readings)
+        self._memo = {}
+        self._word_ids = {}
+        self.stats = {
+            'lookups': 0,
+            'memo_hits': 0,
+            'probes': 0,
+            'word_cache_hits': 0,
+            'word_cache_misses': 0,
+            'matrix_pairs': 0,
+        }
+
+    def char_id(self, char):
+        return self.dictionary.char_ids.get(char, -1)
+
+    def reading_id(self, quoc_ngu_word):
+        """ID of the cleaned syllable, or -1 if the dictionary lacks it."""
+        reading = self._word_ids.get(quoc_ngu_word)
+        if reading is None:
+            self.stats['word_cache_misses'] += 1
+            reading = self.dictionary.reading_ids.get(clean_word(quoc_ngu_word), -1)
+            self._word_ids[quoc_ngu_word] = reading
+        else:
+            self.stats['word_cache_hits'] += 1
+        return reading
+
+    def probe(self, char_id, reading_id):
+        """
+        Look up interned IDs.
+
+        Returns:
+            tuple: (cost, matched char ID or -1).
+        """
+        self.stats['probes'] += 1
+        if char_id < 0 or reading_id < 0:
+            return NO_MATCH_COST, -1
+        key = char_id * self.n_readings + reading_id
+        position = int(np.searchsorted(self.pair_keys, key))
+        if position < len(self.pair_keys) and self.pair_keys[position] == key:
+            matched = int(self.pair_match[position])
+            return (MATCH_COST if matched == char_id else PARTIAL_MATCH_COST), matched
+        return NO_MATCH_COST, -1
+
+    def lookup(self, ocr_char, quoc_ngu_word):
+        """
+        Same contract as char_align.compute_cost.
+
+        Returns:
+            tuple: (cost, matched SinoNom character or None).
+        """
+        self.stats['lookups'] += 1
+        result = self._memo.get((ocr_char, quoc_ngu_word))
+        if result is not None:
+            self.stats['memo_hits'] += 1
+            return result
+        cost, matched = self.probe(self.char_id(ocr_char), self.reading_id(quoc_ngu_word))
+        result = (cost, self.dictionary.chars[matched] if matched >= 0 else None)
+        self._memo[(ocr_char, quoc_ngu_word)] = result
+        return result
+
+    def cost_matrix(self, chars, words):
+        """
+        Costs for every (char, word) combination in one vectorized probe.
+
+        Args:
+            chars (list of str): OCR characters.
+            words (list of str): Quốc Ngữ syllables.
+
+        Returns:
+            numpy.ndarray: (len(chars), len(words)) cost matrix.
+        """
+        char_ids = np.array([self.char_id(char) for char in chars], dtype=np.int64)
+        reading_ids = np.array([self.reading_id(word) for word in words], dtype=np.int64)
+        self.stats['matrix_pairs'] += len(char_ids) * len(reading_ids)
+        return self.pair_costs(char_ids[:, None], reading_ids[None, :])
+
+    def pair_costs(self, char_ids, reading_ids):
+        """
+        Costs of interned (char ID, reading ID) pairs, broadcast elementwise.
+
+        Returns:
+            numpy.ndarray: Costs, in the broadcast shape of the IDs.
+        """
+        char_ids, reading_ids = np.broadcast_arrays(np.asarray(char_ids, dtype=np.int64), np.asarray(reading_ids, dtype=np.int64))
+        keys = char_ids * self.n_readings + reading_ids
+        positions = np.searchsorted(self.pair_keys, keys)
+        positions = np.minimum(positions, len(self.pair_keys) - 1)
+        found = (self.pair_keys[positions] == keys) & (char_ids >= 0) & (reading_ids >= 0)
+
+        cost = np.full(keys.shape, float(NO_MATCH_COST))
+        exact = self.pair_match[positions] == char_ids
+        cost[found & exact] = MATCH_COST
+        cost[found & ~exact] = PARTIAL_MATCH_COST
+        return cost
+
+    def readings_for(self, char):
+        """
+        All readings a character matches, exactly or through a similar one.
+
+        Returns:
+            dict: reading -> (cost, matched SinoNom character).
+        """
+        char_id = self.char_id(char)
+        if char_id < 0:
+            return {}
+        start, end = np.searchsorted(self.pair_keys, [char_id * self.n_readings, (char_id + 1) * self.n_readings])
+        result = {}
+        for key, matched in zip(self.pair_keys[start:end].tolist(), self.pair_match[start:end].tolist()):
+            cost = MATCH_COST if matched == char_id else PARTIAL_MATCH_COST
+            result[self.dictionary.readings[key - char_id * self.n_readings]] = (cost, self.dictionary.chars[matched])
+        return result
+
+    def memo_stats(self):
+        """Counters plus current memo sizes."""
+        return dict(self.stats, memo_size=len(self._memo), word_cache_size=len(self._word_ids))